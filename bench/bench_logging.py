@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2015 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+# Cost of debug logging when it is disabled: eager log arguments
+# (before) compared to isEnabledFor() guards and lazy %r formatting
+# (after), and the pan.xapi and pan.wfapi response paths with debug
+# logging disabled and enabled.
+#
+# $ ./bench_logging.py               # 4MB body, 100 iterations
+# $ ./bench_logging.py -s 16 -n 20
+
+from __future__ import print_function
+import sys
+import os
+import getopt
+import time
+import logging
+
+libpath = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(libpath, os.pardir, 'lib')]
+from pan import DEBUG1, DEBUG2, DEBUG3
+import pan.xapi
+import pan.wfapi
+
+
+def main():
+    options = parse_opts()
+
+    n = options['n']
+    body = response_body(options['size'])
+    logger = logging.getLogger('pan.bench')
+    log = logger.log
+
+    print('log arguments, debug disabled, %d bytes, %d calls:' %
+          (len(body), n))
+
+    def eager_decode():
+        log(DEBUG3, 'decode(): %s', type(body.decode('utf-8')))
+
+    def guarded_decode():
+        if logger.isEnabledFor(DEBUG3):
+            log(DEBUG3, 'decode(): %s', type(body.decode('utf-8')))
+
+    def eager_repr():
+        log(DEBUG2, 'body: %s', repr(body))
+
+    def lazy_repr():
+        log(DEBUG2, 'body: %r', body)
+
+    print_result('type(body.decode()) argument (before)',
+                 bench(n, eager_decode), n)
+    print_result('isEnabledFor() guard (after)',
+                 bench(n, guarded_decode), n)
+    print_result('repr(body) argument (before)',
+                 bench(n, eager_repr), n)
+    print_result('lazy %r (after)',
+                 bench(n, lazy_repr), n)
+
+    xapi = pan.xapi.PanXapi(hostname='localhost', api_key='x')
+    xapi._PanXapi__set_xml_response(body)
+    xapi.element_root
+
+    wfapi = pan.wfapi.PanWFapi(hostname='localhost', api_key='x')
+
+    def xml_result():
+        xapi.xml_result()
+
+    def wf_response():
+        wfapi._PanWFapi__set_xml_response(body)
+
+    for level, name in [(logging.WARNING, 'debug disabled'),
+                        (DEBUG3, 'debug enabled')]:
+        set_level(level)
+        print('pan.xapi and pan.wfapi, %s, %d calls:' % (name, n))
+        print_result('PanXapi.xml_result()', bench(n, xml_result), n)
+        print_result('PanWFapi response', bench(n, wf_response), n)
+    set_level(logging.WARNING)
+
+
+def set_level(level):
+    for name in ['pan.xapi', 'pan.wfapi']:
+        logger = logging.getLogger(name)
+        logger.setLevel(level)
+        if not logger.handlers:
+            # measure formatting, not output
+            logger.addHandler(NullFormatHandler())
+        logger.propagate = False
+
+
+class NullFormatHandler(logging.Handler):
+    def emit(self, record):
+        self.format(record)
+
+
+def response_body(size):
+    entry = (b'<entry name="address-%07d"><ip-netmask>192.0.2.1/32'
+             b'</ip-netmask></entry>')
+    n = max(size * 1024 * 1024 // len(entry % 0), 1)
+    return (b'<response status="success"><result><address>' +
+            b''.join([entry % i for i in range(n)]) +
+            b'</address></result></response>')
+
+
+def bench(n, func):
+    start = time.time()
+    for i in range(n):
+        func()
+    return time.time() - start
+
+
+def print_result(name, elapsed, n):
+    print('  %-42s %12.1f usec/call' % (name, elapsed / n * 1000000))
+
+
+def parse_opts():
+    options = {
+        'n': 100,
+        'size': 4,
+        }
+
+    short_options = 'n:s:'
+    long_options = ['help']
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:],
+                                   short_options,
+                                   long_options)
+    except getopt.GetoptError as error:
+        print(error, file=sys.stderr)
+        sys.exit(1)
+
+    for opt, arg in opts:
+        if opt == '-n':
+            options['n'] = int(arg)
+        elif opt == '-s':
+            options['size'] = int(arg)
+        elif opt == '--help':
+            usage()
+            sys.exit(0)
+        else:
+            assert False, 'unhandled option %s' % opt
+
+    return options
+
+
+def usage():
+    usage = '''%s [options]
+    -n num                iterations (default 100)
+    -s MB                 response body size (default 4)
+    --help                display usage
+'''
+    print(usage % os.path.basename(sys.argv[0]), end='')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2015 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+# Time and peak memory of client-side response processing: pan.xapi
+# response parsing, status message and xml_root()/xml_result(),
+# pan.config python(), flat() and set_cli(), and pan.wfapi report
+# parsing, using synthetic configurations (address objects and
+# security rules), log query responses and WildFire reports.  Peak
+# memory is measured with tracemalloc (3.4+) in a separate run.
+#
+# $ ./bench_parse.py                        # 10000 objects and rules
+# $ ./bench_parse.py -s 10000,100000 -n 3
+# $ ./bench_parse.py --json results.json    # machine-readable results
+# $ ./bench_parse.py -o 'config\.'          # matching benchmarks only
+
+from __future__ import print_function
+import sys
+import os
+import getopt
+import time
+import platform
+import json
+import re
+import gc
+try:
+    import tracemalloc
+except ImportError:
+    # 2.7
+    tracemalloc = None
+
+libpath = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(libpath, os.pardir, 'lib')]
+from pan import __version__
+import pan.xapi
+import pan.wfapi
+import pan.config
+
+
+def main():
+    options = parse_opts()
+
+    n = options['n']
+    results = []
+
+    for size in options['sizes']:
+        body = config_response(size)
+        print('config, %d address objects and rules, %d bytes, '
+              '%d iterations:' % (size, len(body), n))
+        for name, setup, func in xapi_benchmarks(body) + \
+                config_benchmarks(body):
+            run(options, results, name, size, len(body), setup, func)
+
+    size = options['logs']
+    body = log_response(size)
+    print('log, %d entries, %d bytes, %d iterations:' %
+          (size, len(body), n))
+    for name, setup, func in xapi_benchmarks(body, entries=True):
+        run(options, results, name, size, len(body), setup, func)
+
+    size = options['events']
+    body = wildfire_report(size)
+    print('wildfire report, %d events, %d bytes, %d iterations:' %
+          (size, len(body), n))
+    for name, setup, func in wfapi_benchmarks(body):
+        run(options, results, name, size, len(body), setup, func)
+
+    if options['json'] is not None:
+        write_json(options, results)
+
+
+def xapi_benchmarks(body, entries=False):
+    def new():
+        return pan.xapi.PanXapi(hostname='localhost', api_key='x')
+
+    def response():
+        xapi = new()
+        xapi._PanXapi__set_xml_response(body)
+        return xapi
+
+    def tree():
+        xapi = response()
+        xapi.element_root
+        return xapi
+
+    x = [
+        ('xapi.set_xml_response', new,
+         lambda xapi: xapi._PanXapi__set_xml_response(body)),
+        ('xapi.element_root', response,
+         lambda xapi: xapi.element_root),
+        ('xapi.get_response_msg', tree,
+         lambda xapi: xapi._PanXapi__get_response_msg()),
+        ('xapi.xml_root', response,
+         lambda xapi: xapi.xml_root()),
+        ('xapi.xml_result', tree,
+         lambda xapi: xapi.xml_result()),
+        ]
+    if entries:
+        x.append(('xapi.log_entries', tree,
+                  lambda xapi: xapi._log_entries()))
+
+    return x
+
+
+def config_benchmarks(body):
+    # serialization does not modify the tree, which is parsed once
+    xapi = pan.xapi.PanXapi(hostname='localhost', api_key='x')
+    xapi._PanXapi__set_xml_response(body)
+    conf = pan.config.PanConfig(config=xapi.element_result[0])
+
+    def config():
+        return conf
+
+    return [
+        ('config.python', config,
+         lambda conf: conf.python()),
+        ('config.flat', config,
+         lambda conf: conf.flat('./')),
+        ('config.set_cli', config,
+         lambda conf: conf.set_cli('set ', member_list=True)),
+        ]
+
+
+def wfapi_benchmarks(body):
+    def new():
+        return pan.wfapi.PanWFapi(hostname='localhost', api_key='x')
+
+    def report():
+        wfapi = new()
+        wfapi._PanWFapi__set_xml_response(body)
+        return wfapi
+
+    conf = pan.config.PanConfig(config=report().xml_element_root,
+                                tags_forcelist=set(['entry']))
+
+    def config():
+        return conf
+
+    return [
+        ('wfapi.set_xml_response', new,
+         lambda wfapi: wfapi._PanWFapi__set_xml_response(body)),
+        ('wfapi.xml_root', report,
+         lambda wfapi: wfapi.xml_root()),
+        ('wfapi.config.python', config,
+         lambda conf: conf.python()),
+        ]
+
+
+def run(options, results, name, size, nbytes, setup, func):
+    if options['only'] is not None and \
+            not re.search(options['only'], name):
+        return
+
+    times = bench(options['n'], setup, func)
+    peak = peak_memory(setup, func) if options['memory'] else None
+    print_result(name, times, peak)
+    results.append({
+        'name': name,
+        'size': size,
+        'bytes': nbytes,
+        'n': len(times),
+        'min': min(times),
+        'mean': sum(times) / len(times),
+        'peak': peak,
+        })
+
+
+def bench(n, setup, func):
+    # setup is not timed
+    times = []
+    for i in range(n):
+        x = setup()
+        gc.collect()
+        start = time.time()
+        func(x)
+        times.append(time.time() - start)
+        del x
+
+    return times
+
+
+def peak_memory(setup, func):
+    # peak bytes allocated by func, including its result
+    if tracemalloc is None:
+        return None
+    x = setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func(x)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def print_result(name, times, peak):
+    x = '  %-26s %10.2f msec min %10.2f msec mean' % \
+        (name, min(times) * 1000, sum(times) / len(times) * 1000)
+    if peak is not None:
+        x += ' %10.1f MB peak' % (peak / (1024.0 * 1024))
+    print(x)
+
+
+def write_json(options, results):
+    x = {
+        'pan-python': __version__,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'time': time.time(),
+        'results': results,
+        }
+    s = json.dumps(x, sort_keys=True, indent=1)
+    if options['json'] == '-':
+        print(s)
+    else:
+        with open(options['json'], 'w') as f:
+            f.write(s + '\n')
+
+
+# synthetic responses
+
+def config_response(size):
+    # show config response with size address objects and security
+    # rules
+    address = (b'<entry name="host-%d"><ip-netmask>10.%d.%d.%d/32'
+               b'</ip-netmask><description>synthetic host %d'
+               b'</description><tag><member>bench</member></tag></entry>')
+    rule = (b'<entry name="rule-%d" uuid="00000000-0000-4000-8000-%012d">'
+            b'<from><member>trust</member></from>'
+            b'<to><member>untrust</member></to>'
+            b'<source><member>host-%d</member></source>'
+            b'<destination><member>any</member></destination>'
+            b'<source-user><member>any</member></source-user>'
+            b'<category><member>any</member></category>'
+            b'<application><member>ssl</member>'
+            b'<member>web-browsing</member></application>'
+            b'<service><member>application-default</member></service>'
+            b'<hip-profiles><member>any</member></hip-profiles>'
+            b'<action>allow</action><log-end>yes</log-end>'
+            b'<profile-setting><group><member>default</member></group>'
+            b'</profile-setting></entry>')
+
+    x = [b'<response status="success"><result>'
+         b'<config version="10.1.0" urldb="paloaltonetworks">'
+         b'<devices><entry name="localhost.localdomain">'
+         b'<vsys><entry name="vsys1"><address>']
+    x.extend([address % (i, i >> 16 & 255, i >> 8 & 255, i & 255, i)
+              for i in range(size)])
+    x.append(b'</address><rulebase><security><rules>')
+    x.extend([rule % (i, i, i) for i in range(size)])
+    x.append(b'</rules></security></rulebase></entry></vsys>'
+             b'</entry></devices></config></result></response>')
+
+    return b''.join(x)
+
+
+def log_response(size):
+    # type=log&action=get response with size traffic log entries
+    entry = (b'<entry logid="%d"><domain>1</domain>'
+             b'<receive_time>2015/01/01 00:%02d:%02d</receive_time>'
+             b'<serial>001606000000</serial><seqno>%d</seqno>'
+             b'<type>TRAFFIC</type><subtype>end</subtype>'
+             b'<src>10.%d.%d.%d</src><dst>192.0.2.%d</dst>'
+             b'<rule>rule-%d</rule><srcuser>example\\user%d</srcuser>'
+             b'<app>ssl</app><vsys>vsys1</vsys><from>trust</from>'
+             b'<to>untrust</to><sport>%d</sport><dport>443</dport>'
+             b'<proto>tcp</proto><action>allow</action>'
+             b'<bytes>%d</bytes><packets>%d</packets>'
+             b'<elapsed>%d</elapsed><category>any</category>'
+             b'<session_end_reason>tcp-fin</session_end_reason></entry>')
+
+    x = [b'<response status="success"><result><job>'
+         b'<tenq>00:00:00</tenq><id>1</id><status>FIN</status></job>'
+         b'<log><logs count="%d" progress="100">' % size]
+    x.extend([entry % (i, i // 60 % 60, i % 60, i, i >> 16 & 255,
+                       i >> 8 & 255, i & 255, i & 255, i % 100, i % 1000,
+                       1024 + i % 60000, i * 10, i % 100, i % 300)
+              for i in range(size)])
+    x.append(b'</logs></log></result></response>')
+
+    return b''.join(x)
+
+
+def wildfire_report(size):
+    # WildFire XML report with size process activity, registry, file
+    # and network events in each of 4 platform reports
+    events = (b'<Create name="C:\\Users\\user\\AppData\\file%d.tmp" '
+              b'type="N/A" size="%d"/>'
+              b'<Set key="HKCU\\Software\\Bench\\%d" subkey="Value" '
+              b'value="%d"/>'
+              b'<dns query="host%d.example.com" response="192.0.2.%d" '
+              b'type="A"/>'
+              b'<url host="host%d.example.com" uri="/path/%d" '
+              b'method="GET" user_agent="Mozilla/4.0"/>')
+
+    x = [b'<?xml version="1.0" encoding="UTF-8"?>\n'
+         b'<wildfire><version>2.0</version><file_info>'
+         b'<malware>yes</malware><filetype>PE</filetype>'
+         b'<sha256>' + b'0' * 64 + b'</sha256>'
+         b'<md5>' + b'0' * 32 + b'</md5>'
+         b'<size>123456</size></file_info><task_info>']
+    for platform_id in range(4):
+        x.append(b'<report><version>3.0</version>'
+                 b'<platform>%d</platform><software>Windows 7</software>'
+                 b'<malware>yes</malware><summary>' % (100 + platform_id))
+        x.extend([b'<entry score="0.%d" id="%d">behavior %d</entry>' %
+                  (i % 10, i, i) for i in range(min(size, 100))])
+        x.append(b'</summary><process_list><process name="sample.exe" '
+                 b'pid="1234"><process_activity>')
+        x.extend([events % (i, i, i, i, i, i & 255, i, i)
+                  for i in range(size)])
+        x.append(b'</process_activity></process></process_list>'
+                 b'</report>')
+    x.append(b'</task_info></wildfire>\n')
+
+    return b''.join(x)
+
+
+def parse_opts():
+    options = {
+        'n': 5,
+        'sizes': [10000],
+        'logs': 5000,
+        'events': 5000,
+        'memory': True,
+        'json': None,
+        'only': None,
+        }
+
+    short_options = 'n:s:l:w:o:'
+    long_options = ['json=', 'no-memory', 'help']
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:],
+                                   short_options,
+                                   long_options)
+    except getopt.GetoptError as error:
+        print(error, file=sys.stderr)
+        sys.exit(1)
+
+    for opt, arg in opts:
+        if opt == '-n':
+            options['n'] = int(arg)
+        elif opt == '-s':
+            options['sizes'] = [int(x) for x in arg.split(',')]
+        elif opt == '-l':
+            options['logs'] = int(arg)
+        elif opt == '-w':
+            options['events'] = int(arg)
+        elif opt == '-o':
+            options['only'] = arg
+        elif opt == '--json':
+            options['json'] = arg
+        elif opt == '--no-memory':
+            options['memory'] = False
+        elif opt == '--help':
+            usage()
+            sys.exit(0)
+        else:
+            assert False, 'unhandled option %s' % opt
+
+    return options
+
+
+def usage():
+    usage = '''%s [options]
+    -n num                iterations (default 5)
+    -s num[,num...]       config address objects and rules (default 10000)
+    -l num                log entries (default 5000)
+    -w num                WildFire report events (default 5000)
+    -o regex              run matching benchmarks only
+    --json path           write results as JSON (- for stdout)
+    --no-memory           don't measure peak memory
+    --help                display usage
+'''
+    print(usage % os.path.basename(sys.argv[0]), end='')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2015 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+# Per-request SSL cost before and after SSL context reuse and TLS
+# session resumption.
+#
+# $ ./bench_ssl.py                       # SSL context creation
+# $ ./bench_ssl.py -h 192.168.1.1        # and TLS handshakes to host
+# $ ./bench_ssl.py --certfile cert.pem   # and handshakes to local server
+
+from __future__ import print_function
+import sys
+import os
+import getopt
+import time
+import threading
+import ssl
+
+libpath = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(libpath, os.pardir, 'lib')]
+import pan.pool
+
+
+def main():
+    options = parse_opts()
+
+    n = options['n']
+
+    print('SSL context creation, %d requests:' % n)
+    before = bench(n, lambda: ssl._create_unverified_context())
+    print_result('unverified context per request', before, n)
+    context = ssl._create_unverified_context()
+    after = bench(n, lambda: context)
+    print_result('unverified context reused', after, n)
+
+    before = bench(n, lambda: ssl.create_default_context())
+    print_result('default (CA store) context per request', before, n)
+    context = ssl.create_default_context()
+    after = bench(n, lambda: context)
+    print_result('default (CA store) context reused', after, n)
+
+    server = None
+    if options['certfile'] is not None:
+        server = start_server(options['certfile'])
+        options['hostname'] = '127.0.0.1'
+        options['port'] = server.server_address[1]
+
+    if options['hostname'] is not None:
+        url = 'https://%s' % options['hostname']
+        if options['port'] is not None:
+            url += ':%s' % options['port']
+        url += '/'
+        n = options['connections']
+
+        print('TLS handshake, %d new connections to %s:' % (n, url))
+
+        def full():
+            # new pool each time: no saved session
+            pool = pan.pool.PanConnectionPool(maxsize=0)
+            request(pool, url, ssl._create_unverified_context())
+
+        print_result('new context, full handshake',
+                     bench(n, full), n)
+
+        pool = pan.pool.PanConnectionPool(maxsize=0)
+        context = ssl._create_unverified_context()
+        request(pool, url, context)
+
+        def resumed():
+            # maxsize=0: connection is closed, session is kept
+            request(pool, url, context)
+
+        print_result('context reused, session resumption',
+                     bench(n, resumed), n)
+
+    if server is not None:
+        server.shutdown()
+
+
+def request(pool, url, context):
+    response = pool.request('GET', url, context=context)
+    response.read()
+
+
+def bench(n, func):
+    start = time.time()
+    for i in range(n):
+        func()
+    return time.time() - start
+
+
+def print_result(name, elapsed, n):
+    print('  %-42s %10.1f usec/request' % (name, elapsed / n * 1000000))
+
+
+def start_server(certfile):
+    try:
+        from http.server import HTTPServer, BaseHTTPRequestHandler
+    except ImportError:
+        from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            body = b'<response status="success"/>'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/xml')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(HTTPServer):
+        def get_request(self):
+            sock, addr = HTTPServer.get_request(self)
+            return self.context.wrap_socket(sock, server_side=True), addr
+
+    server = Server(('127.0.0.1', 0), Handler)
+    server.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server.context.load_cert_chain(certfile)
+    t = threading.Thread(target=server.serve_forever)
+    t.daemon = True
+    t.start()
+
+    return server
+
+
+def parse_opts():
+    options = {
+        'n': 1000,
+        'connections': 100,
+        'hostname': None,
+        'port': None,
+        'certfile': None,
+        }
+
+    short_options = 'n:c:h:P:'
+    long_options = ['certfile=', 'help']
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:],
+                                   short_options,
+                                   long_options)
+    except getopt.GetoptError as error:
+        print(error, file=sys.stderr)
+        sys.exit(1)
+
+    for opt, arg in opts:
+        if opt == '-n':
+            options['n'] = int(arg)
+        elif opt == '-c':
+            options['connections'] = int(arg)
+        elif opt == '-h':
+            options['hostname'] = arg
+        elif opt == '-P':
+            options['port'] = arg
+        elif opt == '--certfile':
+            options['certfile'] = arg
+        elif opt == '--help':
+            usage()
+            sys.exit(0)
+        else:
+            assert False, 'unhandled option %s' % opt
+
+    return options
+
+
+def usage():
+    usage = '''%s [options]
+    -n num                SSL context iterations (default 1000)
+    -c num                TLS connections (default 100)
+    -h hostname           HTTPS host for handshake benchmark
+    -P port               HTTPS port
+    --certfile path       start local HTTPS server with cert and key
+    --help                display usage
+'''
+    print(usage % os.path.basename(sys.argv[0]), end='')
+
+if __name__ == '__main__':
+    main()
@@ -27,12 +27,14 @@ import pprint
 import logging
 import ssl
 import signal
+import tempfile
 
 libpath = os.path.dirname(os.path.abspath(__file__))
 sys.path[:0] = [os.path.join(libpath, os.pardir, 'lib')]
 import pan.xapi
 import pan.commit
 import pan.config
+import pan.keycache
 
 debug = 0
 
@@ -69,6 +71,10 @@ def main():
     else:
         ssl_context = None
 
+    key_cache = None
+    if options['key_cache']:
+        key_cache = pan.keycache.PanKeyCache()
+
     try:
         xapi = pan.xapi.PanXapi(timeout=options['timeout'],
                                 tag=options['tag'],
@@ -80,7 +86,8 @@ def main():
                                 hostname=options['hostname'],
                                 port=options['port'],
                                 serial=options['serial'],
-                                ssl_context=ssl_context)
+                                ssl_context=ssl_context,
+                                key_cache=key_cache)
 
     except pan.xapi.PanXapiError as msg:
         print('pan.xapi.PanXapi:', msg, file=sys.stderr)
@@ -219,21 +226,28 @@ def main():
             action = 'export'
             if options['ad_hoc'] is not None:
                 extra_qs_used = True
-            if options['pcapid'] is not None:
-                xapi.export(category=options['export'],
-                            pcapid=options['pcapid'],
-                            search_time=options['stime'],
-                            serialno=options['serial'],
-                            extra_qs=options['ad_hoc'])
-            else:
-                xapi.export(category=options['export'],
-                            from_name=options['src'],
-                            extra_qs=options['ad_hoc'])
+            f = export_file(options)
+            try:
+                if options['pcapid'] is not None:
+                    xapi.export(category=options['export'],
+                                pcapid=options['pcapid'],
+                                search_time=options['stime'],
+                                serialno=options['serial'],
+                                extra_qs=options['ad_hoc'],
+                                file=f)
+                else:
+                    xapi.export(category=options['export'],
+                                from_name=options['src'],
+                                extra_qs=options['ad_hoc'],
+                                file=f)
+            except pan.xapi.PanXapiError:
+                remove_export_file(f)
+                raise
             print_status(xapi, action)
             print_response(xapi, options)
             if options['pcap_listing']:
                 pcap_listing(xapi, options['export'])
-            save_attachment(xapi, options)
+            save_attachment(xapi, options, f)
 
         if options['log'] is not None:
             action = 'log'
@@ -372,6 +386,7 @@ def parse_opts():
         'stime': None,
         'pcapid': None,
         'api_key': None,
+        'key_cache': False,
         'cafile': None,
         'capath': None,
         'print_xml': False,
@@ -402,7 +417,7 @@ def parse_opts():
                     'cafile=', 'capath=', 'ls', 'serial=',
                     'group=', 'merge', 'nlogs=', 'skip=', 'filter=',
                     'interval=', 'timeout=',
-                    'stime=', 'pcapid=', 'text',
+                    'stime=', 'pcapid=', 'text', 'key-cache',
                     ]
 
     try:
@@ -509,6 +524,8 @@ def parse_opts():
             options['pcapid'] = arg
         elif opt == '-h':
             options['hostname'] = arg
+        elif opt == '--key-cache':
+            options['key_cache'] = True
         elif opt == '-K':
             options['api_key'] = arg
         elif opt == '--cafile':
@@ -689,6 +706,11 @@ def print_response(xapi, options):
     if options['print_xml']:
         if options['print_result']:
             s = xapi.xml_result()
+        elif xapi.response is not None:
+            # response bytes as received from the device
+            write_bytes(xapi.response.body.lstrip(b'\r\n').rstrip() +
+                        b'\n')
+            s = None
         else:
             s = xapi.xml_root()
         if s is not None:
@@ -706,18 +728,114 @@ def print_response(xapi, options):
         print(xapi.text_document, end='')
 
 
-def save_attachment(xapi, options):
+def write_bytes(b):
+    if hasattr(sys.stdout, 'buffer'):
+        # 3.x
+        sys.stdout.flush()
+        sys.stdout.buffer.write(b)
+        sys.stdout.buffer.flush()
+    else:
+        sys.stdout.write(b)
+
+
+def export_file(options):
+    # The attachment is streamed to a temporary file in the
+    # destination directory and renamed by save_attachment() when
+    # the export completes.  The file name can be from the response
+    # (Content-Disposition), so the path is not known until then.
+    dir = attachment_dir(options)
+    try:
+        f = tempfile.NamedTemporaryFile(prefix='.panxapi-',
+                                        dir=dir or '.',
+                                        delete=False)
+    except (IOError, OSError) as msg:
+        if debug:
+            print('tempfile %s: %s' % (dir, msg), file=sys.stderr)
+        # read attachment into memory
+        return None
+
+    return f
+
+
+def remove_export_file(f):
+    if f is None:
+        return
+    f.close()
+    try:
+        os.unlink(f.name)
+    except OSError:
+        pass
+
+
+def save_attachment(xapi, options, f=None):
     if xapi.export_result is None:
+        remove_export_file(f)
         return
 
+    src_file = None
+    if options['src'] is None:
+        # 6.0 threat-pcap
+        # device-state
+        src_file = xapi.export_result['file']
+    path = attachment_path(options, src_file)
+
+    if f is not None:
+        f.close()
+        tmp_path = f.name
+        # NamedTemporaryFile() creates mode 0600
+        umask = os.umask(0)
+        os.umask(umask)
+        try:
+            os.chmod(tmp_path, 0o666 & ~umask)
+            # 3.3: os.replace() also replaces on Windows
+            getattr(os, 'replace', os.rename)(tmp_path, path)
+        except OSError as msg:
+            print('rename %s %s: %s' % (tmp_path, path, msg),
+                  file=sys.stderr)
+            remove_export_file(f)
+            return
+        print('exported %s: %s (%d bytes, sha256 %s)' %
+              (xapi.export_result['category'], path,
+               xapi.export_result['size'],
+               xapi.export_result['sha256']),
+              file=sys.stderr)
+        return
+
+    try:
+        f = open(path, 'wb')
+    except IOError as msg:
+        print('open %s: %s' % (path, msg), file=sys.stderr)
+        return
+
+    try:
+        f.write(xapi.export_result['content'])
+    except IOError as msg:
+        print('write %s: %s' % (path, msg), file=sys.stderr)
+        f.close()
+        return
+
+    f.close()
+    print('exported %s: %s' % (xapi.export_result['category'], path),
+          file=sys.stderr)
+
+
+def attachment_dir(options):
+    # destination directory, without the --recursive pcap directory
+    # which attachment_path() creates when the attachment is saved
+    if options['dst'] is not None:
+        if os.path.isdir(options['dst']):
+            return options['dst']
+        return os.path.dirname(options['dst'])
+
+    return ''
+
+
+def attachment_path(options, src_file=None):
     if options['src'] is not None:
         # pcap
         src_dir, src_file = os.path.split(options['src'])
     else:
-        # 6.0 threat-pcap
-        # device-state
         src_dir = None
-        src_file = xapi.export_result['file']
 
     path = ''
     path_done = False
@@ -740,22 +858,7 @@ def save_attachment(xapi, options):
                     # fallthrough, return on open fail
         path = os.path.join(path, src_file)
 
-    try:
-        f = open(path, 'wb')
-    except IOError as msg:
-        print('open %s: %s' % (path, msg), file=sys.stderr)
-        return
-
-    try:
-        f.write(xapi.export_result['content'])
-    except IOError as msg:
-        print('write %s: %s' % (path, msg), file=sys.stderr)
-        f.close()
-        return
-
-    f.close()
-    print('exported %s: %s' % (xapi.export_result['category'], path),
-          file=sys.stderr)
+    return path
 
 
 def pcap_listing(xapi, category):
@@ -857,6 +960,7 @@ def usage():
     --stime time          search time for threat-pcap
     --pcapid id           threat-pcap ID
     -K api_key
+    --key-cache           use cached API key (~/.pankeys)
     -x                    print XML response to stdout
     -p                    print XML response in Python to stdout
     -j                    print XML response in JSON to stdout
@@ -0,0 +1,719 @@
+#
+# Copyright (c) 2015 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""asyncio interface to the PAN-OS XML API
+
+The pan.aioxapi module implements the AsyncPanXapi class.  It provides
+the PanXapi methods as coroutines, so many devices can be queried from
+a single thread using an asyncio event loop.  AsyncPanXapi is a
+subclass of PanXapi and uses the same request query construction and
+response parsing.
+
+pan.aioxapi requires Python 3.7 or later.
+"""
+
+import asyncio
+import email.parser
+import time
+import logging
+from http.client import HTTPMessage, responses
+from urllib.error import URLError
+from urllib.parse import urlsplit
+
+from . import DEBUG1, DEBUG2, DEBUG3
+import pan.xapi
+import pan.batch
+import pan.compress
+from pan.xapi import PanXapiError
+
+_maxsize = 4
+_idle_timeout = 30
+# seconds between checks for a governor request slot
+_governor_poll = 0.05
+
+
+class AsyncPanConnectionPool:
+    def __init__(self,
+                 maxsize=_maxsize,
+                 idle_timeout=_idle_timeout,
+                 reconnect=True):
+        self._log = logging.getLogger(__name__).log
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.reconnect = reconnect
+        self._pools = {}
+
+    def __str__(self):
+        return '\n'.join((': '.join((k, str(self.__dict__[k]))))
+                         for k in sorted(self.__dict__))
+
+    def _get(self, key):
+        now = time.time()
+        idle = self._pools.get(key, [])
+        while idle:
+            reader, writer, last_used = idle.pop()
+            if (writer.is_closing() or reader.at_eof() or
+                    (self.idle_timeout is not None and
+                     now - last_used > self.idle_timeout)):
+                self._log(DEBUG2, 'pool %s: close idle connection', key)
+                writer.close()
+                continue
+            self._log(DEBUG3, 'pool %s: reuse connection', key)
+            return (reader, writer), True
+
+        return None, False
+
+    def _put(self, key, conn):
+        reader, writer = conn
+        idle = self._pools.setdefault(key, [])
+        if len(idle) >= self.maxsize:
+            self._log(DEBUG3, 'pool %s: full, close connection', key)
+            writer.close()
+            return
+        idle.append((reader, writer, time.time()))
+
+    async def _new_conn(self, key):
+        scheme, host, port, context = key
+        if scheme == 'https':
+            ssl = context if context is not None else True
+            if port is None:
+                port = 443
+        elif scheme == 'http':
+            ssl = None
+            if port is None:
+                port = 80
+        else:
+            raise URLError('Invalid URL scheme: %s' % scheme)
+
+        self._log(DEBUG2, 'pool %s: new connection', key)
+
+        return await asyncio.open_connection(host, port, ssl=ssl)
+
+    async def request(self, method, url, body=None, headers=None,
+                      context=None):
+        x = urlsplit(url)
+        path = x.path
+        if x.query:
+            path += '?' + x.query
+        host = x.netloc
+        key = (x.scheme, x.hostname, x.port, context)
+
+        lines = ['%s %s HTTP/1.1' % (method, path),
+                 'Host: %s' % host]
+        if headers is None or 'Accept-Encoding' not in headers:
+            lines.append('Accept-Encoding: identity')
+        if headers is not None:
+            for k in headers:
+                lines.append('%s: %s' % (k, headers[k]))
+        if body is not None:
+            lines.append('Content-Length: %d' % len(body))
+        request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        if body is not None:
+            request += body
+
+        conn, reused = self._get(key)
+        try:
+            if conn is None:
+                conn = await self._new_conn(key)
+            try:
+                response = await self._request(conn, method, request)
+            except (OSError, asyncio.IncompleteReadError,
+                    _StaleConnection) as e:
+                conn[1].close()
+                if not (reused and self.reconnect):
+                    raise
+                # server closed the idle connection; the request
+                # was not processed so send it on a new connection
+                self._log(DEBUG1, 'pool %s: reconnect: %s', key, e)
+                conn = await self._new_conn(key)
+                response = await self._request(conn, method, request)
+        except asyncio.CancelledError:
+            # timeout: connection state unknown
+            if conn is not None:
+                conn[1].close()
+            raise
+        except (OSError, asyncio.IncompleteReadError, ValueError,
+                _StaleConnection) as e:
+            if conn is not None:
+                conn[1].close()
+            raise URLError(e)
+
+        if response.will_close:
+            conn[1].close()
+        else:
+            self._put(key, conn)
+
+        return response
+
+    async def _request(self, conn, method, request):
+        reader, writer = conn
+        writer.write(request)
+        await writer.drain()
+
+        line = await reader.readline()
+        if not line:
+            raise _StaleConnection('connection closed by server')
+        try:
+            version, status, reason = \
+                line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+        except ValueError:
+            version, status = line.decode('latin-1').split()[:2]
+            reason = ''
+        status = int(status)
+
+        header_lines = []
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            header_lines.append(line)
+        message = email.parser.Parser(_class=HTTPMessage).parsestr(
+            b''.join(header_lines).decode('iso-8859-1'))
+
+        connection = (message.get('connection') or '').lower()
+        will_close = ('close' in connection or
+                      (version == 'HTTP/1.0' and
+                       'keep-alive' not in connection))
+
+        encoding = (message.get('transfer-encoding') or '').lower()
+        length = message.get('content-length')
+        if method == 'HEAD' or status in (204, 304) or status < 200:
+            body = b''
+        elif 'chunked' in encoding:
+            chunks = []
+            while True:
+                line = await reader.readline()
+                size = int(line.split(b';', 1)[0].strip(), 16)
+                if size == 0:
+                    # trailer
+                    while (await reader.readline()) not in (b'\r\n',
+                                                           b'\n', b''):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            body = b''.join(chunks)
+        elif length is not None:
+            body = await reader.readexactly(int(length))
+        else:
+            body = await reader.read()
+            will_close = True
+
+        return _AsyncResponse(status, reason, message, body, will_close)
+
+    def clear(self):
+        pools = self._pools
+        self._pools = {}
+        for key in pools:
+            for reader, writer, last_used in pools[key]:
+                writer.close()
+
+    close = clear
+
+
+class _StaleConnection(Exception):
+    pass
+
+
+class _AsyncResponse:
+    # Minimal http.client.HTTPResponse interface used by PanXapi
+    # response parsing; the message body has been read.
+    def __init__(self, status, reason, message, body, will_close):
+        self.status = status
+        self.reason = reason if reason else responses.get(status, '')
+        self.msg = message
+        self._body = body
+        self.will_close = will_close
+
+    def getheader(self, name, default=None):
+        return self.msg.get(name, default)
+
+    def info(self):
+        return self.msg
+
+    def getcode(self):
+        return self.status
+
+    def read(self, amt=None):
+        if amt is None:
+            data, self._body = self._body, b''
+        else:
+            data, self._body = self._body[:amt], self._body[amt:]
+        return data
+
+    def isclosed(self):
+        return not self._body
+
+    def close(self):
+        self._body = b''
+
+
+class AsyncPanXapi(pan.xapi.PanXapi):
+    def __init__(self,
+                 tag=None,
+                 api_username=None,
+                 api_password=None,
+                 api_key=None,
+                 hostname=None,
+                 port=None,
+                 serial=None,
+                 use_http=False,
+                 use_get=False,
+                 timeout=None,
+                 ssl_context=None,
+                 pool=None,
+                 iterparse=None,
+                 poll=None,
+                 cache=None,
+                 key_cache=None,
+                 retry=None,
+                 breaker=None,
+                 governor=None,
+                 compress=True,
+                 metrics=None):
+        pan.xapi.PanXapi.__init__(self,
+                                  tag=tag,
+                                  api_username=api_username,
+                                  api_password=api_password,
+                                  api_key=api_key,
+                                  hostname=hostname,
+                                  port=port,
+                                  serial=serial,
+                                  use_http=use_http,
+                                  use_get=use_get,
+                                  timeout=timeout,
+                                  ssl_context=ssl_context,
+                                  iterparse=iterparse,
+                                  poll=poll,
+                                  cache=cache,
+                                  key_cache=key_cache,
+                                  retry=retry,
+                                  breaker=breaker,
+                                  governor=governor,
+                                  compress=compress,
+                                  metrics=metrics)
+
+        if pool is None:
+            pool = AsyncPanConnectionPool()
+        elif not isinstance(pool, AsyncPanConnectionPool):
+            raise PanXapiError('pool not AsyncPanConnectionPool')
+        self.pool = pool
+
+    async def __api_request(self, query):
+        data = self._encode_query(query)
+
+        self._log(DEBUG3, 'query: %s', query)
+
+        url = self.uri
+        headers = {}
+        if self.use_get:
+            method = 'GET'
+            url += '?' + data
+            body = None
+        else:
+            method = 'POST'
+            body = data.encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.compress:
+            headers['Accept-Encoding'] = pan.compress.accept_encoding
+
+        self._log(DEBUG1, 'URL: %s', url)
+        self._log(DEBUG1, 'method: %s', method)
+        self._log(DEBUG1, 'data: %s', data)
+        if self.metrics is not None and self._request_metrics is not None:
+            self._request_metrics.request_bytes = len(data)
+
+        context = None
+        if url.startswith('https:'):
+            context = self._get_ssl_context()
+
+        request = self.pool.request(method, url, body, headers,
+                                    context=context)
+        try:
+            if self.timeout is not None:
+                response = await asyncio.wait_for(request, self.timeout)
+            else:
+                response = await request
+        except asyncio.TimeoutError:
+            self.status_detail = 'URLError: reason: timed out'
+            return False
+        except URLError as error:
+            self.status_detail = self._urlerror_msg(error)
+            return False
+
+        self._log(DEBUG2, 'HTTP response headers:')
+        self._log(DEBUG2, '%s', response.info())
+
+        if not (200 <= response.status < 300):
+            self._http_code = response.status
+            self.status_detail = 'URLError: code: %s reason: %s' % \
+                (response.status, response.reason)
+            return False
+
+        return self._decoded_response(response)
+
+    async def __request(self, query):
+        try:
+            await self.__request_once(query)
+        except PanXapiError:
+            if not self._key_auth_failed(query):
+                raise
+            await self.__set_api_key()
+            query['key'] = self.api_key
+            await self.__request_once(query)
+
+    async def __request_once(self, query):
+        attempt = 0
+        while True:
+            if not self._breaker_allow():
+                raise PanXapiError(self.status_detail)
+            self._http_code = None
+            key = self._governor_key()
+            await self.__governor_acquire(key)
+            self._metrics_start(query)
+            start = time.time()
+            response = None
+            try:
+                response = await self.__api_request(query)
+            finally:
+                self.governor.release(key, time.time() - start)
+                if response is None:
+                    self._breaker_abort()
+            self._metrics_response(response)
+            delay = self._retry_delay(query, response, attempt)
+            if delay is None:
+                break
+            self._metrics_finish(response)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+        self._set_response_metrics(response)
+
+    async def __governor_acquire(self, key):
+        # PanGovernor.acquire() blocks the thread; wait in the event
+        # loop instead
+        while True:
+            wait = self.governor.try_acquire(key)
+            if wait == 0:
+                return
+            await asyncio.sleep(wait if wait is not None else
+                                _governor_poll)
+
+    async def __set_api_key(self):
+        if self.api_key is None:
+            if self._key_cache_get():
+                return
+            await self.keygen()
+            self._log(DEBUG1, 'autoset api_key: "%s"', self.api_key)
+            self._key_cache_put()
+
+    async def keygen(self, extra_qs=None):
+        self._clear_response()
+
+        query = self._keygen_query(extra_qs)
+        await self.__request(query)
+
+        return self._keygen_result()
+
+    async def ad_hoc(self, qs=None, xpath=None, modify_qs=False):
+        await self.__set_api_key()
+        self._clear_response()
+
+        query = self._ad_hoc_query(qs, xpath, modify_qs)
+        await self.__request(query)
+
+    async def show(self, xpath=None, extra_qs=None):
+        query = self._config_args(xpath=xpath)
+        await self.__type_config('show', query, extra_qs)
+
+    async def get(self, xpath=None, extra_qs=None):
+        query = self._config_args(xpath=xpath)
+        await self.__type_config('get', query, extra_qs)
+
+    async def delete(self, xpath=None, extra_qs=None):
+        query = self._config_args(xpath=xpath)
+        await self.__type_config('delete', query, extra_qs)
+
+    async def set(self, xpath=None, element=None, extra_qs=None):
+        query = self._config_args(xpath=xpath, element=element)
+        await self.__type_config('set', query, extra_qs)
+
+    async def edit(self, xpath=None, element=None, extra_qs=None):
+        query = self._config_args(xpath=xpath, element=element)
+        await self.__type_config('edit', query, extra_qs)
+
+    async def move(self, xpath=None, where=None, dst=None, extra_qs=None):
+        query = self._config_args(xpath=xpath, where=where, dst=dst)
+        await self.__type_config('move', query, extra_qs)
+
+    async def rename(self, xpath=None, newname=None, extra_qs=None):
+        query = self._config_args(xpath=xpath, newname=newname)
+        await self.__type_config('rename', query, extra_qs)
+
+    async def clone(self, xpath=None, xpath_from=None, newname=None,
+                    extra_qs=None):
+        query = self._config_args(xpath=xpath, xpath_from=xpath_from,
+                                  newname=newname)
+        await self.__type_config('clone', query, extra_qs)
+
+    async def override(self, xpath=None, element=None, extra_qs=None):
+        query = self._config_args(xpath=xpath, element=element)
+        await self.__type_config('override', query, extra_qs)
+
+    async def multi_config(self, element=None, extra_qs=None):
+        query = self._config_args(element=element)
+        await self.__type_config('multi-config', query, extra_qs)
+
+    def batch(self, max_actions=None, max_size=None):
+        return AsyncPanConfigBatch(self, max_actions, max_size)
+
+    async def __type_config(self, action, query, extra_qs=None):
+        self._clear_response()
+        if self._cache_get(action, query, extra_qs):
+            return
+        await self.__set_api_key()
+
+        self._cache_invalidate(action, query)
+        query = self._config_query(action, query, extra_qs)
+        await self.__request(query)
+        self._cache_put(action, query, extra_qs)
+
+    async def user_id(self, cmd=None, vsys=None, extra_qs=None):
+        await self.__set_api_key()
+        self._clear_response()
+
+        query = self._user_id_query(cmd, vsys, extra_qs)
+        await self.__request(query)
+
+    async def commit(self, cmd=None, action=None, sync=False,
+                     interval=None, timeout=None, extra_qs=None):
+        await self.__set_api_key()
+        self._clear_response()
+
+        interval, timeout = self._job_args(interval, timeout)
+
+        query = self._commit_query(cmd, action, extra_qs)
+        self._cache_flush()
+        await self.__request(query)
+
+        handle = self._commit_handle()
+        if sync is not True or handle is None:
+            return handle
+
+        job = handle.id
+        cmd = self._job_cmd(job)
+        poller = self._job_poller('commit', interval)
+
+        while True:
+            # sleep at the top of the loop so we don't poll
+            # immediately after commit
+            await self.__job_sleep(poller)
+
+            try:
+                await self.op(cmd=cmd, cmd_xml=True)
+            except PanXapiError as msg:
+                raise PanXapiError('commit %s: %s' % (cmd, msg))
+
+            if self._commit_job_done(job, cmd, poller, timeout):
+                handle.update(self.element_root.find('./result/job'))
+                return handle
+
+    async def op(self, cmd=None, vsys=None, cmd_xml=False, extra_qs=None):
+        if cmd is not None and cmd_xml:
+            cmd = self.cmd_xml(cmd)
+
+        await self.__set_api_key()
+        self._clear_response()
+
+        query = self._op_query(cmd, vsys, extra_qs)
+        await self.__request(query)
+
+    async def export(self, category=None, from_name=None, to_name=None,
+                     pcapid=None, search_time=None, serialno=None,
+                     extra_qs=None, file=None):
+        await self.__set_api_key()
+        self._clear_response()
+
+        query = self._export_query(category, from_name, to_name,
+                                   pcapid, search_time, serialno,
+                                   extra_qs)
+        # XXX the message body is read by the transport before it
+        # is written to file
+        self._export_file = file
+        try:
+            await self.__request(query)
+        finally:
+            self._export_file = None
+
+        if self.export_result:
+            self.export_result['category'] = category
+
+    async def log(self, log_type=None, nlogs=None, skip=None, filter=None,
+                  interval=None, timeout=None, extra_qs=None):
+        await self.__set_api_key()
+        self._clear_response()
+
+        interval, timeout = self._job_args(interval, timeout)
+
+        query = self._log_query(log_type, nlogs, skip, filter, extra_qs)
+        await self.__request(query)
+
+        job = self._log_job()
+        await self.__log_job_wait(job, interval, timeout)
+
+    async def __log_job_wait(self, job, interval, timeout):
+        query = self._log_get_query(job)
+        poller = self._job_poller('log', interval)
+
+        while True:
+            await self.__request(query)
+
+            if self._log_job_done(job, poller, timeout):
+                return
+
+            await self.__job_sleep(poller)
+
+    async def iter_logs(self, log_type=None, filter=None, page_size=None,
+                        max_logs=None, interval=None, timeout=None,
+                        extra_qs=None):
+        # Asynchronous generator version of PanXapi.iter_logs(), used
+        # with async for.
+        await self.__set_api_key()
+
+        interval, timeout = self._job_args(interval, timeout)
+        page_size, max_logs = self._log_page_args(page_size, max_logs)
+
+        requested = 0
+        nlogs = self._log_page_nlogs(page_size, max_logs, requested)
+        job = await self.__log_page_job(log_type, nlogs, requested,
+                                        filter, extra_qs)
+        requested += nlogs
+
+        while job is not None:
+            entries = await self.__log_page_entries(job, interval, timeout)
+            self._log(DEBUG1, 'log job %s: %d entries', job, len(entries))
+
+            job = None
+            if len(entries) == nlogs:
+                # not the last page
+                nlogs = self._log_page_nlogs(page_size, max_logs,
+                                             requested)
+                if nlogs:
+                    job = await self.__log_page_job(log_type, nlogs,
+                                                    requested, filter,
+                                                    extra_qs)
+                    requested += nlogs
+
+            # release entries as they are returned
+            entries.reverse()
+            while entries:
+                yield entries.pop()
+
+    async def __log_page_job(self, log_type, nlogs, skip, filter, extra_qs):
+        self._clear_response()
+        query = self._log_query(log_type, nlogs, skip or None, filter,
+                                extra_qs)
+        # parse entire response when iterparse is set
+        iterparse = self.iterparse
+        self.iterparse = None
+        try:
+            await self.__request(query)
+        finally:
+            self.iterparse = iterparse
+
+        return self._log_job()
+
+    async def __log_page_entries(self, job, interval, timeout):
+        self._clear_response()
+        iterparse = self.iterparse
+        self.iterparse = None
+        try:
+            await self.__log_job_wait(job, interval, timeout)
+        finally:
+            self.iterparse = iterparse
+
+        return self._log_entries()
+
+    def user_id_queue(self, *args, **kwargs):
+        # PanUserIdQueue sends using blocking user_id() calls
+        raise PanXapiError('user_id_queue() not supported by '
+                           'AsyncPanXapi')
+
+    async def __job_sleep(self, poller):
+        interval = poller.next_interval()
+        self._log(DEBUG2, 'sleep %.2f seconds', interval)
+        await asyncio.sleep(interval)
+
+    def close(self):
+        self.pool.clear()
+
+
+class AsyncPanConfigBatch(pan.batch.PanConfigBatch):
+    # PanConfigBatch for AsyncPanXapi: the action methods and flush()
+    # are coroutines, and it is used with async with.
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        if type is None:
+            await self.flush()
+
+    def __enter__(self):
+        raise PanXapiError('AsyncPanConfigBatch: use async with')
+
+    async def _add(self, action, xpath, element=None, attrs=None):
+        x = self._action(action, xpath, element, attrs)
+        if self._full(x):
+            await self._send()
+        self._append(x)
+
+        return x
+
+    async def flush(self):
+        if self._pending and self._failed is None:
+            await self._send()
+        self._check_failed()
+
+    async def _send(self):
+        actions, element = self._request()
+
+        error = None
+        try:
+            await self.xapi.multi_config(element=element)
+        except PanXapiError as msg:
+            error = self._error(msg)
+        self._results(actions, error)
+
+
+if __name__ == '__main__':
+    # python -m pan.aioxapi [tag ...]
+    import sys
+
+    async def show_system_info(tag):
+        try:
+            xapi = AsyncPanXapi(timeout=5, tag=tag)
+            await xapi.op(cmd='show system info', cmd_xml=True)
+        except PanXapiError as msg:
+            return tag, str(msg)
+        return tag, xapi.xml_result()
+
+    async def main(tags):
+        results = await asyncio.gather(*[show_system_info(tag)
+                                         for tag in tags])
+        for tag, result in results:
+            print('%s:' % tag, result)
+
+    asyncio.run(main(sys.argv[1:] or [None]))
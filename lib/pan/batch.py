@@ -0,0 +1,285 @@
+#
+# Copyright (c) 2015 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""Batched configuration API requests
+
+The pan.batch module implements the PanConfigBatch class.  It
+collects set, edit, delete, move, rename and clone configuration
+actions and performs them using ``type=config&action=multi-config``
+API requests, which contain many actions in one request.
+"""
+
+from __future__ import print_function
+import sys
+import logging
+from xml.sax.saxutils import quoteattr
+
+from . import DEBUG1, DEBUG2, DEBUG3
+import pan.xapi
+
+_max_actions = 500
+_max_size = 512 * 1024
+
+
+class PanConfigAction:
+    def __init__(self, id, action, xpath, element=None, attrs=None):
+        self.id = id
+        self.action = action
+        self.xpath = xpath
+        self.element = element
+        self.attrs = attrs
+        self.status = None
+        self.code = None
+        self.msg = None
+        self.error = None
+
+    def __str__(self):
+        return '\n'.join((': '.join((k, str(self.__dict__[k]))))
+                         for k in sorted(self.__dict__))
+
+    @property
+    def ok(self):
+        return self.status == 'success' and self.error is None
+
+    def xml(self):
+        s = '<%s id="%d" xpath=%s' % (self.action, self.id,
+                                      quoteattr(self.xpath))
+        if self.attrs:
+            for k, v in self.attrs:
+                s += ' %s=%s' % (k, quoteattr(v))
+        if self.element is None:
+            return s + '/>'
+
+        return s + '>%s</%s>' % (self.element, self.action)
+
+
+class PanConfigBatch:
+    def __init__(self, xapi, max_actions=None, max_size=None):
+        self._log = logging.getLogger(__name__).log
+        self.xapi = xapi
+        self.max_actions = max_actions
+        self.max_size = max_size
+        self.actions = []  # all actions
+        self.requests = 0
+        self._pending = []
+        self._size = 0
+        self._id = 0
+        self._failed = None
+
+        if self.max_actions is None:
+            self.max_actions = _max_actions
+        if self.max_size is None:
+            self.max_size = _max_size
+        for x in ['max_actions', 'max_size']:
+            value = getattr(self, x)
+            try:
+                value = int(value)
+                if value < 1:
+                    raise ValueError
+            except ValueError:
+                raise pan.xapi.PanXapiError('Invalid %s: %s' %
+                                            (x, value))
+            setattr(self, x, value)
+
+    def __str__(self):
+        return '\n'.join((': '.join((k, str(self.__dict__[k]))))
+                         for k in sorted(self.__dict__))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.flush()
+        # don't suppress exception
+
+    def set(self, xpath=None, element=None):
+        return self._add('set', xpath, element)
+
+    def edit(self, xpath=None, element=None):
+        return self._add('edit', xpath, element)
+
+    def delete(self, xpath=None):
+        return self._add('delete', xpath)
+
+    def move(self, xpath=None, where=None, dst=None):
+        attrs = [('where', where)]
+        if dst is not None:
+            attrs.append(('dst', dst))
+        return self._add('move', xpath, attrs=attrs)
+
+    def rename(self, xpath=None, newname=None):
+        return self._add('rename', xpath, attrs=[('newname', newname)])
+
+    def clone(self, xpath=None, xpath_from=None, newname=None):
+        return self._add('clone', xpath,
+                         attrs=[('from', xpath_from),
+                                ('newname', newname)])
+
+    def _add(self, action, xpath, element=None, attrs=None):
+        x = self._action(action, xpath, element, attrs)
+        if self._full(x):
+            self._send()
+        self._append(x)
+
+        return x
+
+    def _action(self, action, xpath, element=None, attrs=None):
+        if self._failed is not None:
+            raise pan.xapi.PanXapiError('multi-config batch failed: %s' %
+                                        self._failed)
+        if xpath is None:
+            raise pan.xapi.PanXapiError('%s: xpath argument required' %
+                                        action)
+        if attrs is not None:
+            for k, v in attrs:
+                if v is None:
+                    raise pan.xapi.PanXapiError('%s: %s argument required' %
+                                                (action, k))
+
+        self._id += 1
+
+        return PanConfigAction(self._id, action, xpath, element, attrs)
+
+    def _full(self, x):
+        # True when the pending actions are sent before x is added
+        return bool(self._pending) and \
+            (len(self._pending) >= self.max_actions or
+             self._size + len(x.xml()) > self.max_size)
+
+    def _append(self, x):
+        self._pending.append(x)
+        self._size += len(x.xml())
+        self.actions.append(x)
+
+    def flush(self):
+        # perform the pending actions; PanXapiError is raised when an
+        # action failed
+        if self._pending and self._failed is None:
+            self._send()
+        self._check_failed()
+
+    def _check_failed(self):
+        if self._failed is not None:
+            for x in self._pending:
+                x.error = 'not sent: previous multi-config failed'
+            self._pending = []
+            self._size = 0
+            raise pan.xapi.PanXapiError('multi-config batch failed: %s' %
+                                        self._failed)
+
+    def _send(self):
+        actions, element = self._request()
+
+        error = None
+        try:
+            self.xapi.multi_config(element=element)
+        except pan.xapi.PanXapiError as msg:
+            error = self._error(msg)
+        self._results(actions, error)
+
+    def _request(self):
+        # return the pending actions and the multi-config element
+        actions = self._pending
+        self._pending = []
+        self._size = 0
+
+        element = '<multi-config>%s</multi-config>' % \
+            ''.join([x.xml() for x in actions])
+
+        self._log(DEBUG1, 'multi-config: %d actions, %d bytes',
+                  len(actions), len(element))
+        self.requests += 1
+
+        return actions, element
+
+    def _error(self, msg):
+        return str(msg) if str(msg) else 'status %s' % self.xapi.status
+
+    def _results(self, actions, error):
+        failed = self.__set_results(actions, error)
+
+        if error is not None:
+            if failed is not None:
+                self._failed = '%s id %d %s: %s' % (failed.action,
+                                                    failed.id,
+                                                    failed.xpath,
+                                                    failed.error)
+            else:
+                self._failed = error
+
+    def __set_results(self, actions, error):
+        # return the first failed action
+        results = {}
+        root = self.xapi.element_root
+        if root is not None:
+            for elem in root.findall('./result/response'):
+                results[elem.get('id')] = elem
+
+        failed = None
+        for x in actions:
+            elem = results.get(str(x.id))
+            if elem is not None:
+                x.status = elem.get('status')
+                x.code = elem.get('code')
+                msg = elem.find('msg')
+                if msg is not None:
+                    lines = msg.findall('.//line')
+                    if lines:
+                        x.msg = '\n'.join([''.join(line.itertext())
+                                           for line in lines])
+                    else:
+                        x.msg = ''.join(msg.itertext())
+                if x.status != 'success':
+                    x.error = x.msg if x.msg else 'status %s' % x.status
+                    if failed is None:
+                        failed = x
+            elif error is None:
+                # success response without per-action results
+                x.status = self.xapi.status
+
+        if error is not None:
+            # multi-config is a transaction: when an action fails no
+            # action is performed
+            for x in actions:
+                if x.error is None:
+                    x.error = 'not performed: multi-config failed'
+
+        self._log(DEBUG2, 'multi-config: %d results', len(results))
+
+        return failed
+
+if __name__ == '__main__':
+    # python -m pan.batch tag count
+    import pan.xapi
+
+    if len(sys.argv) < 3:
+        print('usage: python -m pan.batch tag count', file=sys.stderr)
+        sys.exit(1)
+
+    xpath = "/config/devices/entry/vsys/entry[@name='vsys1']/address"
+    try:
+        xapi = pan.xapi.PanXapi(tag=sys.argv[1], keepalive=True)
+        with xapi.batch() as batch:
+            for i in range(int(sys.argv[2])):
+                batch.set(xpath=xpath,
+                          element='<entry name="batch-%d">'
+                          '<ip-netmask>192.0.2.%d/32</ip-netmask>'
+                          '</entry>' % (i, i % 256))
+    except pan.xapi.PanXapiError as msg:
+        print('pan.batch.PanConfigBatch:', msg, file=sys.stderr)
+        sys.exit(1)
+    print('%d actions, %d requests' % (len(batch.actions), batch.requests))
@@ -0,0 +1,239 @@
+#
+# Copyright (c) 2015 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""Configuration read cache
+
+The pan.cache module implements the PanXapiCache class, a cache for
+PanXapi show() and get() responses keyed by (hostname, target,
+action, xpath), with TTL expiry and least recently used eviction.
+Configuration changes invalidate the entries with an overlapping
+xpath, and a commit flushes the entries for the device.
+"""
+
+from __future__ import print_function
+import sys
+import re
+import time
+import threading
+import logging
+from collections import OrderedDict
+
+from . import DEBUG1, DEBUG2, DEBUG3
+
+_ttl = 60
+_maxsize = 1024
+
+_step_re = re.compile(r'^([-\w.:]+)((?:\[.*\])?)$')
+_predicate_re = re.compile(r'''\[@([-\w.:]+)=(?:'([^']*)'|"([^"]*)")\]''')
+
+
+class PanXapiCacheError(Exception):
+    pass
+
+
+class PanXapiCache:
+    def __init__(self, ttl=_ttl, maxsize=_maxsize):
+        self._log = logging.getLogger(__name__).log
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key: (expires, value)
+
+        try:
+            self.ttl = float(self.ttl)
+            if self.ttl <= 0:
+                raise ValueError
+        except ValueError:
+            raise PanXapiCacheError('Invalid ttl: %s' % self.ttl)
+
+        try:
+            self.maxsize = int(self.maxsize)
+            if self.maxsize < 1:
+                raise ValueError
+        except ValueError:
+            raise PanXapiCacheError('Invalid maxsize: %s' % self.maxsize)
+
+    def __str__(self):
+        return '\n'.join((': '.join((k, str(self.__dict__[k]))))
+                         for k in sorted(self.__dict__))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    @staticmethod
+    def key(hostname, target, action, xpath):
+        return (hostname, target, action, xpath)
+
+    def get(self, key):
+        # return the cached value or None
+        now = time.time()
+        with self._lock:
+            x = self._entries.get(key)
+            if x is not None and x[0] <= now:
+                del self._entries[key]
+                x = None
+            if x is None:
+                self.misses += 1
+                self._log(DEBUG3, 'cache miss: %s', key)
+                return None
+            # most recently used last
+            del self._entries[key]
+            self._entries[key] = x
+            self.hits += 1
+
+        self._log(DEBUG2, 'cache hit: %s', key)
+
+        return x[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + self.ttl, value)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, hostname, target, xpath=None):
+        # Remove the entries for the device with an xpath which can
+        # select a node selected by xpath, or an ancestor or
+        # descendant of one (a change to a node changes its
+        # ancestors and descendants).  xpath None removes all
+        # entries for the device.
+        n = 0
+        with self._lock:
+            for key in list(self._entries.keys()):
+                if key[0] != hostname or key[1] != target:
+                    continue
+                if (xpath is None or key[3] is None or
+                        self.overlap(key[3], xpath)):
+                    del self._entries[key]
+                    n += 1
+
+        if n:
+            self._log(DEBUG2, 'cache invalidate %s %s %s: %d entries',
+                      hostname, target, xpath, n)
+
+        return n
+
+    def flush(self, hostname=None, target=None):
+        # hostname None: flush all entries
+        if hostname is not None:
+            return self.invalidate(hostname, target)
+
+        with self._lock:
+            n = len(self._entries)
+            self._entries = OrderedDict()
+
+        return n
+
+    @staticmethod
+    def overlap(a, b):
+        # Compare the location steps of the xpaths up to the shorter
+        # one.  A step without predicates matches the same element
+        # name with any predicates, and steps with attribute
+        # predicates match unless an attribute has different values.
+        # Syntax which is not understood is treated as overlapping.
+        a = _steps(a)
+        b = _steps(b)
+        if a is None or b is None:
+            return True
+
+        for (tag_a, attrs_a), (tag_b, attrs_b) in zip(a, b):
+            if tag_a != tag_b:
+                return False
+            if attrs_a is None or attrs_b is None:
+                continue
+            for name in set(attrs_a) & set(attrs_b):
+                if attrs_a[name] != attrs_b[name]:
+                    return False
+
+        return True
+
+
+def _steps(xpath):
+    # Return the steps of an absolute xpath as a list of (element
+    # name, {attribute: value}), with None for predicates other than
+    # attribute equality, or None when the xpath is not a simple
+    # location path.
+    steps = []
+    step = []
+    quote = None
+    depth = 0
+    for c in xpath.rstrip('/'):
+        if quote is not None:
+            if c == quote:
+                quote = None
+        elif c in '\'"':
+            quote = c
+        elif c == '[':
+            depth += 1
+        elif c == ']':
+            depth -= 1
+        elif c == '/' and not depth:
+            steps.append(''.join(step))
+            step = []
+            continue
+        step.append(c)
+    steps.append(''.join(step))
+
+    if quote is not None or depth or steps[0] != '':
+        return None
+
+    parsed = []
+    for step in steps[1:]:
+        x = _step_re.match(step)
+        if x is None:
+            # //, *, .., functions, unions
+            return None
+        tag, predicates = x.groups()
+        attrs = {}
+        pos = 0
+        while pos < len(predicates):
+            x = _predicate_re.match(predicates, pos)
+            if x is None:
+                attrs = None
+                break
+            attrs[x.group(1)] = x.group(2) if x.group(3) is None \
+                else x.group(3)
+            pos = x.end()
+        parsed.append((tag, attrs))
+
+    return parsed
+
+
+if __name__ == '__main__':
+    # python -m pan.cache tag xpath
+    import pan.xapi
+    import pan.cache
+
+    if len(sys.argv) < 3:
+        print('usage: python -m pan.cache tag xpath', file=sys.stderr)
+        sys.exit(1)
+
+    cache = pan.cache.PanXapiCache()
+    try:
+        xapi = pan.xapi.PanXapi(tag=sys.argv[1], keepalive=True,
+                                cache=cache)
+        for i in range(3):
+            start = time.time()
+            xapi.get(xpath=sys.argv[2])
+            print('get: %.3f seconds' % (time.time() - start))
+    except pan.xapi.PanXapiError as msg:
+        print('pan.xapi.PanXapi:', msg, file=sys.stderr)
+        sys.exit(1)
+    print('hits %d misses %d' % (cache.hits, cache.misses))
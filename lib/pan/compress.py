@@ -0,0 +1,257 @@
+#
+# Copyright (c) 2015 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""HTTP response compression
+
+The pan.compress module implements the PanDecodedResponse class,
+which decompresses a gzip or deflate Content-Encoding HTTP response
+body as it is read, and the PanTransferStats class, which counts the
+bytes received on the wire and the decoded bytes for each device.
+The module default_stats is used by PanXapi and PanWFapi objects.
+"""
+
+from __future__ import print_function
+import sys
+import zlib
+import threading
+import logging
+
+from . import DEBUG1, DEBUG2, DEBUG3
+
+# Accept-Encoding request header
+accept_encoding = 'gzip, deflate'
+
+# wire bytes read for each decompress
+_chunk_size = 64 * 1024
+
+_wbits = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'x-gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+
+
+class PanCompressError(Exception):
+    pass
+
+
+class PanTransferStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def __str__(self):
+        with self._lock:
+            return '\n'.join('%s: %s' % (device, self._stats[device])
+                             for device in sorted(self._stats))
+
+    def record(self, device, wire=0, decoded=0, requests=0,
+               compressed=0):
+        with self._lock:
+            if device not in self._stats:
+                self._stats[device] = {
+                    'requests': 0,
+                    'compressed': 0,
+                    'wire': 0,
+                    'decoded': 0,
+                    }
+            x = self._stats[device]
+            x['requests'] += requests
+            x['compressed'] += compressed
+            x['wire'] += wire
+            x['decoded'] += decoded
+
+    def get(self, device):
+        # dictionary with requests, compressed (responses), wire and
+        # decoded (bytes) and ratio (wire / decoded), or None
+        with self._lock:
+            x = self._stats.get(device)
+            if x is not None:
+                x = dict(x)
+                x['ratio'] = (float(x['wire']) / x['decoded']
+                              if x['decoded'] else None)
+            return x
+
+    def devices(self):
+        with self._lock:
+            return sorted(self._stats)
+
+    def clear(self):
+        with self._lock:
+            self._stats = {}
+
+
+# default statistics, shared by all PanXapi and PanWFapi objects
+default_stats = PanTransferStats()
+
+
+class PanDecodedResponse:
+    # Wrap an HTTP response (http.client.HTTPResponse interface) and
+    # return the decoded message body from read().
+    def __init__(self, response, encoding=None, stats=None, device=None):
+        self._log = logging.getLogger(__name__).log
+        self._response = response
+        self.encoding = encoding
+        self.stats = stats
+        self.device = device
+        self.wire = 0
+        self.decoded = 0
+        self._buffer = b''  # decoded bytes from flush()
+        self._offset = 0  # returned from _buffer
+        self._tail = b''  # wire bytes not yet decompressed
+        self._eof = False
+        self._decoder = None
+
+        if encoding is not None:
+            if encoding not in _wbits:
+                raise PanCompressError('Unsupported Content-Encoding: %s' %
+                                       encoding)
+            self._decoder = zlib.decompressobj(_wbits[encoding])
+
+        if self.stats is not None:
+            self.stats.record(self.device, requests=1,
+                              compressed=1 if encoding is not None else 0)
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def info(self):
+        return self._response.info()
+
+    def getcode(self):
+        return self._response.getcode()
+
+    def close(self):
+        self._buffer = b''
+        self._tail = b''
+        self._response.close()
+
+    def read(self, amt=None):
+        if self._decoder is None:
+            if amt is None:
+                data = self._response.read()
+            else:
+                data = self._response.read(amt)
+            self.__count(len(data), len(data))
+            return data
+
+        if amt is None:
+            chunks = [self._buffer[self._offset:]]
+            self._buffer = b''
+            self._offset = 0
+            if not self._eof:
+                chunks.append(self.__decompress(self._response.read()))
+                chunks.append(self.__flush())
+            return b''.join(chunks)
+
+        # At most amt decoded bytes are returned: the input which is
+        # not decompressed is kept for the next read, so the decoded
+        # data for a wire chunk is not held in memory.
+        if self._offset < len(self._buffer):
+            data = self._buffer[self._offset:self._offset + amt]
+            self._offset += len(data)
+            return data
+
+        while not self._eof:
+            if self._tail:
+                data = self.__decompress(b'', amt)
+            else:
+                data = self._response.read(_chunk_size)
+                if not data:
+                    data = self.__flush()
+                    if len(data) > amt:
+                        self._buffer = data
+                        self._offset = amt
+                        data = data[:amt]
+                    return data
+                data = self.__decompress(data, amt)
+            if data:
+                return data
+
+        return b''
+
+    def __decompress(self, data, max_length=0):
+        # decompress the unconsumed input and data
+        wire = len(data)
+        if self._tail:
+            data = self._tail + data
+        try:
+            try:
+                x = self._decoder.decompress(data, max_length)
+            except zlib.error:
+                if not (self.wire == 0 and self.encoding == 'deflate'):
+                    raise
+                # raw deflate without the zlib header
+                self._decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+                x = self._decoder.decompress(data, max_length)
+        except zlib.error as msg:
+            raise PanCompressError('%s decode: %s' % (self.encoding, msg))
+        self._tail = self._decoder.unconsumed_tail
+        self.__count(wire, len(x))
+
+        return x
+
+    def __flush(self):
+        if self._eof:
+            return b''
+        self._eof = True
+        x = self._decoder.flush()
+        self.__count(0, len(x))
+        self._log(DEBUG2, '%s: %s: %d wire bytes, %d decoded bytes',
+                  self.device, self.encoding, self.wire, self.decoded)
+
+        return x
+
+    def __count(self, wire, decoded):
+        self.wire += wire
+        self.decoded += decoded
+        if self.stats is not None and (wire or decoded):
+            self.stats.record(self.device, wire=wire, decoded=decoded)
+
+
+def content_encoding(response):
+    # Content-Encoding of response, None for identity
+    info = response.info()
+    if hasattr(info, 'get'):
+        x = info.get('content-encoding')
+    else:
+        # 2.7 mimetools.Message
+        x = info.getheader('content-encoding')
+    if x is None:
+        return None
+    x = x.strip().lower()
+    if x in ('', 'identity'):
+        return None
+
+    return x
+
+
+if __name__ == '__main__':
+    # python -m pan.compress tag
+    import pan.xapi
+    import pan.compress
+
+    if len(sys.argv) < 2:
+        print('usage: python -m pan.compress tag', file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        xapi = pan.xapi.PanXapi(tag=sys.argv[1])
+        xapi.show()
+    except pan.xapi.PanXapiError as msg:
+        print('pan.xapi.PanXapi:', msg, file=sys.stderr)
+        sys.exit(1)
+    print(pan.compress.default_stats)
@@ -21,6 +21,7 @@ import xml.etree.ElementTree as etree
 from . import __version__, DEBUG1, DEBUG2, DEBUG3
 
 _encoding = 'utf-8'
+_logger = logging.getLogger(__name__)
 _tags_forcelist = set(['entry', 'member'])
 
 
@@ -128,8 +129,9 @@ class PanConfig:
         if not s:
             return None
 
-        self._log(DEBUG3, 'xml: %s', type(s))
-        self._log(DEBUG3, 'xml.decode(): %s', type(s.decode(_encoding)))
+        if _logger.isEnabledFor(DEBUG3):
+            self._log(DEBUG3, 'xml: %s', type(s))
+            self._log(DEBUG3, 'xml.decode(): %s', type(s.decode(_encoding)))
         return s.decode(_encoding)
 
     def python(self, xpath=None):
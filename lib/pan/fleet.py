@@ -0,0 +1,379 @@
+#
+# Copyright (c) 2015 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""Run a PAN-OS XML API request on many devices concurrently
+
+The pan.fleet module implements the PanFleet class.  It performs a
+PanXapi method, such as op(), show() or export(), on a list of
+.panrc tags or hostnames, or on a list of firewall serial numbers
+through Panorama, using a bounded pool of worker threads, and returns
+a PanFleetResult for each device as it completes.
+"""
+
+from __future__ import print_function
+import sys
+import math
+import time
+import threading
+import logging
+try:
+    # 3.0
+    import queue
+except ImportError:
+    # 2.7
+    import Queue as queue
+
+from . import DEBUG1, DEBUG2, DEBUG3
+import pan.xapi
+import pan.pool
+
+_workers = 8
+
+
+class PanFleetError(Exception):
+    pass
+
+
+class PanFleetResult:
+    def __init__(self, device, xapi=None, result=None, error=None,
+                 elapsed=None):
+        self.device = device
+        self.xapi = xapi
+        self.result = result
+        self.error = error
+        self.elapsed = elapsed
+
+    def __str__(self):
+        return '\n'.join((': '.join((k, str(self.__dict__[k]))))
+                         for k in sorted(self.__dict__))
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class PanFleet:
+    def __init__(self,
+                 tags=None,
+                 hostnames=None,
+                 serials=None,
+                 workers=_workers,
+                 timeout=None,
+                 deadline=None,
+                 pool=None,
+                 **kwargs):
+        self._log = logging.getLogger(__name__).log
+        self.workers = workers
+        self.timeout = timeout
+        self.deadline = deadline
+        self.pool = pool
+        self.xapi_kwargs = kwargs
+
+        self.devices = []
+        if tags is not None:
+            self.devices.extend([('tag', x) for x in tags])
+        if hostnames is not None:
+            self.devices.extend([('hostname', x) for x in hostnames])
+        if serials is not None:
+            if tags is not None or hostnames is not None:
+                raise PanFleetError('serials cannot be used with '
+                                    'tags or hostnames')
+            # requests are sent to Panorama (tag or hostname
+            # argument) with target=serial
+            self.devices.extend([('serial', x) for x in serials])
+        # remove duplicates, keep order
+        seen = set()
+        self.devices = [x for x in self.devices
+                        if not (x in seen or seen.add(x))]
+
+        invalid = ['timeout', 'pool', 'keepalive', 'serial']
+        if serials is None:
+            invalid.extend(['tag', 'hostname'])
+        for x in invalid:
+            if x in self.xapi_kwargs:
+                raise PanFleetError('Invalid PanXapi argument: %s' % x)
+
+        try:
+            self.workers = int(self.workers)
+            if self.workers < 1:
+                raise ValueError
+        except ValueError:
+            raise PanFleetError('Invalid workers: %s' % self.workers)
+
+        for x in ['timeout', 'deadline']:
+            value = getattr(self, x)
+            if value is None:
+                continue
+            try:
+                value = float(value)
+                if value <= 0:
+                    raise ValueError
+            except ValueError:
+                raise PanFleetError('Invalid %s: %s' % (x, value))
+            setattr(self, x, value)
+
+        if self.pool is None:
+            # one pool for all devices; keyed by host.  With serials
+            # all workers use connections to Panorama.
+            self.pool = pan.pool.PanConnectionPool(maxsize=self.workers)
+        if self.xapi_kwargs.get('ssl_context') is None:
+            # the pool is also keyed by SSL context: use one context
+            # for all PanXapi objects so they share connections
+            self.xapi_kwargs['ssl_context'] = \
+                pan.xapi._default_ssl_context()
+
+    def __str__(self):
+        return '\n'.join((': '.join((k, str(self.__dict__[k]))))
+                         for k in sorted(self.__dict__))
+
+    def run(self, method, *args, **kwargs):
+        # method is a PanXapi method name, or a callable which is
+        # called as method(xapi, *args, **kwargs).
+        #
+        # Generator which yields a PanFleetResult for each device in
+        # completion order.  A device which does not complete within
+        # timeout seconds, or before the overall deadline, is
+        # reported with error set.
+        #
+        # At most workers requests are in progress at any time: a
+        # worker whose device timed out is not replaced, and it takes
+        # the next device only after its request has returned.
+        if not self.devices:
+            return
+
+        if not callable(method):
+            if not hasattr(pan.xapi.PanXapi, method):
+                raise PanFleetError('Invalid method: %s' % method)
+
+        start_time = time.time()
+        deadline = None
+        if self.deadline is not None:
+            deadline = start_time + self.deadline
+
+        xapi_kwargs = self.xapi_kwargs
+        if self.devices[0][0] == 'serial':
+            xapi_kwargs = self.__panorama_keygen(deadline)
+
+        work = queue.Queue()
+        done = queue.Queue()
+        for device in self.devices:
+            work.put(device)
+
+        lock = threading.Lock()
+        running = {}    # device: start time
+        finished = set()
+        stop = threading.Event()
+
+        def worker():
+            while not stop.is_set():
+                try:
+                    device = work.get_nowait()
+                except queue.Empty:
+                    return
+                with lock:
+                    running[device] = time.time()
+                result = self.__run_device(device, xapi_kwargs,
+                                           method, args, kwargs,
+                                           deadline)
+                done.put((device, result))
+
+        nworkers = min(self.workers, len(self.devices))
+        self._log(DEBUG1, 'fleet: %d devices, %d workers',
+                  len(self.devices), nworkers)
+        for i in range(nworkers):
+            t = threading.Thread(target=worker)
+            t.daemon = True
+            t.start()
+
+        try:
+            while len(finished) < len(self.devices):
+                now = time.time()
+                wait = self.__next_expiry(running, lock, deadline)
+                if wait is not None:
+                    wait = max(wait - now, 0)
+
+                try:
+                    device, result = done.get(timeout=wait)
+                except queue.Empty:
+                    device = None
+
+                if device is not None:
+                    with lock:
+                        running.pop(device, None)
+                    if device in finished:
+                        # already reported as timed out
+                        continue
+                    finished.add(device)
+                    yield result
+                    continue
+
+                now = time.time()
+                if deadline is not None and now >= deadline:
+                    stop.set()
+                    for x in self.devices:
+                        if x in finished:
+                            continue
+                        finished.add(x)
+                        with lock:
+                            started = running.get(x)
+                        elapsed = None
+                        if started is not None:
+                            elapsed = now - started
+                        yield PanFleetResult(
+                            device=x[1], elapsed=elapsed,
+                            error=PanFleetError('deadline exceeded '
+                                                '(%.2f seconds)' %
+                                                self.deadline))
+                    return
+
+                for x, started in self.__expired(running, lock, now):
+                    if x in finished:
+                        continue
+                    finished.add(x)
+                    # the worker remains busy until the request
+                    # returns (limited by the PanXapi timeout)
+                    self._log(DEBUG1, 'fleet: %s: timeout', x[1])
+                    yield PanFleetResult(
+                        device=x[1], elapsed=now - started,
+                        error=PanFleetError('timeout (%.2f seconds)' %
+                                            self.timeout))
+        finally:
+            # generator closed or exhausted
+            stop.set()
+
+    def run_all(self, method, *args, **kwargs):
+        # run() and return a dictionary of PanFleetResult keyed by
+        # tag, hostname or serial
+        results = {}
+        for r in self.run(method, *args, **kwargs):
+            results[r.device] = r
+
+        return results
+
+    def __panorama_keygen(self, deadline):
+        # one API key for all serials; otherwise each PanXapi object
+        # without api_key would perform keygen
+        timeout = self.__xapi_timeout(time.time(), deadline)
+        try:
+            xapi = pan.xapi.PanXapi(timeout=timeout,
+                                    pool=self.pool,
+                                    **self.xapi_kwargs)
+            if xapi.api_key is None:
+                xapi.keygen()
+        except pan.xapi.PanXapiError as msg:
+            raise PanFleetError('Panorama keygen: %s' % msg)
+
+        self._log(DEBUG1, 'fleet: %s: using one API key for %d serials',
+                  xapi.hostname, len(self.devices))
+
+        xapi_kwargs = dict(self.xapi_kwargs)
+        xapi_kwargs['api_key'] = xapi.api_key
+        xapi_kwargs['hostname'] = xapi.hostname
+        xapi_kwargs['port'] = xapi.port
+        xapi_kwargs['use_http'] = xapi.uri.startswith('http:')
+        xapi_kwargs.pop('tag', None)
+        xapi_kwargs.pop('api_username', None)
+        xapi_kwargs.pop('api_password', None)
+
+        return xapi_kwargs
+
+    def __xapi_timeout(self, start, deadline):
+        # socket timeout: per-device timeout, limited by the time
+        # remaining to the deadline
+        timeout = self.timeout
+        if deadline is not None:
+            remaining = max(deadline - start, 0)
+            if timeout is None or remaining < timeout:
+                timeout = remaining
+        if timeout is not None:
+            # PanXapi timeout is whole seconds
+            timeout = max(int(math.ceil(timeout)), 1)
+
+        return timeout
+
+    def __next_expiry(self, running, lock, deadline):
+        expiry = deadline
+        if self.timeout is not None:
+            with lock:
+                if running:
+                    x = min(running.values()) + self.timeout
+                    if expiry is None or x < expiry:
+                        expiry = x
+
+        return expiry
+
+    def __expired(self, running, lock, now):
+        if self.timeout is None:
+            return []
+        with lock:
+            expired = [(x, started) for x, started in running.items()
+                       if now - started >= self.timeout]
+            for x, started in expired:
+                del running[x]
+
+        return expired
+
+    def __run_device(self, device, xapi_kwargs, method, args, kwargs,
+                     deadline):
+        kind, name = device
+        start = time.time()
+
+        if deadline is not None and start >= deadline:
+            return PanFleetResult(device=name,
+                                  error=PanFleetError('deadline exceeded'))
+        timeout = self.__xapi_timeout(start, deadline)
+
+        xapi = None
+        try:
+            xapi_kwargs = dict(xapi_kwargs)
+            xapi_kwargs[kind] = name
+            xapi = pan.xapi.PanXapi(timeout=timeout,
+                                    pool=self.pool,
+                                    **xapi_kwargs)
+            if callable(method):
+                result = method(xapi, *args, **kwargs)
+            else:
+                result = getattr(xapi, method)(*args, **kwargs)
+        except Exception as msg:
+            # PanXapiError, or any error from a callable method
+            elapsed = time.time() - start
+            self._log(DEBUG2, 'fleet: %s: %s (%.2f seconds)',
+                      name, msg, elapsed)
+            return PanFleetResult(device=name, xapi=xapi, error=msg,
+                                  elapsed=elapsed)
+
+        elapsed = time.time() - start
+        self._log(DEBUG2, 'fleet: %s: %s (%.2f seconds)',
+                  name, xapi.status, elapsed)
+
+        return PanFleetResult(device=name, xapi=xapi, result=result,
+                              elapsed=elapsed)
+
+
+if __name__ == '__main__':
+    # python -m pan.fleet tag [tag ...]
+    import pan.fleet
+
+    if len(sys.argv) < 2:
+        print('usage: python -m pan.fleet tag [tag ...]', file=sys.stderr)
+        sys.exit(1)
+
+    fleet = pan.fleet.PanFleet(tags=sys.argv[1:], timeout=10, deadline=60)
+    for r in fleet.run('op', cmd='show system info', cmd_xml=True):
+        if r.ok:
+            print('%s: %s (%.2f)' % (r.device, r.xapi.status, r.elapsed))
+        else:
+            print('%s: %s' % (r.device, r.error), file=sys.stderr)
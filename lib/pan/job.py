@@ -0,0 +1,414 @@
+#
+# Copyright (c) 2015 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""PAN-OS job handles and job tracker
+
+The pan.job module implements the PanJob class, a handle for a job
+on a device (for example a commit) returned by PanXapi.commit(), and
+the PanJobTracker class, which monitors many jobs using one
+``show jobs all`` request per device for each poll.
+"""
+
+from __future__ import print_function
+import sys
+import time
+import threading
+import logging
+try:
+    # 3.2, or futures package for 2.7
+    from concurrent.futures import Future
+except ImportError:
+    Future = None
+
+from . import DEBUG1, DEBUG2, DEBUG3
+import pan.xapi
+import pan.pool
+import pan.poll
+
+# successful polls which may not include a tracked job before it is
+# finished with an error
+_missing_polls = 2
+# consecutive failed polls of a device before its jobs are finished
+# with the error
+_max_errors = 3
+
+
+class PanJobError(Exception):
+    pass
+
+
+class PanJob:
+    def __init__(self, id, type=None, xapi=None):
+        self._log = logging.getLogger(__name__).log
+        self.id = id
+        self.type = type
+        self.xapi = xapi
+        self.device = None
+        if xapi is not None:
+            self.device = (xapi.hostname, xapi.serial)
+        self.status = None
+        self.result = None
+        self.progress = None
+        self.details = None
+        self.error = None
+        self.start_time = time.time()
+        self.end_time = None
+        self.future = Future() if Future is not None else None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def __str__(self):
+        return '\n'.join((': '.join((k, str(self.__dict__[k]))))
+                         for k in sorted(self.__dict__)
+                         if not k.startswith('_'))
+
+    @property
+    def elapsed(self):
+        end = self.end_time if self.end_time is not None else time.time()
+        return end - self.start_time
+
+    def done(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        # return True when the job finished
+        self._event.wait(timeout)
+        return self._event.is_set()
+
+    def add_done_callback(self, fn):
+        # fn(job) is called when the job finishes, from the thread
+        # which updates the job
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def update(self, elem):
+        # update from a <job> element (show jobs id/all response)
+        x = elem.findtext('status')
+        if x is not None:
+            self.status = x
+        x = elem.findtext('result')
+        if x is not None:
+            self.result = x
+        x = elem.findtext('progress')
+        if x is not None:
+            try:
+                self.progress = int(x)
+            except ValueError:
+                pass
+        details = elem.findall('details/line')
+        if details:
+            self.details = [''.join(x.itertext()) for x in details]
+
+        self._log(DEBUG3, 'job %s %s: status %s progress %s',
+                  self.device, self.id, self.status, self.progress)
+
+        if self.status == 'FIN':
+            self._finish()
+
+    def _finish(self, error=None):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.error = error
+            self.end_time = time.time()
+            self._event.set()
+            callbacks = self._callbacks
+            self._callbacks = []
+
+        self._log(DEBUG1, 'job %s %s: %s %s (%.2f seconds)',
+                  self.device, self.id, self.result, self.error,
+                  self.elapsed)
+
+        if self.future is not None:
+            if error is None:
+                self.future.set_result(self)
+            else:
+                self.future.set_exception(PanJobError(error))
+
+        for fn in callbacks:
+            try:
+                fn(self)
+            except Exception as msg:
+                self._log(DEBUG1, 'job %s %s: callback: %s',
+                          self.device, self.id, msg)
+
+
+class PanJobTracker:
+    def __init__(self, poll=None, timeout=None):
+        self._log = logging.getLogger(__name__).log
+        self.poll = poll
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._devices = {}
+        self._thread = None
+        self._stop = False
+
+        if self.poll is None:
+            self.poll = pan.poll.PanPollBackoff()
+        elif not isinstance(self.poll, pan.poll.PanPollStrategy):
+            raise PanJobError('poll not PanPollStrategy')
+
+        if self.timeout is not None:
+            try:
+                self.timeout = float(self.timeout)
+                if self.timeout <= 0:
+                    raise ValueError
+            except ValueError:
+                raise PanJobError('Invalid timeout: %s' % self.timeout)
+
+    def __str__(self):
+        return '\n'.join((': '.join((k, str(self.__dict__[k]))))
+                         for k in sorted(self.__dict__))
+
+    def track(self, job, callback=None):
+        if job.xapi is None:
+            raise PanJobError('job %s has no PanXapi object' % job.id)
+        if callback is not None:
+            job.add_done_callback(callback)
+
+        key = self._key(job.xapi)
+        with self._lock:
+            if key not in self._devices:
+                self._devices[key] = _Device(self._xapi(job.xapi),
+                                             self.poll)
+            device = self._devices[key]
+            device.jobs[job.id] = job
+            if device.next_time is None:
+                device.next_time = time.time() + \
+                    device.poller.next_interval()
+            self._wakeup.notify()
+
+        self._log(DEBUG2, 'track job %s %s', job.device, job.id)
+
+        return job
+
+    @staticmethod
+    def _key(xapi):
+        return (xapi.uri, xapi.serial)
+
+    @staticmethod
+    def _xapi(xapi):
+        # PanXapi object for the tracker thread; the caller can
+        # continue to use its object
+        pool = xapi.pool
+        if not isinstance(pool, pan.pool.PanConnectionPool):
+            # pan.aioxapi.AsyncPanConnectionPool
+            pool = None
+        return pan.xapi.PanXapi(api_key=xapi.api_key,
+                                hostname=xapi.hostname,
+                                port=xapi.port,
+                                serial=xapi.serial,
+                                use_http=xapi.uri.startswith('http:'),
+                                use_get=xapi.use_get,
+                                timeout=xapi.timeout,
+                                ssl_context=xapi.ssl_context,
+                                pool=pool)
+
+    def jobs(self):
+        with self._lock:
+            return [job for device in self._devices.values()
+                    for job in device.jobs.values()]
+
+    def poll_once(self, now=None):
+        # poll the devices with jobs which are due; return the number
+        # of seconds until the next poll, or None when there are no
+        # jobs
+        if now is None:
+            now = time.time()
+        with self._lock:
+            due = [x for x in self._devices.values()
+                   if x.jobs and x.next_time <= now]
+
+        for device in due:
+            self.__poll_device(device)
+
+        with self._lock:
+            for key in list(self._devices.keys()):
+                if not self._devices[key].jobs:
+                    del self._devices[key]
+            if not self._devices:
+                return None
+            next_time = min(x.next_time for x in self._devices.values())
+
+        return max(next_time - time.time(), 0)
+
+    def __poll_device(self, device):
+        xapi = device.xapi
+        error = None
+        try:
+            xapi.op(cmd='show jobs all', cmd_xml=True)
+            elems = xapi.element_root.findall('./result/job')
+        except pan.xapi.PanXapiError as msg:
+            self._log(DEBUG1, 'show jobs all %s: %s', xapi.hostname, msg)
+            error = 'show jobs all: %s' % msg
+            elems = None
+
+        with self._lock:
+            jobs = dict(device.jobs)
+
+        if elems is None:
+            device.errors += 1
+            if device.errors >= _max_errors:
+                for job in jobs.values():
+                    job._finish(error)
+        else:
+            device.errors = 0
+            seen = set()
+            for elem in elems:
+                job = jobs.get(elem.findtext('id'))
+                if job is not None:
+                    seen.add(job.id)
+                    device.missing.pop(job.id, None)
+                    job.update(elem)
+            for job in jobs.values():
+                if job.id in seen or job.done():
+                    continue
+                n = device.missing.get(job.id, 0) + 1
+                device.missing[job.id] = n
+                if n >= _missing_polls:
+                    job._finish("job %s not in 'show jobs all' "
+                                'response' % job.id)
+
+        progress = []
+        for job in jobs.values():
+            if (not job.done() and self.timeout is not None and
+                    job.elapsed > self.timeout):
+                job._finish('timeout waiting for job %s completion' %
+                            job.id)
+            if job.done():
+                with self._lock:
+                    device.jobs.pop(job.id, None)
+                device.missing.pop(job.id, None)
+            elif job.progress is not None:
+                progress.append(job.progress)
+
+        # slowest pending job determines the next poll
+        device.poller.update(min(progress) if progress else None)
+        with self._lock:
+            if device.jobs:
+                device.next_time = time.time() + \
+                    device.poller.next_interval()
+            else:
+                device.poller.done()
+                device.poller = self.poll.poller(device.poller.device,
+                                                 'jobs')
+                device.next_time = None
+
+    def start(self):
+        # poll in a background thread
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop = False
+            self._thread = threading.Thread(target=self.__run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread = self._thread
+            self._stop = True
+            self._wakeup.notify()
+        if thread is not None:
+            thread.join()
+        with self._lock:
+            self._thread = None
+
+    def __run(self):
+        while True:
+            wait = self.poll_once()
+            with self._lock:
+                if self._stop:
+                    return
+                self._wakeup.wait(wait)
+                if self._stop:
+                    return
+
+    def wait(self, jobs=None, timeout=None):
+        # wait for jobs (default all tracked jobs); return True when
+        # all finished.  Without start() the jobs are polled from
+        # this thread.
+        if jobs is None:
+            jobs = self.jobs()
+        end = None
+        if timeout is not None:
+            end = time.time() + timeout
+
+        while True:
+            pending = [x for x in jobs if not x.done()]
+            if not pending:
+                return True
+            now = time.time()
+            if end is not None and now >= end:
+                return False
+            if self._thread is None:
+                wait = self.poll_once()
+                if wait is None:
+                    # no tracked jobs: the last poll may have
+                    # finished them, otherwise they are not tracked
+                    return all(x.done() for x in jobs)
+                if end is not None:
+                    wait = min(wait, end - now)
+                time.sleep(wait)
+            else:
+                x = None if end is None else end - now
+                pending[0].wait(x)
+
+
+class _Device:
+    def __init__(self, xapi, poll):
+        self.xapi = xapi
+        self.jobs = {}
+        self.poller = poll.poller((xapi.hostname, xapi.serial), 'jobs')
+        self.next_time = None
+        self.missing = {}  # job id: polls without the job
+        self.errors = 0  # consecutive failed polls
+
+
+if __name__ == '__main__':
+    # python -m pan.job tag [tag ...]
+    import pan.job
+
+    if len(sys.argv) < 2:
+        print('usage: python -m pan.job tag [tag ...]', file=sys.stderr)
+        sys.exit(1)
+
+    tracker = pan.job.PanJobTracker()
+    tracker.start()
+
+    def finished(job):
+        print('%s: job %s %s %s (%.2f seconds)' %
+              (job.device[0], job.id, job.status, job.result, job.elapsed))
+
+    try:
+        for tag in sys.argv[1:]:
+            xapi = pan.xapi.PanXapi(tag=tag, keepalive=True)
+            job = xapi.commit(cmd='<commit></commit>')
+            if job is None:
+                print('%s: %s' % (tag, xapi.status_detail))
+                continue
+            tracker.track(job, callback=finished)
+    except pan.xapi.PanXapiError as msg:
+        print('pan.xapi.PanXapi:', msg, file=sys.stderr)
+        sys.exit(1)
+
+    tracker.wait()
+    tracker.stop()
@@ -0,0 +1,161 @@
+#
+# Copyright (c) 2015 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""Persistent API key cache
+
+The pan.keycache module implements the PanKeyCache class, an on-disk
+cache of API keys keyed by hostname, user and target (serial).  A
+PanXapi object with api_username and api_password uses a cached key
+instead of performing keygen, and performs keygen again when the
+cached key fails authentication.
+"""
+
+from __future__ import print_function
+import sys
+import os
+import stat
+import json
+import threading
+import logging
+
+from . import DEBUG1, DEBUG2, DEBUG3
+
+_path = '~/.pankeys'
+
+
+class PanKeyCacheError(Exception):
+    pass
+
+
+class PanKeyCache:
+    def __init__(self, path=None):
+        self._log = logging.getLogger(__name__).log
+        self.path = path
+        self._lock = threading.Lock()
+
+        if self.path is None:
+            self.path = os.path.expanduser(_path)
+
+    def __str__(self):
+        return '\n'.join((': '.join((k, str(self.__dict__[k]))))
+                         for k in sorted(self.__dict__))
+
+    @staticmethod
+    def _match(entry, hostname, api_username, serial):
+        return (entry.get('hostname') == hostname and
+                entry.get('api_username') == api_username and
+                entry.get('serial') == serial)
+
+    def get(self, hostname, api_username, serial=None):
+        with self._lock:
+            entries = self.__load()
+        for x in entries:
+            if self._match(x, hostname, api_username, serial):
+                self._log(DEBUG1, 'key cache %s: %s %s %s: found',
+                          self.path, hostname, api_username, serial)
+                return x.get('api_key')
+
+        return None
+
+    def put(self, hostname, api_username, serial=None, api_key=None):
+        # api_key None: remove the entry
+        with self._lock:
+            entries = [x for x in self.__load()
+                       if not self._match(x, hostname, api_username,
+                                          serial)]
+            if api_key is not None:
+                entries.append({
+                    'hostname': hostname,
+                    'api_username': api_username,
+                    'serial': serial,
+                    'api_key': api_key,
+                    })
+            self.__save(entries)
+
+        self._log(DEBUG1, 'key cache %s: %s %s %s: %s',
+                  self.path, hostname, api_username, serial,
+                  'saved' if api_key is not None else 'removed')
+
+    def delete(self, hostname, api_username, serial=None):
+        self.put(hostname, api_username, serial, None)
+
+    def __load(self):
+        try:
+            with open(self.path, 'r') as f:
+                st = os.fstat(f.fileno())
+                if st.st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+                    # like ssh, don't use keys others can read
+                    self._log(DEBUG1, 'key cache %s: mode %o, ignored',
+                              self.path, stat.S_IMODE(st.st_mode))
+                    return []
+                x = json.load(f)
+        except IOError as msg:
+            # 2.7 IOError, 3.3 OSError
+            self._log(DEBUG2, 'key cache %s: %s', self.path, msg)
+            return []
+        except ValueError as msg:
+            self._log(DEBUG1, 'key cache %s: %s', self.path, msg)
+            return []
+
+        if not isinstance(x, dict) or not isinstance(x.get('keys'), list):
+            self._log(DEBUG1, 'key cache %s: invalid format', self.path)
+            return []
+
+        return [e for e in x['keys'] if isinstance(e, dict)]
+
+    def __save(self, entries):
+        # write a temporary file created with mode 0600 and rename
+        # it so readers never see a partial file
+        tmp = '%s.%d.tmp' % (self.path, os.getpid())
+        try:
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                         stat.S_IRUSR | stat.S_IWUSR)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'keys': entries}, f, indent=1, sort_keys=True)
+                f.write('\n')
+            if hasattr(os, 'replace'):
+                os.replace(tmp, self.path)
+            else:
+                # 2.7
+                os.rename(tmp, self.path)
+        except (IOError, OSError) as msg:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise PanKeyCacheError('%s: %s' % (self.path, msg))
+
+
+if __name__ == '__main__':
+    # python -m pan.keycache tag
+    import time
+    import pan.xapi
+    import pan.keycache
+
+    if len(sys.argv) < 2:
+        print('usage: python -m pan.keycache tag', file=sys.stderr)
+        sys.exit(1)
+
+    cache = pan.keycache.PanKeyCache()
+    try:
+        for i in range(2):
+            start = time.time()
+            xapi = pan.xapi.PanXapi(tag=sys.argv[1], key_cache=cache)
+            xapi.op(cmd='show system info', cmd_xml=True)
+            print('%s: %.3f seconds' % (xapi.status, time.time() - start))
+    except pan.xapi.PanXapiError as msg:
+        print('pan.xapi.PanXapi:', msg, file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,276 @@
+#
+# Copyright (c) 2015 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""Time-sliced parallel log retrieval
+
+The pan.logquery module implements the PanLogQuery class.  It splits
+a log query over a time range into receive_time windows, retrieves
+the logs for each window with a concurrent type=log job on the
+device, and merges the entries in time order.
+"""
+
+from __future__ import print_function
+import sys
+import time
+import calendar
+import datetime
+import threading
+import logging
+try:
+    # 3.0
+    import queue
+except ImportError:
+    # 2.7
+    import Queue as queue
+
+import xml.etree.ElementTree as etree
+
+from . import DEBUG1, DEBUG2, DEBUG3
+import pan.xapi
+import pan.pool
+
+_windows = 4
+_workers = 4
+_time_format = '%Y/%m/%d %H:%M:%S'
+
+
+class PanLogQueryError(Exception):
+    pass
+
+
+class PanLogQuery:
+    def __init__(self,
+                 windows=_windows,
+                 workers=_workers,
+                 pool=None,
+                 **kwargs):
+        self._log = logging.getLogger(__name__).log
+        self.windows = windows
+        self.workers = workers
+        self.pool = pool
+        self.xapi_kwargs = kwargs
+
+        for x in ['windows', 'workers']:
+            value = getattr(self, x)
+            try:
+                value = int(value)
+                if value < 1:
+                    raise ValueError
+            except ValueError:
+                raise PanLogQueryError('Invalid %s: %s' % (x, value))
+            setattr(self, x, value)
+
+        for x in ['pool', 'keepalive']:
+            if x in self.xapi_kwargs:
+                raise PanLogQueryError('Invalid PanXapi argument: %s' % x)
+
+        if self.pool is None:
+            self.pool = pan.pool.PanConnectionPool(maxsize=self.workers)
+        if self.xapi_kwargs.get('ssl_context') is None:
+            # the pool is also keyed by SSL context: use one context
+            # for all windows so they share connections
+            self.xapi_kwargs['ssl_context'] = \
+                pan.xapi._default_ssl_context()
+
+    def __str__(self):
+        return '\n'.join((': '.join((k, str(self.__dict__[k]))))
+                         for k in sorted(self.__dict__))
+
+    def plan(self, start, end):
+        # Return a list of (start, end) PAN-OS time strings which
+        # cover start to end inclusive with one second resolution;
+        # windows do not overlap.
+        start = self._seconds(start)
+        end = self._seconds(end)
+        if end < start:
+            raise PanLogQueryError('end before start')
+
+        total = end - start + 1
+        n = min(self.windows, total)
+        size, extra = divmod(total, n)
+
+        windows = []
+        t = start
+        for i in range(n):
+            t2 = t + size + (1 if i < extra else 0)
+            windows.append((self._time_str(t), self._time_str(t2 - 1)))
+            t = t2
+
+        return windows
+
+    @staticmethod
+    def _seconds(x):
+        # PAN-OS time string or datetime to seconds.  Times are in
+        # the device time zone and only used for arithmetic, so they
+        # are converted as UTC to avoid local DST changes.
+        if isinstance(x, datetime.datetime):
+            return calendar.timegm(x.timetuple())
+        try:
+            return calendar.timegm(time.strptime(x, _time_format))
+        except (TypeError, ValueError):
+            raise PanLogQueryError('Invalid time: %s' % x)
+
+    @staticmethod
+    def _time_str(seconds):
+        return time.strftime(_time_format, time.gmtime(seconds))
+
+    @staticmethod
+    def window_filter(window, filter=None):
+        start, end = window
+        s = "(receive_time geq '%s') and (receive_time leq '%s')" % \
+            (start, end)
+        if filter:
+            s = '(%s) and %s' % (filter, s)
+
+        return s
+
+    def log(self, log_type=None, start=None, end=None, filter=None,
+            page_size=None, interval=None, timeout=None, extra_qs=None):
+        # Return a list of log entry elements from start to end,
+        # newest first.
+        windows = self.plan(start, end)
+        xapi_kwargs = self.__keygen()
+
+        work = queue.Queue()
+        for i, window in enumerate(windows):
+            work.put((i, window))
+        results = [None] * len(windows)
+        errors = []
+        stop = threading.Event()
+
+        def worker():
+            while not stop.is_set():
+                try:
+                    i, window = work.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    results[i] = self.__log_window(xapi_kwargs, log_type,
+                                                   window, filter,
+                                                   page_size, interval,
+                                                   timeout, extra_qs)
+                except pan.xapi.PanXapiError as msg:
+                    errors.append('%s to %s: %s' %
+                                  (window[0], window[1], msg))
+                    stop.set()
+
+        nworkers = min(self.workers, len(windows))
+        self._log(DEBUG1, 'log query: %d windows, %d workers',
+                  len(windows), nworkers)
+        threads = []
+        for i in range(nworkers):
+            t = threading.Thread(target=worker)
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+
+        if errors:
+            raise PanLogQueryError(errors[0])
+
+        return self.merge(results)
+
+    @staticmethod
+    def merge(results):
+        # Merge lists of entries in receive_time order, newest first,
+        # and remove duplicate entries.  sort() is stable, so entries
+        # with the same receive_time keep the device order.
+        seen = set()
+        entries = []
+        for x in results:
+            for entry in x:
+                key = PanLogQuery._entry_key(entry)
+                if key in seen:
+                    continue
+                seen.add(key)
+                entries.append(entry)
+
+        entries.sort(key=lambda x: x.findtext('receive_time') or '',
+                     reverse=True)
+
+        return entries
+
+    @staticmethod
+    def _entry_key(entry):
+        # seqno is unique per device log type
+        seqno = entry.findtext('seqno')
+        if seqno is not None:
+            return (entry.findtext('serial'), entry.findtext('type'),
+                    seqno)
+        logid = entry.get('logid')
+        if logid is not None:
+            return logid
+
+        return etree.tostring(entry)
+
+    def __keygen(self):
+        # one API key for all windows
+        kwargs = dict(self.xapi_kwargs)
+        try:
+            xapi = pan.xapi.PanXapi(pool=self.pool, **kwargs)
+            if xapi.api_key is None:
+                xapi.keygen()
+        except pan.xapi.PanXapiError as msg:
+            raise PanLogQueryError(str(msg))
+
+        kwargs['api_key'] = xapi.api_key
+
+        return kwargs
+
+    def __log_window(self, xapi_kwargs, log_type, window, filter,
+                     page_size, interval, timeout, extra_qs):
+        start = time.time()
+        xapi = pan.xapi.PanXapi(pool=self.pool, **xapi_kwargs)
+        query = self.window_filter(window, filter)
+        self._log(DEBUG2, 'log query: %s', query)
+
+        entries = list(xapi.iter_logs(log_type=log_type,
+                                      filter=query,
+                                      page_size=page_size,
+                                      interval=interval,
+                                      timeout=timeout,
+                                      extra_qs=extra_qs))
+
+        self._log(DEBUG1, 'log query: %s to %s: %d entries '
+                  '(%.2f seconds)', window[0], window[1], len(entries),
+                  time.time() - start)
+
+        return entries
+
+
+if __name__ == '__main__':
+    # python -m pan.logquery tag start end [log-type]
+    import pan.logquery
+
+    if len(sys.argv) < 4:
+        print('usage: python -m pan.logquery tag start end [log-type]',
+              file=sys.stderr)
+        sys.exit(1)
+    log_type = 'traffic'
+    if len(sys.argv) > 4:
+        log_type = sys.argv[4]
+
+    try:
+        q = pan.logquery.PanLogQuery(tag=sys.argv[1])
+        entries = q.log(log_type=log_type, start=sys.argv[2],
+                        end=sys.argv[3])
+    except pan.logquery.PanLogQueryError as msg:
+        print('pan.logquery.PanLogQuery:', msg, file=sys.stderr)
+        sys.exit(1)
+    print('%d entries' % len(entries))
+    for entry in entries[:10]:
+        print(entry.findtext('receive_time'))
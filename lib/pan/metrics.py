@@ -0,0 +1,242 @@
+#
+# Copyright (c) 2015 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""Request instrumentation
+
+The pan.metrics module implements the PanMetrics class, a registry
+which receives a PanRequestMetrics object for each API request made
+by a PanXapi or PanWFapi object with a metrics argument.  The phase
+timings and byte counts are aggregated in histograms for each host,
+API type and action, and are passed to hook functions.
+"""
+
+from __future__ import print_function
+import sys
+import time
+import json
+import threading
+import logging
+
+from . import DEBUG1, DEBUG2, DEBUG3
+
+# request phases, in order
+PHASES = ('connect', 'tls', 'wait', 'download', 'parse', 'tree', 'total')
+# byte counts
+SIZES = ('request_bytes', 'response_bytes', 'decoded_bytes')
+
+# histogram bucket upper bounds: seconds 1ms to 131s, bytes 256
+# to 1GB
+_time_buckets = tuple(0.001 * 2 ** i for i in range(18))
+_size_buckets = tuple(256 * 4 ** i for i in range(12))
+
+
+class PanMetricsError(Exception):
+    pass
+
+
+class PanRequestMetrics:
+    # One API request: phase times in seconds (None when not
+    # measured) and byte counts.
+    def __init__(self, api, hostname, type=None, action=None):
+        self.api = api
+        self.hostname = hostname
+        self.type = type
+        self.action = action
+        self.start = time.time()
+        self.reused = None  # pool connection reused
+        self.http_code = None
+        self.status = None
+        self.error = None
+        for x in PHASES:
+            setattr(self, x, None)
+        for x in SIZES:
+            setattr(self, x, None)
+        self._mark = self.start
+
+    def __str__(self):
+        return '\n'.join((': '.join((k, str(self.__dict__[k]))))
+                         for k in sorted(self.__dict__)
+                         if not k.startswith('_'))
+
+    def key(self):
+        return (self.hostname, self.api, self.type, self.action)
+
+    def mark(self, phase):
+        # set phase to the time since the previous mark
+        now = time.time()
+        setattr(self, phase, now - self._mark)
+        self._mark = now
+
+    def finish(self):
+        self.total = time.time() - self.start
+
+    def dict(self):
+        return dict((k, v) for k, v in self.__dict__.items()
+                    if not k.startswith('_'))
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last: overflow
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        i = 0
+        for i, x in enumerate(self.buckets):
+            if value <= x:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        # upper bound of the bucket containing the quantile
+        if not self.count:
+            return None
+        n = q * self.count
+        total = 0
+        for i, x in enumerate(self.counts):
+            total += x
+            if total >= n:
+                if i < len(self.buckets):
+                    return min(self.buckets[i], self.max)
+                return self.max
+
+    def dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.sum / float(self.count) if self.count else None,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'buckets': [[x, n] for x, n in
+                        zip(list(self.buckets) + [None], self.counts)
+                        if n],
+            }
+
+
+class PanMetrics:
+    def __init__(self, hooks=None):
+        self._log = logging.getLogger(__name__).log
+        self._lock = threading.Lock()
+        self._histograms = {}  # (hostname, api, type, action): {name: }
+        self.hooks = []
+        if hooks is not None:
+            for x in hooks:
+                self.add_hook(x)
+
+    def __str__(self):
+        return self.json(indent=1)
+
+    def add_hook(self, func):
+        # func(PanRequestMetrics) is called for each request
+        if not callable(func):
+            raise PanMetricsError('hook not callable: %s' % func)
+        self.hooks.append(func)
+
+    def remove_hook(self, func):
+        self.hooks.remove(func)
+
+    def record(self, x):
+        # aggregate a finished request and call the hooks
+        with self._lock:
+            for name in PHASES + SIZES:
+                value = getattr(x, name)
+                if value is not None:
+                    self.__observe(x.key(), name, value)
+
+        self._log(DEBUG2, 'metrics %s: total %s wait %s download %s '
+                  'parse %s', x.key(), x.total, x.wait, x.download,
+                  x.parse)
+
+        for func in self.hooks:
+            func(x)
+
+    def observe(self, x, name, value):
+        # a value measured after the request was recorded
+        with self._lock:
+            self.__observe(x.key(), name, value)
+
+    def __observe(self, key, name, value):
+        histograms = self._histograms.setdefault(key, {})
+        if name not in histograms:
+            histograms[name] = _Histogram(_size_buckets if name in SIZES
+                                          else _time_buckets)
+        histograms[name].observe(value)
+
+    def histogram(self, hostname, api, type, action, name):
+        # dictionary with count, sum, min, max, mean, p50, p90, p99
+        # and buckets ([upper bound, count], None for overflow), or
+        # None
+        with self._lock:
+            x = self._histograms.get((hostname, api, type, action), {})
+            if name not in x:
+                return None
+            return x[name].dict()
+
+    def dict(self):
+        # list of {hostname, api, type, action, histograms: {name: }}
+        with self._lock:
+            return [{
+                'hostname': key[0],
+                'api': key[1],
+                'type': key[2],
+                'action': key[3],
+                'histograms': dict((name, x.dict())
+                                   for name, x in histograms.items()),
+                } for key, histograms in sorted(self._histograms.items(),
+                                                key=str)]
+
+    def json(self, indent=None):
+        return json.dumps(self.dict(), indent=indent, sort_keys=True)
+
+    def clear(self):
+        with self._lock:
+            self._histograms = {}
+
+
+if __name__ == '__main__':
+    # python -m pan.metrics tag
+    import pan.xapi
+    import pan.metrics
+
+    if len(sys.argv) < 2:
+        print('usage: python -m pan.metrics tag', file=sys.stderr)
+        sys.exit(1)
+
+    metrics = pan.metrics.PanMetrics()
+    try:
+        xapi = pan.xapi.PanXapi(tag=sys.argv[1], keepalive=True,
+                                metrics=metrics)
+        for i in range(5):
+            xapi.op(cmd='show system info', cmd_xml=True)
+    except pan.xapi.PanXapiError as msg:
+        print('pan.xapi.PanXapi:', msg, file=sys.stderr)
+        sys.exit(1)
+    print(metrics.json(indent=1))
@@ -0,0 +1,212 @@
+#
+# Copyright (c) 2015 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""Job polling strategies
+
+The pan.poll module implements the polling strategies used to wait
+for PAN-OS jobs (commit, log) to finish, and the PanPollStats class
+which keeps job duration statistics for each device.
+
+A strategy is a subclass of PanPollStrategy which implements the
+interval() method.  It returns the number of seconds to wait before
+the next job status request.
+"""
+
+from __future__ import print_function
+import time
+import threading
+import logging
+
+from . import DEBUG1, DEBUG2, DEBUG3
+
+_interval = 0.5
+_max_interval = 5.0
+_factor = 1.5
+
+
+class PanPollError(Exception):
+    pass
+
+
+class PanPollStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def __str__(self):
+        with self._lock:
+            return '\n'.join('%s %s: %s' % (device, job_type,
+                                             self._stats[(device, job_type)])
+                             for device, job_type in sorted(self._stats))
+
+    def record(self, device, job_type, seconds, polls):
+        key = (device, job_type)
+        with self._lock:
+            if key not in self._stats:
+                self._stats[key] = {
+                    'count': 0,
+                    'total': 0.0,
+                    'min': seconds,
+                    'max': seconds,
+                    'polls': 0,
+                    }
+            x = self._stats[key]
+            x['count'] += 1
+            x['total'] += seconds
+            x['min'] = min(x['min'], seconds)
+            x['max'] = max(x['max'], seconds)
+            x['last'] = seconds
+            x['mean'] = x['total'] / x['count']
+            x['polls'] += polls
+
+    def get(self, device, job_type):
+        # dictionary with count, total, min, max, last, mean and
+        # polls, or None
+        with self._lock:
+            x = self._stats.get((device, job_type))
+            if x is not None:
+                x = dict(x)
+            return x
+
+    def devices(self):
+        with self._lock:
+            return sorted(set([x[0] for x in self._stats]))
+
+    def clear(self):
+        with self._lock:
+            self._stats = {}
+
+
+# default statistics, shared by all strategies
+default_stats = PanPollStats()
+
+
+class PanPollStrategy:
+    def __init__(self, stats=None):
+        self.stats = stats
+        if self.stats is None:
+            self.stats = default_stats
+
+    def __str__(self):
+        return '\n'.join((': '.join((k, str(self.__dict__[k]))))
+                         for k in sorted(self.__dict__))
+
+    def interval(self, attempt, elapsed, progress, expected):
+        # attempt: number of previous intervals
+        # elapsed: seconds since the job was started
+        # progress: last job progress (0-100) or None
+        # expected: mean job duration for the device or None
+        raise NotImplementedError
+
+    def poller(self, device, job_type):
+        return PanPoller(self, device, job_type)
+
+    @staticmethod
+    def _float(name, value, zero=False):
+        try:
+            value = float(value)
+            if value < 0 or (value == 0 and not zero):
+                raise ValueError
+        except ValueError:
+            raise PanPollError('Invalid %s: %s' % (name, value))
+
+        return value
+
+
+class PanPollFixed(PanPollStrategy):
+    def __init__(self, interval=_interval, stats=None):
+        PanPollStrategy.__init__(self, stats)
+        self.seconds = self._float('interval', interval, zero=True)
+
+    def interval(self, attempt, elapsed, progress, expected):
+        return self.seconds
+
+
+class PanPollBackoff(PanPollStrategy):
+    def __init__(self, initial=_interval, factor=_factor,
+                 max_interval=_max_interval, stats=None):
+        PanPollStrategy.__init__(self, stats)
+        self.initial = self._float('initial', initial)
+        self.factor = self._float('factor', factor)
+        self.max_interval = self._float('max_interval', max_interval)
+        if self.factor < 1:
+            raise PanPollError('Invalid factor: %s' % factor)
+
+    def interval(self, attempt, elapsed, progress, expected):
+        # cap the exponent to avoid float overflow on long jobs
+        x = self.initial * self.factor ** min(attempt, 64)
+        return min(x, self.max_interval)
+
+
+class PanPollProgress(PanPollBackoff):
+    # Estimate the time remaining from the job progress and the time
+    # elapsed; before progress is available use the mean duration for
+    # the device, then exponential backoff.
+    def __init__(self, min_interval=_interval,
+                 max_interval=_max_interval * 6,
+                 factor=_factor, stats=None):
+        PanPollBackoff.__init__(self, initial=min_interval, factor=factor,
+                                max_interval=max_interval, stats=stats)
+        self.min_interval = self.initial
+
+    def interval(self, attempt, elapsed, progress, expected):
+        if progress is not None and 0 < progress < 100 and elapsed > 0:
+            remaining = elapsed * (100 - progress) / progress
+        elif progress is None and expected is not None and \
+                expected > elapsed:
+            remaining = expected - elapsed
+        else:
+            return PanPollBackoff.interval(self, attempt, elapsed,
+                                           progress, expected)
+
+        return max(self.min_interval, min(remaining, self.max_interval))
+
+
+class PanPoller:
+    # Polling state for one job
+    def __init__(self, strategy, device, job_type):
+        self._log = logging.getLogger(__name__).log
+        self.strategy = strategy
+        self.device = device
+        self.job_type = job_type
+        self.start_time = time.time()
+        self.attempt = 0
+        self.progress = None
+
+        x = self.strategy.stats.get(device, job_type)
+        self.expected = x['mean'] if x is not None else None
+
+    def next_interval(self):
+        elapsed = time.time() - self.start_time
+        interval = self.strategy.interval(self.attempt, elapsed,
+                                          self.progress, self.expected)
+        self.attempt += 1
+        self._log(DEBUG3, '%s %s: poll %d elapsed %.2f progress %s: '
+                  'interval %.2f', self.device, self.job_type,
+                  self.attempt, elapsed, self.progress, interval)
+
+        return interval
+
+    def update(self, progress):
+        if progress is not None:
+            self.progress = progress
+
+    def done(self):
+        elapsed = time.time() - self.start_time
+        self.strategy.stats.record(self.device, self.job_type, elapsed,
+                                   self.attempt)
+        self._log(DEBUG2, '%s %s: finished in %.2f seconds, %d polls',
+                  self.device, self.job_type, elapsed, self.attempt)
@@ -0,0 +1,327 @@
+#
+# Copyright (c) 2015 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""Persistent HTTP connection pool
+
+The pan.pool module implements the PanConnectionPool class.  It
+maintains a pool of persistent HTTP/1.1 (keep-alive) connections for
+each scheme, host, port and SSL context, so API requests to the same
+host do not pay for a TCP and TLS handshake each time.  New HTTPS
+connections resume the last TLS session to the host when supported.
+"""
+
+from __future__ import print_function
+import sys
+import time
+import socket
+import threading
+import logging
+try:
+    import ssl
+except ImportError:
+    raise ValueError('SSL support not available')
+
+try:
+    # 3.2
+    from http.client import HTTPConnection, HTTPSConnection, \
+        HTTPException
+    from urllib.error import URLError
+    from urllib.parse import urlsplit
+except ImportError:
+    # 2.7
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException
+    from urllib2 import URLError
+    from urlparse import urlsplit
+
+from . import DEBUG1, DEBUG2, DEBUG3
+
+_maxsize = 4
+_idle_timeout = 30
+# 3.6: SSLSocket.session, SSLContext.wrap_socket(session=)
+_tls_session = hasattr(ssl, 'SSLSession')
+
+
+class PanConnectionPoolError(Exception):
+    pass
+
+
+class PanConnectionPool:
+    def __init__(self,
+                 maxsize=_maxsize,
+                 idle_timeout=_idle_timeout,
+                 reconnect=True):
+        self._log = logging.getLogger(__name__).log
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.reconnect = reconnect
+        self._lock = threading.Lock()
+        self._pools = {}
+        self._sessions = {}
+
+        try:
+            self.maxsize = int(self.maxsize)
+            if self.maxsize < 0:
+                raise ValueError
+        except ValueError:
+            raise PanConnectionPoolError('Invalid maxsize: %s' %
+                                         self.maxsize)
+
+        if self.idle_timeout is not None:
+            try:
+                self.idle_timeout = float(self.idle_timeout)
+                if self.idle_timeout < 0:
+                    raise ValueError
+            except ValueError:
+                raise PanConnectionPoolError('Invalid idle_timeout: %s' %
+                                             self.idle_timeout)
+
+    def __str__(self):
+        return '\n'.join((': '.join((k, str(self.__dict__[k]))))
+                         for k in sorted(self.__dict__))
+
+    @staticmethod
+    def _key(scheme, host, port, context):
+        # TLS sessions can only be resumed with the same SSL context
+        return (scheme, host, port, context)
+
+    def _get(self, key):
+        # most recently used connection first; close connections
+        # idle longer than idle_timeout
+        now = time.time()
+        with self._lock:
+            idle = self._pools.get(key, [])
+            while idle:
+                conn, last_used = idle.pop()
+                if (self.idle_timeout is not None and
+                        now - last_used > self.idle_timeout):
+                    self._log(DEBUG2, 'pool %s: close idle connection '
+                              '(%.2f seconds)', key, now - last_used)
+                    conn.close()
+                    continue
+                self._log(DEBUG3, 'pool %s: reuse connection', key)
+                return conn, True
+
+        return None, False
+
+    def _put(self, key, conn):
+        if conn.sock is None:
+            # server closed connection (Connection: close)
+            self._log(DEBUG3, 'pool %s: discard closed connection', key)
+            conn.close()
+            return
+
+        with self._lock:
+            # save the session after a response has been read; TLS 1.3
+            # session tickets are sent after the handshake
+            if _tls_session and getattr(conn.sock, 'session', None):
+                self._sessions[key] = conn.sock.session
+
+            idle = self._pools.setdefault(key, [])
+            if len(idle) >= self.maxsize:
+                self._log(DEBUG3, 'pool %s: full, close connection', key)
+                conn.close()
+                return
+            idle.append((conn, time.time()))
+
+    def _new_conn(self, key, timeout):
+        scheme, host, port, context = key
+        kwargs = {}
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        if scheme == 'https':
+            if context is not None:
+                kwargs['context'] = context
+            session = None
+            if _tls_session and context is not None:
+                with self._lock:
+                    session = self._sessions.get(key)
+            conn = _HTTPSConnection(host, port, session=session, **kwargs)
+        elif scheme == 'http':
+            conn = HTTPConnection(host, port, **kwargs)
+        else:
+            raise PanConnectionPoolError('Invalid URL scheme: %s' % scheme)
+
+        self._log(DEBUG2, 'pool %s: new connection', key)
+
+        return conn
+
+    def request(self, method, url, body=None, headers=None,
+                timeout=None, context=None):
+        x = urlsplit(url)
+        scheme = x.scheme
+        host = x.hostname
+        port = x.port
+        path = x.path
+        if x.query:
+            path += '?' + x.query
+        if headers is None:
+            headers = {}
+        key = self._key(scheme, host, port, context)
+
+        conn, reused = self._get(key)
+        if conn is None:
+            conn = self._new_conn(key, timeout)
+        elif timeout is not None:
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+
+        timings = {}
+        try:
+            self.__connect(conn, timings)
+            start = time.time()
+            conn.request(method, path, body, headers)
+            response = conn.getresponse()
+            timings['wait'] = time.time() - start
+        except socket.timeout as e:
+            conn.close()
+            raise URLError(e)
+        except (socket.error, HTTPException) as e:
+            conn.close()
+            if not (reused and self.reconnect):
+                raise URLError(e)
+            # server closed the idle connection (reset, broken pipe,
+            # empty status line); the request was not processed so
+            # it is safe to send it again on a new connection
+            self._log(DEBUG1, 'pool %s: reconnect: %s', key, e)
+            conn = self._new_conn(key, timeout)
+            timings = {}
+            try:
+                self.__connect(conn, timings)
+                start = time.time()
+                conn.request(method, path, body, headers)
+                response = conn.getresponse()
+                timings['wait'] = time.time() - start
+            except (socket.error, HTTPException) as e:
+                conn.close()
+                raise URLError(e)
+
+        return _PooledResponse(self, key, conn, response, timings)
+
+    @staticmethod
+    def __connect(conn, timings):
+        # Connect a new connection before the request to time the
+        # connect (DNS lookup and TCP) and TLS handshake.
+        if conn.sock is not None:
+            timings['reused'] = True
+            return
+        timings['reused'] = False
+        start = time.time()
+        conn.connect()
+        elapsed = time.time() - start
+        tls = getattr(conn, '_tls_time', None)
+        if tls is not None:
+            timings['connect'] = elapsed - tls
+            timings['tls'] = tls
+        else:
+            timings['connect'] = elapsed
+
+    def clear(self):
+        with self._lock:
+            pools = self._pools
+            self._pools = {}
+            self._sessions = {}
+
+        for key in pools:
+            for conn, last_used in pools[key]:
+                conn.close()
+
+    close = clear
+
+
+class _HTTPSConnection(HTTPSConnection):
+    # HTTPSConnection which resumes a previous TLS session and times
+    # the TLS handshake
+    def __init__(self, *args, **kwargs):
+        self._tls_session = kwargs.pop('session', None)
+        self._tls_time = None
+        HTTPSConnection.__init__(self, *args, **kwargs)
+
+    def connect(self):
+        HTTPConnection.connect(self)
+        start = time.time()
+
+        if self._tunnel_host:
+            server_hostname = self._tunnel_host
+        else:
+            server_hostname = self.host
+
+        sock = self.sock
+        if self._tls_session is None:
+            self.sock = self._context.wrap_socket(
+                sock, server_hostname=server_hostname)
+            self._tls_time = time.time() - start
+            return
+
+        try:
+            self.sock = self._context.wrap_socket(
+                sock, server_hostname=server_hostname,
+                session=self._tls_session)
+        except ValueError:
+            # session not valid for this context, full handshake
+            self.sock = self._context.wrap_socket(
+                sock, server_hostname=server_hostname)
+        self._tls_time = time.time() - start
+
+        logging.getLogger(__name__).log(DEBUG2,
+                                        'TLS session reused: %s',
+                                        self.sock.session_reused)
+
+
+class _PooledResponse:
+    # Wrap http.client.HTTPResponse to return the connection to the
+    # pool after the message body has been read.
+    def __init__(self, pool, key, conn, response, timings=None):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self.timings = timings if timings is not None else {}
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def _release(self):
+        if self._conn is not None:
+            conn = self._conn
+            self._conn = None
+            self._pool._put(self._key, conn)
+
+    def read(self, amt=None):
+        if amt is None:
+            data = self._response.read()
+        else:
+            data = self._response.read(amt)
+        if self._response.isclosed():
+            self._release()
+        return data
+
+    def close(self):
+        if self._conn is not None:
+            if self._response.isclosed():
+                self._release()
+            else:
+                # unread body, connection can't be reused
+                self._response.close()
+                self._conn.close()
+                self._conn = None
+
+    def info(self):
+        # 2.7 httplib.HTTPResponse has no info()
+        return self._response.msg
+
+    def getcode(self):
+        return self._response.status
@@ -0,0 +1,238 @@
+#
+# Copyright (c) 2015 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""Per-device request rate limiting
+
+The pan.ratelimit module implements the PanGovernor class, which
+limits the API request rate (token bucket) and the number of
+requests in flight for each device (hostname and serial).  The
+module default_governor is used by all PanXapi and AsyncPanXapi
+objects which do not specify one; it has no limits until configured.
+
+With slow set, the request rate for a device is halved when a
+response takes longer than slow seconds, and increases back to rate
+as responses become fast again.
+"""
+
+from __future__ import print_function
+import sys
+import time
+import threading
+import logging
+
+from . import DEBUG1, DEBUG2, DEBUG3
+
+# rate change for a slow and for a fast response
+_decrease = 0.5
+_increase = 0.1
+# the rate is not reduced below rate * _min_rate
+_min_rate = 0.1
+
+
+class PanGovernorError(Exception):
+    pass
+
+
+def _number(name, value, type=float):
+    try:
+        value = type(value)
+        if value <= 0:
+            raise ValueError
+    except ValueError:
+        raise PanGovernorError('Invalid %s: %s' % (name, value))
+
+    return value
+
+
+class PanGovernor:
+    def __init__(self, rate=None, burst=None, max_in_flight=None,
+                 slow=None):
+        self._log = logging.getLogger(__name__).log
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+        self._devices = {}
+        self.configure(rate, burst, max_in_flight, slow)
+
+    def __str__(self):
+        with self._lock:
+            return '\n'.join('%s: %s' % (key, self._devices[key])
+                             for key in sorted(self._devices,
+                                               key=str))
+
+    def configure(self, rate=None, burst=None, max_in_flight=None,
+                  slow=None):
+        # rate: requests per second; burst: bucket size (default
+        # rate, minimum 1); max_in_flight: concurrent requests;
+        # slow: response seconds which reduce the rate
+        if rate is not None:
+            rate = _number('rate', rate)
+        if burst is not None:
+            burst = _number('burst', burst)
+            if burst < 1:
+                raise PanGovernorError('Invalid burst: %s' % burst)
+        elif rate is not None:
+            burst = max(rate, 1.0)
+        if max_in_flight is not None:
+            max_in_flight = _number('max_in_flight', max_in_flight,
+                                    type=int)
+        if slow is not None:
+            if rate is None:
+                raise PanGovernorError('slow requires rate')
+            slow = _number('slow', slow)
+
+        with self._lock:
+            self.rate = rate
+            self.burst = burst
+            self.max_in_flight = max_in_flight
+            self.slow = slow
+            self._devices = {}
+            self._released.notify_all()
+
+    def _limited(self):
+        return self.rate is not None or self.max_in_flight is not None
+
+    def try_acquire(self, key):
+        # Start a request for key if allowed and return 0, otherwise
+        # return the number of seconds to wait before trying again,
+        # or None to wait for a request to finish.
+        if not self._limited():
+            return 0
+
+        with self._lock:
+            return self.__try_acquire(key, time.time())
+
+    def __try_acquire(self, key, now):
+        x = self._devices.get(key)
+        if x is None:
+            x = _Device(self.rate, self.burst, now)
+            self._devices[key] = x
+
+        if (self.max_in_flight is not None and
+                x.in_flight >= self.max_in_flight):
+            return None
+
+        if x.rate is not None:
+            x.tokens = min(self.burst,
+                           x.tokens + (now - x.updated) * x.rate)
+            x.updated = now
+            if x.tokens < 1:
+                return (1 - x.tokens) / x.rate
+            x.tokens -= 1
+
+        x.in_flight += 1
+        x.requests += 1
+
+        return 0
+
+    def acquire(self, key):
+        # blocking try_acquire() for threads
+        if not self._limited():
+            return
+
+        start = time.time()
+        with self._lock:
+            while True:
+                wait = self.__try_acquire(key, time.time())
+                if wait == 0:
+                    break
+                # a wait of None is ended by release()
+                self._released.wait(wait)
+
+        wait = time.time() - start
+        if wait > 0.001:
+            self._log(DEBUG2, 'governor %s: waited %.3f seconds',
+                      key, wait)
+
+    def release(self, key, elapsed=None):
+        # request for key finished; elapsed is the response time
+        if not self._limited():
+            return
+
+        with self._lock:
+            x = self._devices.get(key)
+            if x is None:
+                # configure() during the request
+                return
+            x.in_flight = max(x.in_flight - 1, 0)
+            if (self.slow is not None and elapsed is not None and
+                    x.rate is not None):
+                self.__adapt(key, x, elapsed)
+            self._released.notify_all()
+
+    def __adapt(self, key, x, elapsed):
+        # additive increase, multiplicative decrease
+        rate = x.rate
+        if elapsed > self.slow:
+            x.slow += 1
+            x.rate = max(x.rate * _decrease, self.rate * _min_rate)
+        elif elapsed < self.slow / 2:
+            x.rate = min(x.rate + self.rate * _increase, self.rate)
+
+        if x.rate != rate:
+            self._log(DEBUG1, 'governor %s: response %.2f seconds, '
+                      'rate %.2f/second', key, elapsed, x.rate)
+
+    def stats(self, key):
+        # dictionary with rate, in_flight, requests and slow, or None
+        with self._lock:
+            x = self._devices.get(key)
+            if x is None:
+                return None
+            return {
+                'rate': x.rate,
+                'in_flight': x.in_flight,
+                'requests': x.requests,
+                'slow': x.slow,
+                }
+
+
+class _Device:
+    def __init__(self, rate, burst, now):
+        self.rate = rate  # current rate, reduced when slow
+        self.tokens = burst if burst is not None else 0
+        self.updated = now
+        self.in_flight = 0
+        self.requests = 0
+        self.slow = 0
+
+    def __str__(self):
+        return 'rate %s in_flight %d requests %d slow %d' % \
+            (self.rate, self.in_flight, self.requests, self.slow)
+
+
+# shared by all PanXapi objects without a governor argument
+default_governor = PanGovernor()
+
+
+if __name__ == '__main__':
+    # python -m pan.ratelimit tag rate
+    import pan.xapi
+    import pan.ratelimit
+
+    if len(sys.argv) < 3:
+        print('usage: python -m pan.ratelimit tag rate', file=sys.stderr)
+        sys.exit(1)
+
+    pan.ratelimit.default_governor.configure(rate=sys.argv[2])
+    try:
+        xapi = pan.xapi.PanXapi(tag=sys.argv[1], keepalive=True)
+        start = time.time()
+        for i in range(10):
+            xapi.op(cmd='show clock', cmd_xml=True)
+    except pan.xapi.PanXapiError as msg:
+        print('pan.xapi.PanXapi:', msg, file=sys.stderr)
+        sys.exit(1)
+    print('10 requests: %.2f seconds' % (time.time() - start))
@@ -0,0 +1,354 @@
+#
+# Copyright (c) 2015 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""Record and replay of API sessions
+
+The pan.replay module implements the PanRecorder class, which saves
+the query and the response status, headers and message body (as
+received, before decompression; the API key in a type=keygen
+response is redacted) of each request made by a PanXapi or
+PanWFapi object to an archive file, and the PanReplay class, which
+serves the recorded responses to PanXapi and PanWFapi objects
+without a device.
+"""
+
+from __future__ import print_function
+import sys
+import re
+import time
+import json
+import shutil
+import zipfile
+import tempfile
+import threading
+import logging
+import email.message
+from io import BytesIO
+
+from . import __version__, DEBUG1, DEBUG2, DEBUG3
+import pan.compress
+
+_format = 1
+_session_name = 'session.json'
+
+# query parameters which are not recorded
+_secrets = ('key', 'apikey', 'password')
+# API key in a type=keygen response
+_key_re = re.compile(br'<key>[^<]*</key>')
+_key_redacted = b'<key>********</key>'
+
+# message body bytes kept in memory while recording; larger bodies
+# are spooled to a temporary file
+_spool_size = 1024 * 1024
+_chunk_size = 64 * 1024
+
+
+class PanReplayError(Exception):
+    pass
+
+
+def _query_key(api, hostname, query):
+    # responses are matched by API, hostname and query without
+    # secrets
+    x = dict((k, str(v)) for k, v in query.items() if k not in _secrets)
+    return json.dumps([api, hostname, x], sort_keys=True)
+
+
+def _name(query):
+    # PanXapi type or PanWFapi URI, for messages
+    return query.get('type', query.get('uri'))
+
+
+class PanRecorder:
+    def __init__(self, path):
+        self._log = logging.getLogger(__name__).log
+        self.path = path
+        self.records = 0
+        self._lock = threading.Lock()
+        try:
+            self._zip = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+            self._zip.writestr(_session_name, json.dumps({
+                'format': _format,
+                'version': __version__,
+                'time': time.time(),
+                }))
+        except (IOError, OSError, zipfile.BadZipfile) as msg:
+            raise PanReplayError('%s: %s' % (path, msg))
+
+    def __str__(self):
+        return '%s: %d records' % (self.path, self.records)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def record(self, api, hostname, query, response):
+        # Return response wrapped so the message body is saved when
+        # it has been read.
+        record = {
+            'api': api,
+            'hostname': hostname,
+            'query': dict((k, str(v)) for k, v in query.items()
+                          if k not in _secrets),
+            'time': time.time(),
+            }
+
+        return _RecordingResponse(self, record, response)
+
+    def _save(self, record, body, size):
+        # body is a file object positioned at the start of size bytes
+        with self._lock:
+            if self._zip is None:
+                self._log(DEBUG1, '%s: closed, %s response not saved',
+                          self.path, record['api'])
+                return
+            name = '%06d' % self.records
+            self.records += 1
+            self._zip.writestr(name + '.json', json.dumps(record))
+
+            info = zipfile.ZipInfo(name + '.body',
+                                   time.localtime(record['time'])[:6])
+            info.external_attr = 0o600 << 16
+            # a compressed Content-Encoding is not compressed again
+            info.compress_type = zipfile.ZIP_STORED \
+                if record['encoded'] else zipfile.ZIP_DEFLATED
+            info.file_size = size
+            if sys.version_info >= (3, 6):
+                with self._zip.open(info, 'w') as f:
+                    shutil.copyfileobj(body, f, _chunk_size)
+            else:
+                # 2.7: ZipFile.open() cannot write
+                self._zip.writestr(info, body.read())
+
+        self._log(DEBUG2, '%s: record %s %s %s: %d bytes', self.path,
+                  name, record['api'], _name(record['query']), size)
+
+    def close(self):
+        with self._lock:
+            if self._zip is None:
+                return
+            self._zip.close()
+            self._zip = None
+
+        self._log(DEBUG1, '%s: %d records', self.path, self.records)
+
+
+class _RecordingResponse:
+    # Wrap an HTTP response and save the message body read from it
+    # at end of file or close().  The body is written to a temporary
+    # file as it is read, so a streamed export is not held in
+    # memory.
+    def __init__(self, recorder, record, response):
+        self._recorder = recorder
+        self._record = record
+        self._response = response
+        self._body = tempfile.SpooledTemporaryFile(max_size=_spool_size)
+        self._length = 0
+        self._saved = False
+
+        record['status'] = getattr(response, 'status', None)
+        if record['status'] is None:
+            record['status'] = response.getcode()
+        reason = getattr(response, 'reason', None)
+        if not isinstance(reason, str):
+            # 2.7 urllib
+            reason = getattr(response, 'msg', '')
+        record['reason'] = reason if isinstance(reason, str) else ''
+        info = response.info()
+        record['headers'] = [[k, v] for k, v in info.items()]
+        record['encoded'] = info.get('content-encoding', 'identity') \
+            .strip().lower() not in ('', 'identity')
+        try:
+            self._content_length = int(info.get('content-length'))
+        except (TypeError, ValueError):
+            self._content_length = None
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def info(self):
+        return self._response.info()
+
+    def getcode(self):
+        return self._response.getcode()
+
+    def read(self, amt=None):
+        if amt is None:
+            data = self._response.read()
+        else:
+            data = self._response.read(amt)
+        self._body.write(data)
+        self._length += len(data)
+        if (amt is None or not data or
+                (self._content_length is not None and
+                 self._length >= self._content_length)):
+            self.__save()
+
+        return data
+
+    def close(self):
+        self.__save()
+        self._response.close()
+
+    def __save(self):
+        if self._saved:
+            return
+        self._saved = True
+        body = self._body
+        size = self._length
+        body.seek(0)
+        if (self._record['api'] == 'xapi' and
+                self._record['query'].get('type') == 'keygen'):
+            body = BytesIO(self.__redact(body))
+            size = len(body.getvalue())
+        try:
+            self._recorder._save(self._record, body, size)
+        finally:
+            self._body.close()
+
+    def __redact(self, body):
+        # The API key in a keygen response is not saved.  The body is
+        # saved decoded, without Content-Encoding.
+        record = self._record
+        encoding = None
+        headers = []
+        for k, v in record['headers']:
+            if k.lower() == 'content-encoding':
+                encoding = v.strip().lower()
+            elif k.lower() != 'content-length':
+                headers.append([k, v])
+        data = body.read()
+        if record['encoded']:
+            try:
+                data = pan.compress.PanDecodedResponse(
+                    BytesIO(data), encoding).read()
+            except pan.compress.PanCompressError:
+                data = b''
+        data = _key_re.sub(_key_redacted, data)
+        headers.append(['Content-Length', str(len(data))])
+        record['headers'] = headers
+        record['encoded'] = False
+
+        return data
+
+
+class PanReplay:
+    def __init__(self, path):
+        self._log = logging.getLogger(__name__).log
+        self.path = path
+        self.records = 0
+        self.served = 0
+        self._lock = threading.Lock()
+        self._responses = {}  # key: [record, ...]
+
+        try:
+            with zipfile.ZipFile(path, 'r') as x:
+                self.__load(x)
+        except (IOError, OSError, zipfile.BadZipfile, KeyError,
+                ValueError) as msg:
+            raise PanReplayError('%s: %s' % (path, msg))
+
+    def __str__(self):
+        return '%s: %d records, %d served' % (self.path, self.records,
+                                              self.served)
+
+    def __load(self, archive):
+        session = json.loads(archive.read(_session_name).decode())
+        if session.get('format') != _format:
+            raise PanReplayError('%s: unsupported format: %s' %
+                                 (self.path, session.get('format')))
+
+        names = sorted(x for x in archive.namelist() if x.endswith('.json')
+                       and x != _session_name)
+        for name in names:
+            record = json.loads(archive.read(name).decode())
+            record['body'] = archive.read(name[:-len('.json')] + '.body')
+            key = _query_key(record['api'], record['hostname'],
+                             record['query'])
+            self._responses.setdefault(key, []).append(record)
+            self.records += 1
+
+        self._log(DEBUG1, '%s: %d records, %d queries', self.path,
+                  self.records, len(self._responses))
+
+    def response(self, api, hostname, query):
+        # Return the next recorded response for the query; when all
+        # have been served (for example job status polls) the last
+        # is served again.
+        key = _query_key(api, hostname, query)
+        with self._lock:
+            x = self._responses.get(key)
+            if not x:
+                raise PanReplayError('no recorded response: %s %s %s' %
+                                     (api, hostname, _name(query)))
+            record = x.pop(0) if len(x) > 1 else x[0]
+            self.served += 1
+
+        self._log(DEBUG2, 'replay %s %s: %d bytes', api, _name(query),
+                  len(record['body']))
+
+        return _ReplayResponse(record)
+
+
+class _ReplayResponse:
+    # http.client.HTTPResponse interface used by PanXapi, PanWFapi
+    # and pan.compress.PanDecodedResponse
+    def __init__(self, record):
+        self.status = record['status']
+        self.reason = record['reason']
+        self.timings = None
+        self._headers = email.message.Message()
+        for k, v in record['headers']:
+            self._headers[k] = v
+        self._body = BytesIO(record['body'])
+
+    def info(self):
+        return self._headers
+
+    def getcode(self):
+        return self.status
+
+    def getheader(self, name, default=None):
+        return self._headers.get(name, default)
+
+    def getheaders(self):
+        return self._headers.items()
+
+    def read(self, amt=None):
+        if amt is None:
+            return self._body.read()
+        return self._body.read(amt)
+
+    def close(self):
+        pass
+
+
+if __name__ == '__main__':
+    # python -m pan.replay path
+    import pan.replay
+
+    if len(sys.argv) < 2:
+        print('usage: python -m pan.replay path', file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        replay = pan.replay.PanReplay(sys.argv[1])
+    except pan.replay.PanReplayError as msg:
+        print('pan.replay.PanReplay:', msg, file=sys.stderr)
+        sys.exit(1)
+    print(replay)
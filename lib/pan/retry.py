@@ -0,0 +1,189 @@
+#
+# Copyright (c) 2015 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""Request retry policy and circuit breaker
+
+The pan.retry module implements the PanRetry class, a retry policy
+with jittered exponential backoff for API requests which fail with a
+transient error, and the PanCircuitBreaker class, which fails
+requests to a host immediately after repeated transient errors until
+a reset timeout has passed.
+"""
+
+from __future__ import print_function
+import time
+import random
+import threading
+import logging
+
+from . import DEBUG1, DEBUG2, DEBUG3
+
+_retries = 3
+_backoff = 0.5
+_factor = 2.0
+_max_backoff = 10.0
+_failures = 5
+_reset_timeout = 30.0
+
+# HTTP status codes which are retried
+_transient_codes = (500, 502, 503, 504)
+
+
+class PanRetryError(Exception):
+    pass
+
+
+def _number(name, value, type=float, zero=False):
+    try:
+        value = type(value)
+        if value < 0 or (value == 0 and not zero):
+            raise ValueError
+    except ValueError:
+        raise PanRetryError('Invalid %s: %s' % (name, value))
+
+    return value
+
+
+class PanRetry:
+    def __init__(self, retries=_retries, backoff=_backoff, factor=_factor,
+                 max_backoff=_max_backoff, jitter=True):
+        self.retries = _number('retries', retries, type=int, zero=True)
+        self.backoff = _number('backoff', backoff, zero=True)
+        self.factor = _number('factor', factor)
+        self.max_backoff = _number('max_backoff', max_backoff, zero=True)
+        self.jitter = jitter
+        if self.factor < 1:
+            raise PanRetryError('Invalid factor: %s' % factor)
+
+    def __str__(self):
+        return '\n'.join((': '.join((k, str(self.__dict__[k]))))
+                         for k in sorted(self.__dict__))
+
+    def delay(self, attempt):
+        # seconds to wait before retry attempt (0 is the first
+        # retry); full jitter spreads retries from many clients
+        x = self.backoff * self.factor ** min(attempt, 64)
+        x = min(x, self.max_backoff)
+        if self.jitter:
+            x = random.uniform(0, x)
+
+        return x
+
+    @staticmethod
+    def transient(http_code):
+        # http_code None: no HTTP response (connection error or
+        # timeout)
+        return http_code is None or http_code in _transient_codes
+
+    @staticmethod
+    def idempotent(query):
+        # Requests which can be repeated without side effects.  An
+        # operational command is only retried for show commands, and
+        # type=log only for job status (action=get).
+        x = query.get('type')
+        if x == 'config':
+            return query.get('action') in ('show', 'get')
+        if x == 'op':
+            cmd = query.get('cmd', '').lstrip()
+            return cmd.startswith('<show>') or cmd.startswith('<show ')
+        if x == 'log':
+            return query.get('action') == 'get'
+        if x in ('export', 'keygen'):
+            return True
+
+        return False
+
+
+class PanCircuitBreaker:
+    # closed: requests are performed; open: requests fail without
+    # being performed until reset_timeout seconds have passed; then
+    # half-open: one trial request is performed, which closes the
+    # circuit on success and opens it again on failure.
+    def __init__(self, failures=_failures, reset_timeout=_reset_timeout):
+        self._log = logging.getLogger(__name__).log
+        self.failures = _number('failures', failures, type=int)
+        self.reset_timeout = _number('reset_timeout', reset_timeout)
+        self._lock = threading.Lock()
+        self._hosts = {}  # host: [failures, opened, trial]
+
+    def __str__(self):
+        with self._lock:
+            return '\n'.join('%s: %s' % (host, self.__state(x))
+                             for host, x in sorted(self._hosts.items()))
+
+    def __state(self, x):
+        if x[1] is None:
+            return 'closed'
+        if time.time() - x[1] < self.reset_timeout:
+            return 'open'
+        return 'half-open'
+
+    def state(self, host):
+        with self._lock:
+            x = self._hosts.get(host)
+            return 'closed' if x is None else self.__state(x)
+
+    def allow(self, host):
+        # return True when a request to host can be performed
+        with self._lock:
+            x = self._hosts.get(host)
+            if x is None or x[1] is None:
+                return True
+            if time.time() - x[1] < self.reset_timeout:
+                return False
+            if x[2]:
+                # trial request in progress
+                return False
+            x[2] = True
+
+        self._log(DEBUG1, 'circuit %s: half-open, trial request', host)
+
+        return True
+
+    def success(self, host):
+        with self._lock:
+            x = self._hosts.pop(host, None)
+        if x is not None and x[1] is not None:
+            self._log(DEBUG1, 'circuit %s: closed', host)
+
+    def failure(self, host):
+        with self._lock:
+            x = self._hosts.setdefault(host, [0, None, False])
+            x[0] += 1
+            if x[1] is None and x[0] < self.failures:
+                return
+            # open, or failed trial request
+            x[1] = time.time()
+            x[2] = False
+            n = x[0]
+
+        self._log(DEBUG1, 'circuit %s: open after %d failures', host, n)
+
+    def abort(self, host):
+        # the request ended without a result (an exception): allow
+        # another trial request
+        with self._lock:
+            x = self._hosts.get(host)
+            if x is not None:
+                x[2] = False
+
+    def retry_after(self, host):
+        # seconds until a trial request is allowed
+        with self._lock:
+            x = self._hosts.get(host)
+            if x is None or x[1] is None:
+                return 0
+            return max(x[1] + self.reset_timeout - time.time(), 0)
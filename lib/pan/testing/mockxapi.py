@@ -0,0 +1,991 @@
+#
+# Copyright (c) 2015 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""Mock PAN-OS XML API server
+
+The pan.testing.mockxapi module implements the PanMockXapi class, an
+HTTP server which emulates the PAN-OS XML API for testing and load
+testing programs which use pan.xapi without a device.  It implements
+type=keygen, config (show, get, set, edit, delete, move, rename,
+clone and multi-config against an in-memory candidate and running
+configuration), op, commit and log jobs, export and user-id, with
+configurable latency and payload sizes.
+"""
+
+from __future__ import print_function
+import os
+import sys
+import re
+import copy
+import time
+import random
+import socket
+import threading
+import logging
+import zlib
+import xml.etree.ElementTree as etree
+
+try:
+    # 3.2
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlsplit
+except ImportError:
+    # 2.7
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlsplit
+
+from .. import DEBUG1, DEBUG2, DEBUG3
+
+_api_key = 'LUFRPT1tb2NrLXhhcGk9'
+_users = {'admin': 'admin'}
+_hostname = 'localhost.localdomain'
+_vsys = 'vsys1'
+
+# PAN-OS limits
+_max_nlogs = 5000
+
+# export message body is written in blocks
+_block_size = 64 * 1024
+
+_config = '''<config version="10.1.0" urldb="paloaltonetworks">
+<mgt-config><users><entry name="admin"><permissions><role-based>\
+<superuser>yes</superuser></role-based></permissions></entry></users>\
+</mgt-config>
+<shared/>
+<devices><entry name="%s"><deviceconfig><system>\
+<hostname>mock</hostname></system></deviceconfig>\
+<vsys><entry name="%s"><address/><rulebase><security><rules/>\
+</security></rulebase></entry></vsys></entry></devices>
+</config>''' % (_hostname, _vsys)
+
+_vsys_xpath = "/config/devices/entry[@name='%s']/vsys/entry[@name='%s']" % \
+    (_hostname, _vsys)
+
+_modify_actions = ('set', 'edit', 'delete', 'move', 'rename', 'clone')
+_move_where = ('top', 'bottom', 'before', 'after')
+
+_step_re = re.compile(r'''([-\w.:]+|\*)''')
+_predicate_re = re.compile(r'''\[@([-\w]+)=(['"])(.*?)\2\]''')
+
+
+class PanMockXapiError(Exception):
+    pass
+
+
+class _ApiError(Exception):
+    # error response: status error (or success) and PAN-OS code
+    def __init__(self, msg, code=None, status='error'):
+        Exception.__init__(self, msg)
+        self.code = code
+        self.status = status
+
+
+class _Job:
+    def __init__(self, id, type, duration, user=None):
+        self.id = id
+        self.type = type
+        self.duration = duration
+        self.user = user
+        self.start = time.time()
+        self.config = None  # commit: candidate to make running
+        self.log_type = None
+        self.nlogs = None
+        self.skip = None
+
+    def __str__(self):
+        return '\n'.join((': '.join((k, str(self.__dict__[k]))))
+                         for k in sorted(self.__dict__)
+                         if k != 'config')
+
+    def finished(self, now=None):
+        if now is None:
+            now = time.time()
+        return now - self.start >= self.duration
+
+    def progress(self, now=None):
+        if now is None:
+            now = time.time()
+        if self.duration <= 0:
+            return 100
+        return min(int(100 * (now - self.start) / self.duration), 100)
+
+
+def _timestamp(t):
+    return time.strftime('%Y/%m/%d %H:%M:%S', time.localtime(t))
+
+
+def _escape(s):
+    return s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _tostring(elem):
+    # us-ascii with character references, no XML declaration
+    return etree.tostring(elem).decode()
+
+
+def _response(status='success', code=None, result=None, msg=None):
+    x = ['<response status="%s"' % status]
+    if code is not None:
+        x.append(' code="%s"' % code)
+    x.append('>')
+    if msg is not None:
+        x.append('<msg><line>%s</line></msg>' % _escape(msg))
+    if result is not None:
+        x.append(result)
+    x.append('</response>')
+
+    return ''.join(x).encode()
+
+
+def _parse_xpath(xpath):
+    # Return the steps of an absolute xpath below /config as a list
+    # of (tag, [(attribute, value), ...]).  Only child steps with
+    # attribute equality predicates are supported.
+    steps = []
+    step = []
+    quote = None
+    depth = 0
+    for c in xpath:
+        if quote is not None:
+            if c == quote:
+                quote = None
+        elif c in '\'"' and depth:
+            quote = c
+        elif c == '[':
+            depth += 1
+        elif c == ']':
+            depth -= 1
+        elif c == '/' and not depth:
+            steps.append(''.join(step))
+            step = []
+            continue
+        step.append(c)
+    steps.append(''.join(step))
+
+    if len(steps) < 2 or steps[0] != '' or steps[1] != 'config':
+        raise _ApiError('Invalid xpath: %s' % xpath, code=12)
+
+    parsed = []
+    for step in steps[2:]:
+        m = _step_re.match(step)
+        if m is None:
+            raise _ApiError('Unsupported xpath: %s' % xpath, code=12)
+        tag = m.group(1)
+        predicates = []
+        pos = m.end()
+        while pos < len(step):
+            m = _predicate_re.match(step, pos)
+            if m is None:
+                raise _ApiError('Unsupported xpath: %s' % xpath, code=12)
+            predicates.append((m.group(1), m.group(3)))
+            pos = m.end()
+        parsed.append((tag, predicates))
+
+    return parsed
+
+
+def _match(elem, tag, predicates):
+    if tag != '*' and elem.tag != tag:
+        return False
+    for name, value in predicates:
+        if elem.get(name) != value:
+            return False
+    return True
+
+
+def _select(nodes, steps, create=False):
+    for tag, predicates in steps:
+        matched = [x for node in nodes for x in node
+                   if _match(x, tag, predicates)]
+        if not matched and create:
+            if tag == '*':
+                raise _ApiError('Cannot create node: *', code=12)
+            matched = [etree.SubElement(node, tag, dict(predicates))
+                       for node in nodes]
+        nodes = matched
+
+    return nodes
+
+
+def _merge(node, elem):
+    # set: merge the children of elem into node
+    index = {}
+    for x in node:
+        if x.tag == 'member':
+            index[(x.tag, x.text)] = x
+        else:
+            index.setdefault((x.tag, x.get('name')), x)
+
+    for child in elem:
+        if child.tag == 'member':
+            key = (child.tag, child.text)
+        else:
+            key = (child.tag, child.get('name'))
+        x = index.get(key)
+        if x is None:
+            x = copy.deepcopy(child)
+            node.append(x)
+            index[key] = x
+        elif len(child):
+            x.attrib.update(child.attrib)
+            _merge(x, child)
+        elif child.tag != 'member':
+            x.attrib.update(child.attrib)
+            x.text = child.text
+
+
+def _child(parent, tag, name):
+    for x in parent:
+        if x.tag == tag and x.get('name') == name:
+            return x
+
+    return None
+
+
+def _move(parent, elem, where, dst):
+    if where in ('before', 'after'):
+        x = _child(parent, elem.tag, dst)
+        if x is None or x is elem:
+            raise _ApiError('Invalid dst: %s' % dst, code=12)
+    parent.remove(elem)
+    if where == 'top':
+        parent.insert(0, elem)
+    elif where == 'bottom':
+        parent.append(elem)
+    else:
+        i = list(parent).index(x)
+        parent.insert(i if where == 'before' else i + 1, elem)
+
+
+def _fragment(element):
+    if element is None:
+        raise _ApiError('element required', code=18)
+    try:
+        return etree.fromstring('<_>%s</_>' % element)
+    except etree.ParseError as msg:
+        raise _ApiError('Malformed element: %s' % msg, code=18)
+
+
+def _words(elem):
+    # op command XML to words: <show><jobs><id>1</id></jobs></show>
+    # is show jobs id 1
+    x = [elem.tag]
+    if elem.text is not None and elem.text.strip():
+        x.append(elem.text.strip())
+    for child in elem:
+        x.extend(_words(child))
+
+    return x
+
+
+class PanMockXapi:
+    def __init__(self,
+                 hostname='127.0.0.1',
+                 port=0,
+                 api_key=_api_key,
+                 users=None,
+                 latency=0,
+                 jitter=0,
+                 job_time=1.0,
+                 log_entries=100,
+                 export_size=_block_size,
+                 addresses=0,
+                 rules=0,
+                 config=None,
+                 compress=False,
+                 ssl_context=None):
+        self._log = logging.getLogger(__name__).log
+        self.api_key = api_key
+        self.users = _users if users is None else users
+        self.latency = latency
+        self.jitter = jitter
+        self.job_time = job_time
+        self.log_entries = log_entries
+        self.export_size = export_size
+        self.compress = compress
+        self.use_http = ssl_context is None
+        self.requests = {}  # type: count
+        self.user_ids = {}  # ip: user
+        self.tags = {}  # ip: set of tags
+        self.op_commands = {
+            'show system info': self.__show_system_info,
+            'show clock': self.__show_clock,
+            'show jobs id': self.__show_jobs,
+            'show jobs all': self.__show_jobs,
+            }
+        self._lock = threading.Lock()
+        self._boot = time.time()
+        self._jobs = {}
+        self._job_id = 0
+        self._dirty = False
+        self._thread = None
+
+        try:
+            if config is None:
+                self.candidate = etree.fromstring(_config)
+                self.__synthetic(addresses, rules)
+            else:
+                self.candidate = etree.fromstring(config)
+        except etree.ParseError as msg:
+            raise PanMockXapiError('config: %s' % msg)
+        self.running = copy.deepcopy(self.candidate)
+
+        try:
+            self._server = _Server((hostname, port), _Handler)
+        except socket.error as msg:
+            raise PanMockXapiError('%s:%s: %s' % (hostname, port, msg))
+        self._server.mock = self
+        if ssl_context is not None:
+            self._server.socket = ssl_context.wrap_socket(
+                self._server.socket, server_side=True)
+        self.hostname, self.port = self._server.server_address[:2]
+        self.uri = '%s://%s:%d/api/' % ('http' if self.use_http else 'https',
+                                        self.hostname, self.port)
+
+    def __str__(self):
+        return '\n'.join((': '.join((k, str(self.__dict__[k]))))
+                         for k in sorted(self.__dict__)
+                         if k not in ('candidate', 'running'))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def __synthetic(self, addresses, rules):
+        vsys = _select([self.candidate], _parse_xpath(_vsys_xpath))[0]
+        address = vsys.find('address')
+        for i in range(addresses):
+            entry = etree.SubElement(address, 'entry',
+                                     {'name': 'mock-%d' % i})
+            etree.SubElement(entry, 'ip-netmask').text = \
+                '10.%d.%d.%d/32' % (i >> 16 & 255, i >> 8 & 255, i & 255)
+        security = vsys.find('rulebase/security/rules')
+        for i in range(rules):
+            entry = etree.SubElement(security, 'entry',
+                                     {'name': 'rule-%d' % i})
+            for tag, member in (('from', 'trust'), ('to', 'untrust'),
+                                ('source', 'mock-%d' % i),
+                                ('destination', 'any'),
+                                ('application', 'any'),
+                                ('service', 'application-default')):
+                x = etree.SubElement(entry, tag)
+                etree.SubElement(x, 'member').text = member
+            etree.SubElement(entry, 'action').text = 'allow'
+
+    def xapi_args(self):
+        # keyword arguments for pan.xapi.PanXapi()
+        return {
+            'hostname': self.hostname,
+            'port': self.port,
+            'api_key': self.api_key,
+            'use_http': self.use_http,
+            }
+
+    def start(self):
+        # serve requests in a daemon thread
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        self._log(DEBUG1, 'mock server %s started', self.uri)
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._log(DEBUG1, 'mock server %s stopped', self.uri)
+
+    def delay(self):
+        # seconds to wait before sending a response
+        x = self.latency
+        if self.jitter:
+            x += random.uniform(0, self.jitter)
+        return x
+
+    def handle(self, query):
+        # Perform an API request; query is a dictionary with a single
+        # value for each parameter.  Return HTTP code, content-type,
+        # content-disposition (or None) and the message body bytes
+        # (None to write an export body).
+        type = query.get('type')
+        with self._lock:
+            self.requests[type] = self.requests.get(type, 0) + 1
+            self.__update_jobs()
+            try:
+                if type == 'keygen':
+                    return self.__keygen(query)
+                if query.get('key') != self.api_key:
+                    return (403, 'application/xml', None,
+                            _response(code=403, msg='Invalid Credential'))
+                if type == 'export':
+                    return self.__export(query)
+                method = {
+                    'config': self.__config,
+                    'op': self.__op,
+                    'commit': self.__commit,
+                    'log': self.__log,
+                    'user-id': self.__user_id,
+                    }.get(type)
+                if method is None:
+                    raise _ApiError('Unknown type: %s' % type, code=1)
+                body = method(query)
+            except _ApiError as msg:
+                body = _response(status=msg.status, code=msg.code,
+                                 msg=str(msg))
+
+        return 200, 'application/xml; charset=UTF-8', None, body
+
+    def __keygen(self, query):
+        user = query.get('user')
+        if user is None or self.users.get(user) != query.get('password'):
+            return (403, 'application/xml', None,
+                    _response(code=403, msg='Invalid Credential'))
+        return (200, 'application/xml; charset=UTF-8', None,
+                _response(result='<result><key>%s</key></result>' %
+                          self.api_key))
+
+    def __config(self, query):
+        action = query.get('action')
+        xpath = query.get('xpath')
+
+        if action in ('show', 'get'):
+            root = self.running if action == 'show' else self.candidate
+            if xpath is None:
+                return _response(result='<result>%s</result>' %
+                                 _tostring(root))
+            nodes = _select([root], _parse_xpath(xpath))
+            if not nodes:
+                if action == 'show':
+                    raise _ApiError('No such node', code=7)
+                return _response(code=7, result='<result/>')
+            x = ''.join([_tostring(node) for node in nodes])
+            if action == 'get':
+                return _response(code=19, result='<result total-count="%d"'
+                                 ' count="%d">%s</result>' %
+                                 (len(nodes), len(nodes), x))
+            return _response(result='<result>%s</result>' % x)
+
+        if action == 'multi-config':
+            return self.__multi_config(query)
+
+        if action not in _modify_actions:
+            raise _ApiError('Unsupported action: %s' % action, code=1)
+        if xpath is None:
+            raise _ApiError('xpath required', code=6)
+        if self.__modify(action, xpath, query.get('element'), query):
+            return _response(code=20, msg='command succeeded')
+        if action != 'delete':
+            raise _ApiError("Object doesn't exist", code=7)
+
+        return _response(code=7, msg="Object doesn't exist")
+
+    def __modify(self, action, xpath, element, args):
+        # Return False when the node does not exist (delete, move,
+        # rename, clone source).  args has the where, dst, newname
+        # and from arguments.
+        steps = _parse_xpath(xpath)
+        if action == 'set':
+            elem = _fragment(element)
+            for node in _select([self.candidate], steps, create=True):
+                _merge(node, elem)
+            self._dirty = True
+            return True
+
+        if not steps:
+            raise _ApiError('Cannot %s /config' % action, code=12)
+        tag, predicates = steps[-1]
+
+        if action == 'edit':
+            elem = _fragment(element)
+            if (len(elem) != 1 or
+                    not _match(elem[0], tag, predicates)):
+                raise _ApiError('edit breaks config validity', code=12)
+            for parent in _select([self.candidate], steps[:-1],
+                                  create=True):
+                for i, x in enumerate(parent):
+                    if _match(x, tag, predicates):
+                        parent[i] = copy.deepcopy(elem[0])
+                        break
+                else:
+                    parent.append(copy.deepcopy(elem[0]))
+            self._dirty = True
+            return True
+
+        if action == 'clone':
+            return self.__clone(steps, args)
+
+        where = args.get('where')
+        if action == 'move':
+            if where not in _move_where:
+                raise _ApiError('Invalid where: %s' % where, code=12)
+            if where in ('before', 'after') and args.get('dst') is None:
+                raise _ApiError('dst required', code=6)
+        if action == 'rename' and args.get('newname') is None:
+            raise _ApiError('newname required', code=6)
+
+        found = False
+        for parent in _select([self.candidate], steps[:-1]):
+            for x in [x for x in parent if _match(x, tag, predicates)]:
+                found = True
+                if action == 'delete':
+                    parent.remove(x)
+                elif action == 'rename':
+                    if _child(parent, x.tag, args['newname']) is not None:
+                        raise _ApiError('%s already exists' %
+                                        args['newname'], code=12)
+                    x.set('name', args['newname'])
+                else:
+                    _move(parent, x, where, args.get('dst'))
+        if found:
+            self._dirty = True
+
+        return found
+
+    def __clone(self, steps, args):
+        # xpath is the container for the copy of the from node
+        for x in ['from', 'newname']:
+            if args.get(x) is None:
+                raise _ApiError('%s required' % x, code=6)
+        nodes = _select([self.candidate], _parse_xpath(args['from']))
+        if not nodes:
+            return False
+        for parent in _select([self.candidate], steps, create=True):
+            if _child(parent, nodes[0].tag, args['newname']) is not None:
+                raise _ApiError('%s already exists' % args['newname'],
+                                code=12)
+            x = copy.deepcopy(nodes[0])
+            x.set('name', args['newname'])
+            parent.append(x)
+        self._dirty = True
+
+        return True
+
+    def __multi_config(self, query):
+        # a transaction: all actions are performed or none
+        root = _fragment(query.get('element'))
+        if len(root) != 1 or root[0].tag != 'multi-config':
+            raise _ApiError('multi-config element required', code=18)
+
+        candidate = copy.deepcopy(self.candidate)
+        dirty = self._dirty
+        results = []
+        for x in root[0]:
+            id = x.get('id')
+            try:
+                if x.tag not in _modify_actions:
+                    raise _ApiError('Unsupported action: %s' % x.tag,
+                                    code=1)
+                if x.get('xpath') is None:
+                    raise _ApiError('xpath required', code=6)
+                element = ''.join([_tostring(child) for child in x])
+                if (not self.__modify(x.tag, x.get('xpath'), element,
+                                      x.attrib) and x.tag != 'delete'):
+                    raise _ApiError("Object doesn't exist", code=7)
+            except _ApiError as msg:
+                self.candidate = candidate
+                self._dirty = dirty
+                results.append('<response id="%s" status="error" '
+                               'code="%s"><msg><line>%s</line></msg>'
+                               '</response>' % (id, msg.code,
+                                                _escape(str(msg))))
+                return _response(status='error', code=msg.code,
+                                 result='<result>%s</result>' %
+                                 ''.join(results))
+            results.append('<response id="%s" status="success" '
+                           'code="20"><msg>command succeeded</msg>'
+                           '</response>' % id)
+
+        return _response(code=20, result='<result>%s</result>' %
+                         ''.join(results))
+
+    def __op(self, query):
+        cmd = query.get('cmd')
+        if cmd is None:
+            raise _ApiError('cmd required', code=6)
+        try:
+            words = _words(etree.fromstring(cmd))
+        except etree.ParseError as msg:
+            raise _ApiError('Malformed command: %s' % msg, code=17)
+
+        # longest command prefix; the remaining words are arguments
+        for i in range(len(words), 0, -1):
+            x = self.op_commands.get(' '.join(words[:i]))
+            if x is not None:
+                break
+        else:
+            raise _ApiError('%s: Invalid syntax.' % ' '.join(words),
+                            code=17)
+
+        if callable(x):
+            x = x(words[i:])
+
+        return _response(result='<result>%s</result>' % x)
+
+    def __show_system_info(self, args):
+        uptime = int(time.time() - self._boot)
+        return ('<system><hostname>mock</hostname>'
+                '<ip-address>%s</ip-address>'
+                '<uptime>%d days, %d:%02d:%02d</uptime>'
+                '<model>PA-VM</model><serial>%s</serial>'
+                '<sw-version>10.1.0</sw-version>'
+                '<multi-vsys>off</multi-vsys></system>' %
+                (self.hostname, uptime // 86400, uptime % 86400 // 3600,
+                 uptime % 3600 // 60, uptime % 60, self.serial()))
+
+    def __show_clock(self, args):
+        return time.strftime('%a %b %d %H:%M:%S %Z %Y\n')
+
+    def __show_jobs(self, args):
+        if args:
+            try:
+                jobs = [self._jobs[int(args[0])]]
+            except (ValueError, KeyError):
+                raise _ApiError('job %s not found' % args[0], code=17)
+        else:
+            jobs = [self._jobs[x] for x in sorted(self._jobs)]
+
+        return ''.join([self.__job_xml(x) for x in jobs])
+
+    def serial(self):
+        return '%012d' % self.port
+
+    def __job_xml(self, job):
+        now = time.time()
+        finished = job.finished(now)
+        x = ['<job><tenq>%s</tenq>' % _timestamp(job.start),
+             '<id>%d</id><user>%s</user><type>%s</type>' %
+             (job.id, job.user or '', job.type),
+             '<status>%s</status>' % ('FIN' if finished else 'ACT'),
+             '<result>%s</result>' % ('OK' if finished else 'PEND'),
+             '<progress>%d</progress>' % job.progress(now)]
+        if finished:
+            x.append('<tfin>%s</tfin>' % _timestamp(job.start +
+                                                     job.duration))
+            if job.type == 'Commit':
+                x.append('<details><line>Configuration committed '
+                         'successfully</line></details>')
+        x.append('</job>')
+
+        return ''.join(x)
+
+    def __new_job(self, type, query):
+        self._job_id += 1
+        job = _Job(self._job_id, type, self.job_time,
+                   user=query.get('user'))
+        self._jobs[job.id] = job
+        self._log(DEBUG2, 'job %d %s enqueued', job.id, type)
+
+        return job
+
+    def __update_jobs(self):
+        # finished commit jobs make their candidate the running
+        # configuration, in job order
+        now = time.time()
+        for id in sorted(self._jobs):
+            job = self._jobs[id]
+            if job.config is not None and job.finished(now):
+                self.running = job.config
+                job.config = None
+
+    def __commit(self, query):
+        cmd = query.get('cmd', '')
+        if not self._dirty and '<force' not in cmd:
+            return _response(code=19,
+                             msg='There are no changes to commit.')
+        job = self.__new_job('Commit', query)
+        job.config = copy.deepcopy(self.candidate)
+        self._dirty = False
+        self.__update_jobs()
+
+        return _response(code=19, result='<result><msg><line>Commit job '
+                         'enqueued with jobid %d</line></msg><job>%d</job>'
+                         '</result>' % (job.id, job.id))
+
+    def __log(self, query):
+        action = query.get('action')
+
+        if action is None:
+            try:
+                nlogs = int(query.get('nlogs', 20))
+                skip = int(query.get('skip', 0))
+            except ValueError:
+                raise _ApiError('Invalid nlogs or skip', code=18)
+            if not 1 <= nlogs <= _max_nlogs or skip < 0:
+                raise _ApiError('Invalid nlogs or skip', code=18)
+            job = self.__new_job('Log', query)
+            job.log_type = query.get('log-type', 'traffic')
+            job.nlogs = nlogs
+            job.skip = skip
+            return _response(code=19, result='<result><msg><line>query '
+                             'job enqueued with jobid %d</line></msg>'
+                             '<job>%d</job></result>' % (job.id, job.id))
+
+        try:
+            job = self._jobs[int(query.get('job-id'))]
+            if job.type != 'Log':
+                raise KeyError
+        except (TypeError, ValueError, KeyError):
+            raise _ApiError('job %s not found' % query.get('job-id'),
+                            code=17)
+
+        if action == 'finish':
+            del self._jobs[job.id]
+            return _response(result='<result>Job %d deleted</result>' %
+                             job.id)
+        if action != 'get':
+            raise _ApiError('Unsupported action: %s' % action, code=1)
+
+        now = time.time()
+        finished = job.finished(now)
+        x = ['<result><job><tenq>%s</tenq><id>%d</id>' %
+             (_timestamp(job.start), job.id),
+             '<status>%s</status></job><log>' %
+             ('FIN' if finished else 'ACT')]
+        if finished:
+            n = max(min(job.nlogs, self.log_entries - job.skip), 0)
+            x.append('<logs count="%d" progress="100">' % n)
+            x.extend([self.__log_entry(job, job.skip + i)
+                      for i in range(n)])
+            x.append('</logs>')
+        else:
+            x.append('<logs count="0" progress="%d"/>' % job.progress(now))
+        x.append('</log></result>')
+
+        return _response(result=''.join(x))
+
+    def __log_entry(self, job, i):
+        # newest first
+        return ('<entry logid="%d"><domain>1</domain>'
+                '<receive_time>%s</receive_time><serial>%s</serial>'
+                '<seqno>%d</seqno><type>%s</type>'
+                '<src>10.%d.%d.%d</src><dst>192.0.2.%d</dst>'
+                '<rule>rule-%d</rule><app>ssl</app>'
+                '<bytes>%d</bytes><action>allow</action></entry>' %
+                (self.log_entries - i, _timestamp(job.start - i),
+                 self.serial(), self.log_entries - i, job.log_type.upper(),
+                 i >> 16 & 255, i >> 8 & 255, i & 255, i & 255,
+                 i % 100, 1000 + i))
+
+    def __user_id(self, query):
+        cmd = query.get('cmd')
+        if cmd is None:
+            raise _ApiError('cmd required', code=6)
+        try:
+            root = etree.fromstring(cmd)
+        except etree.ParseError as msg:
+            raise _ApiError('Malformed uid-message: %s' % msg, code=18)
+        payload = root.find('payload')
+        if root.tag != 'uid-message' or payload is None:
+            raise _ApiError('uid-message payload required', code=18)
+
+        for x in payload:
+            for entry in x.findall('entry'):
+                ip = entry.get('ip')
+                if x.tag == 'login':
+                    self.user_ids[ip] = entry.get('name')
+                elif x.tag == 'logout':
+                    self.user_ids.pop(ip, None)
+                elif x.tag in ('register', 'unregister'):
+                    tags = set([member.text for member in
+                                entry.findall('tag/member')])
+                    if x.tag == 'register':
+                        self.tags.setdefault(ip, set()).update(tags)
+                    elif ip in self.tags:
+                        self.tags[ip] -= tags
+
+        return _response(result='<result><uid-response><version>2.0'
+                         '</version><payload/></uid-response></result>')
+
+    def __export(self, query):
+        category = query.get('category')
+        if category is None:
+            return (200, 'application/xml; charset=UTF-8', None,
+                    _response(status='error', code=6,
+                              msg='category required'))
+        if category == 'configuration':
+            return (200, 'application/xml', None,
+                    etree.tostring(self.running))
+
+        return (200, 'application/octet-stream',
+                'attachment; filename=%s.bin' % re.sub(r'[^-\w]', '_',
+                                                      category),
+                None)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'mockxapi'
+
+    def log_message(self, format, *args):
+        self.server.mock._log(DEBUG3, '%s %s', self.address_string(),
+                              format % args)
+
+    def do_GET(self):
+        x = urlsplit(self.path)
+        self.__request(x.path, x.query)
+
+    def do_POST(self):
+        length = int(self.headers.get('content-length', 0))
+        body = self.rfile.read(length).decode('utf-8', 'replace')
+        content_type = self.headers.get('content-type', '')
+        if not content_type.startswith('application/x-www-form-urlencoded'):
+            self.__send(415, 'text/plain', None,
+                        b'unsupported content-type\n')
+            return
+        self.__request(urlsplit(self.path).path, body)
+
+    def __request(self, path, qs):
+        mock = self.server.mock
+        if path.rstrip('/') != '/api':
+            self.__send(404, 'text/plain', None, b'not found\n')
+            return
+
+        query = dict((k, v[0]) for k, v in
+                     parse_qs(qs, keep_blank_values=True).items())
+        if 'key' not in query and 'x-pan-key' in self.headers:
+            query['key'] = self.headers['x-pan-key']
+        mock._log(DEBUG2, '%s type=%s action=%s', self.address_string(),
+                  query.get('type'), query.get('action'))
+
+        delay = mock.delay()
+        if delay > 0:
+            time.sleep(delay)
+
+        code, content_type, disposition, body = mock.handle(query)
+        self.__send(code, content_type, disposition, body)
+
+    def __send(self, code, content_type, disposition, body):
+        mock = self.server.mock
+        headers = [('Content-Type', content_type)]
+        if disposition is not None:
+            headers.append(('Content-Disposition', disposition))
+        if (body is not None and mock.compress and
+                'gzip' in self.headers.get('accept-encoding', '')):
+            x = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            body = x.compress(body) + x.flush()
+            headers.append(('Content-Encoding', 'gzip'))
+        length = mock.export_size if body is None else len(body)
+        headers.append(('Content-Length', str(length)))
+
+        self.send_response(code)
+        for x in headers:
+            self.send_header(*x)
+        self.end_headers()
+
+        if body is not None:
+            self.wfile.write(body)
+            return
+        block = (b'mock export\n' * (_block_size // 12 + 1))[:_block_size]
+        while length > 0:
+            self.wfile.write(block[:length])
+            length -= len(block)
+
+
+def usage():
+    usage = '''%s [options]
+    -h hostname           listen address (default 127.0.0.1)
+    -p port               listen port (default random)
+    --latency seconds     response delay
+    --jitter seconds      random additional response delay
+    --job-time seconds    commit and log job run time
+    --logs num            log entries available to log queries
+    --export-size bytes   export message body size
+    --addresses num       synthetic address objects
+    --rules num           synthetic security rules
+    --config path         initial configuration
+    --gzip                compress responses
+    --debug level         enable debug level up to 3
+    --help                display usage
+'''
+    print(usage % os.path.basename(sys.argv[0]), end='')
+
+
+if __name__ == '__main__':
+    # python -m pan.testing.mockxapi -p 8443
+    import getopt
+
+    kwargs = {}
+    debug = 0
+    long_options = ['latency=', 'jitter=', 'job-time=', 'logs=',
+                    'export-size=', 'addresses=', 'rules=', 'config=',
+                    'gzip', 'debug=', 'help']
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'h:p:', long_options)
+    except getopt.GetoptError as error:
+        print(error, file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        for opt, arg in opts:
+            if opt == '-h':
+                kwargs['hostname'] = arg
+            elif opt == '-p':
+                kwargs['port'] = int(arg)
+            elif opt in ('--latency', '--jitter'):
+                kwargs[opt[2:]] = float(arg)
+            elif opt == '--job-time':
+                kwargs['job_time'] = float(arg)
+            elif opt == '--logs':
+                kwargs['log_entries'] = int(arg)
+            elif opt == '--export-size':
+                kwargs['export_size'] = int(arg)
+            elif opt in ('--addresses', '--rules'):
+                kwargs[opt[2:]] = int(arg)
+            elif opt == '--config':
+                with open(arg) as f:
+                    kwargs['config'] = f.read()
+            elif opt == '--gzip':
+                kwargs['compress'] = True
+            elif opt == '--debug':
+                debug = int(arg)
+            elif opt == '--help':
+                usage()
+                sys.exit(0)
+    except (ValueError, IOError) as msg:
+        print('%s: %s' % (opt, msg), file=sys.stderr)
+        sys.exit(1)
+
+    if debug:
+        level = {1: DEBUG1, 2: DEBUG2}.get(debug, DEBUG3)
+        logging.basicConfig(level=level)
+
+    try:
+        mock = PanMockXapi(**kwargs)
+    except PanMockXapiError as msg:
+        print('pan.testing.mockxapi.PanMockXapi:', msg, file=sys.stderr)
+        sys.exit(1)
+
+    print('%s api_key %s' % (mock.uri, mock.api_key))
+    try:
+        mock.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,375 @@
+#
+# Copyright (c) 2015 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""Batched User-ID updates
+
+The pan.userid module implements the PanUserIdQueue class.  It
+collects login, logout and IP tag register and unregister updates,
+drops updates superseded by a later update for the same IP address
+(and tag), and sends them using ``type=user-id`` API requests with a
+``uid-message`` containing many entries.
+
+The PanUserIdReconciler class keeps the IP to user and IP to tag
+state last pushed to each device and pushes only the differences
+from the desired state.
+"""
+
+from __future__ import print_function
+import sys
+import re
+import time
+import threading
+import logging
+from collections import OrderedDict
+from xml.sax.saxutils import quoteattr, escape
+
+from . import DEBUG1, DEBUG2, DEBUG3
+import pan.xapi
+
+_max_entries = 1000
+_max_delay = 1.0
+# boot time difference which is a restart, not uptime granularity
+_boot_slack = 120
+
+
+class PanUserIdQueue:
+    def __init__(self, xapi, max_entries=None, max_delay=None, vsys=None,
+                 callback=None):
+        self._log = logging.getLogger(__name__).log
+        self.xapi = xapi
+        self.max_entries = max_entries
+        self.max_delay = max_delay
+        self.vsys = vsys
+        self.callback = callback
+        self.requests = 0
+        self.entries = 0  # entries sent
+        self.superseded = 0  # updates dropped
+        self.errors = 0  # entries which failed
+        self._lock = threading.Lock()  # pending updates
+        self._send_lock = threading.Lock()  # xapi
+        self.__reset()
+
+        if self.max_entries is None:
+            self.max_entries = _max_entries
+        if self.max_delay is None:
+            self.max_delay = _max_delay
+        for x, type in [('max_entries', int), ('max_delay', float)]:
+            value = getattr(self, x)
+            try:
+                value = type(value)
+                if value < 0 or (value == 0 and type is int):
+                    raise ValueError
+            except ValueError:
+                raise pan.xapi.PanXapiError('Invalid %s: %s' %
+                                            (x, value))
+            setattr(self, x, value)
+
+    def __str__(self):
+        return '\n'.join((': '.join((k, str(self.__dict__[k]))))
+                         for k in sorted(self.__dict__))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+        # don't suppress exception
+
+    def __reset(self):
+        self._users = OrderedDict()  # ip: (action, user, timeout)
+        self._tags = OrderedDict()  # (ip, tag): action
+        self._first = None  # time of the oldest pending update
+
+    def __len__(self):
+        with self._lock:
+            return len(self._users) + len(self._tags)
+
+    def login(self, ip, user, timeout=None):
+        self.__add_user(ip, ('login', user, timeout))
+
+    def logout(self, ip, user):
+        self.__add_user(ip, ('logout', user, None))
+
+    def register(self, ip, tags):
+        self.__add_tags(ip, tags, 'register')
+
+    def unregister(self, ip, tags):
+        self.__add_tags(ip, tags, 'unregister')
+
+    def __add_user(self, ip, update):
+        with self._lock:
+            if self._users.pop(ip, None) is not None:
+                self.superseded += 1
+            self._users[ip] = update
+            full = self.__added()
+        if full:
+            self.flush()
+
+    def __add_tags(self, ip, tags, action):
+        if isinstance(tags, str):
+            tags = [tags]
+        with self._lock:
+            for tag in tags:
+                if self._tags.pop((ip, tag), None) is not None:
+                    self.superseded += 1
+                self._tags[(ip, tag)] = action
+            full = self.__added()
+        if full:
+            self.flush()
+
+    def __added(self):
+        # Return True when the pending updates should be sent now.
+        # The updates are sent from the thread which adds an update
+        # (the PanXapi object is not thread-safe), so updates older
+        # than max_delay are sent with the next update or flush().
+        now = time.time()
+        if self._first is None:
+            self._first = now
+
+        return (len(self._users) + len(self._tags) >= self.max_entries or
+                now - self._first >= self.max_delay)
+
+    def close(self):
+        self.flush()
+
+    def flush(self):
+        # send the pending updates; PanXapiError is raised when a
+        # request failed without per-entry responses
+        with self._lock:
+            users = self._users
+            tags = self._tags
+            self.__reset()
+
+        if not users and not tags:
+            return
+
+        entries = []
+        for ip, (action, user, timeout) in users.items():
+            entries.append((action, '<entry name=%s ip=%s%s/>' %
+                            (quoteattr(user), quoteattr(ip),
+                             ' timeout="%d"' % timeout
+                             if timeout is not None else '')))
+
+        # one entry per IP with its tags
+        tag_entries = OrderedDict()
+        for (ip, tag), action in tags.items():
+            tag_entries.setdefault((action, ip), []).append(tag)
+        for (action, ip), x in tag_entries.items():
+            while x:
+                members, x = x[:self.max_entries], x[self.max_entries:]
+                entries.append((action,
+                                '<entry ip=%s><tag>%s</tag></entry>' %
+                                (quoteattr(ip),
+                                 ''.join(['<member>%s</member>' %
+                                          escape(tag)
+                                          for tag in members]))))
+
+        error = None
+        with self._send_lock:
+            for i in range(0, len(entries), self.max_entries):
+                try:
+                    self.__send(entries[i:i + self.max_entries])
+                except pan.xapi.PanXapiError as msg:
+                    error = msg
+        if error is not None:
+            raise error
+
+    def __send(self, entries):
+        actions = OrderedDict()
+        for action in ['login', 'logout', 'register', 'unregister']:
+            actions[action] = []
+        for action, entry in entries:
+            actions[action].append(entry)
+
+        cmd = ('<uid-message><version>2.0</version><type>update</type>'
+               '<payload>%s</payload></uid-message>' %
+               ''.join(['<%s>%s</%s>' % (action, ''.join(x), action)
+                        for action, x in actions.items() if x]))
+
+        self._log(DEBUG1, 'uid-message: %d entries, %d bytes',
+                  len(entries), len(cmd))
+        self.requests += 1
+        self.entries += len(entries)
+
+        try:
+            self.xapi.user_id(cmd=cmd, vsys=self.vsys)
+        except pan.xapi.PanXapiError as msg:
+            failed = [dict(entry.attrib, action=action) for action, entry
+                      in self.xapi._user_id_entries()]
+            if not failed:
+                # the request failed, not entries
+                self.errors += len(entries)
+                raise
+            self._log(DEBUG1, 'uid-message: %d entries failed: %s',
+                      len(failed), msg)
+            self.errors += len(failed)
+            if self.callback is not None:
+                self.callback(failed)
+
+
+class PanUserIdReconciler:
+    # Keep the last state pushed to each device and send only the
+    # differences from the desired state.
+    def __init__(self, max_entries=None, check_restart=True):
+        self._log = logging.getLogger(__name__).log
+        self.max_entries = max_entries
+        self.check_restart = check_restart
+        self._lock = threading.Lock()
+        self._devices = {}  # (hostname, serial, vsys): _DeviceState
+
+    def __str__(self):
+        return '\n'.join((': '.join((k, str(self.__dict__[k]))))
+                         for k in sorted(self.__dict__))
+
+    def forget(self, hostname=None, serial=None, vsys=None):
+        # the next push() to the device, or all devices when
+        # hostname is None, is a full push
+        with self._lock:
+            if hostname is None:
+                self._devices = {}
+            else:
+                self._devices.pop((hostname, serial, vsys), None)
+
+    def push(self, xapi, users=None, tags=None, vsys=None, timeout=None):
+        # users: {ip: user}, tags: {ip: [tag, ...]}; None leaves the
+        # mappings of that type unmanaged
+        key = (xapi.hostname, xapi.serial, vsys)
+        with self._lock:
+            last = self._devices.get(key)
+
+        boot = None
+        if self.check_restart:
+            boot = self.__boot_time(xapi)
+
+        full = last is None or not last.synced
+        if not full and boot is not None and last.boot is not None and \
+                abs(boot - last.boot) > _boot_slack:
+            self._log(DEBUG1, 'reconciler %s: device restarted', key)
+            full = True
+        if last is None:
+            last = _DeviceState()
+
+        state = _DeviceState()
+        state.boot = boot
+        state.users = dict(users) if users is not None else last.users
+        if tags is not None:
+            state.tags = set()
+            for ip, x in tags.items():
+                if isinstance(x, str):
+                    x = [x]
+                state.tags.update([(ip, tag) for tag in x])
+        else:
+            state.tags = last.tags
+
+        result = {
+            'full': full,
+            'login': 0,
+            'logout': 0,
+            'register': 0,
+            'unregister': 0,
+            'errors': [],
+            }
+        # A failed push leaves the device state unknown: the next push
+        # is full and removes mappings from either state.  The queue
+        # sends when max_entries are pending.
+        unknown = _DeviceState()
+        unknown.users = dict(last.users)
+        unknown.users.update(state.users)
+        unknown.tags = last.tags | state.tags
+        unknown.synced = False
+        with self._lock:
+            self._devices[key] = unknown
+        queue = PanUserIdQueue(xapi, max_entries=self.max_entries,
+                               max_delay=float('inf'), vsys=vsys,
+                               callback=result['errors'].extend)
+
+        if users is not None:
+            for ip, user in state.users.items():
+                if full or last.users.get(ip) != user:
+                    queue.login(ip, user, timeout)
+                    result['login'] += 1
+            for ip, user in last.users.items():
+                if ip not in state.users:
+                    queue.logout(ip, user)
+                    result['logout'] += 1
+
+        if tags is not None:
+            x = state.tags if full else state.tags - last.tags
+            for ip, tag in x:
+                queue.register(ip, tag)
+            result['register'] = len(x)
+            x = last.tags - state.tags
+            for ip, tag in x:
+                queue.unregister(ip, tag)
+            result['unregister'] = len(x)
+
+        self._log(DEBUG1, 'reconciler %s: %s push: login %d logout %d '
+                  'register %d unregister %d', key,
+                  'full' if full else 'delta', result['login'],
+                  result['logout'], result['register'],
+                  result['unregister'])
+
+        queue.flush()
+        if not result['errors']:
+            with self._lock:
+                self._devices[key] = state
+
+        return result
+
+    def __boot_time(self, xapi):
+        xapi.op(cmd='show system info', cmd_xml=True)
+        elem = xapi.element_root.find('./result/system/uptime')
+        if elem is None or elem.text is None:
+            return None
+        x = re.search(r'(?:(\d+) days?, *)?(\d+):(\d+):(\d+)', elem.text)
+        if x is None:
+            self._log(DEBUG1, 'reconciler: invalid uptime: %s', elem.text)
+            return None
+
+        days, hours, minutes, seconds = [int(y) if y else 0
+                                         for y in x.groups()]
+        return time.time() - (((days * 24 + hours) * 60 + minutes) * 60 +
+                              seconds)
+
+
+class _DeviceState:
+    def __init__(self):
+        self.users = {}
+        self.tags = set()  # (ip, tag)
+        self.boot = None
+        self.synced = True  # False: the last push failed
+
+
+if __name__ == '__main__':
+    # python -m pan.userid tag count
+    import pan.xapi
+
+    if len(sys.argv) < 3:
+        print('usage: python -m pan.userid tag count', file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        xapi = pan.xapi.PanXapi(tag=sys.argv[1], keepalive=True)
+        with xapi.user_id_queue() as queue:
+            for i in range(int(sys.argv[2])):
+                ip = '192.0.2.%d' % (i % 256)
+                queue.login(ip, 'user%d' % i)
+                queue.register(ip, ['pan-python'])
+    except pan.xapi.PanXapiError as msg:
+        print('pan.userid.PanUserIdQueue:', msg, file=sys.stderr)
+        sys.exit(1)
+    print('%d entries, %d superseded, %d requests, %d errors' %
+          (queue.entries, queue.superseded, queue.requests, queue.errors))
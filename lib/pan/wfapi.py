@@ -31,6 +31,7 @@ from __future__ import print_function
 import socket
 import sys
 import os
+import hashlib
 from io import BytesIO
 import email
 import email.errors
@@ -41,7 +42,7 @@ try:
     from urllib.request import Request, \
         build_opener, HTTPErrorProcessor, HTTPSHandler
     from urllib.error import URLError
-    from urllib.parse import urlencode
+    from urllib.parse import urlencode, parse_qs
     from http.client import responses
     _legacy_urllib = False
 except ImportError:
@@ -49,12 +50,16 @@ except ImportError:
     from urllib2 import Request, URLError, \
         build_opener, HTTPErrorProcessor, HTTPSHandler
     from urllib import urlencode
+    from urlparse import parse_qs
     from httplib import responses
     _legacy_urllib = True
 
 import xml.etree.ElementTree as etree
 from . import __version__, DEBUG1, DEBUG2, DEBUG3
 import pan.rc
+import pan.compress
+import pan.metrics
+import pan.replay
 
 try:
     import ssl
@@ -63,6 +68,7 @@ except ImportError:
 
 _cloud_server = 'wildfire.paloaltonetworks.com'
 _encoding = 'utf-8'
+_logger = logging.getLogger(__name__)
 _rfc2231_encode = False
 _wildfire_responses = {
     418: 'Unsupported File Type',
@@ -120,13 +126,24 @@ class PanWFapi:
                  api_key=None,
                  timeout=None,
                  http=False,
-                 ssl_context=None):
+                 ssl_context=None,
+                 compress=True,
+                 metrics=None,
+                 recorder=None,
+                 replay=None):
         self._log = logging.getLogger(__name__).log
         self.tag = tag
         self.hostname = hostname
         self.api_key = None
         self.timeout = timeout
         self.ssl_context = ssl_context
+        self.compress = compress
+        self.metrics = metrics
+        self._request_metrics = None
+        self.recorder = recorder
+        self.replay = replay
+        self._opener = None  # created once, see _urlopen()
+        self._opener_context = None
 
         self._log(DEBUG3, 'Python version: %s', sys.version)
         self._log(DEBUG3, 'xml.etree.ElementTree version: %s', etree.VERSION)
@@ -140,6 +157,19 @@ class PanWFapi:
             except ValueError:
                 raise PanWFapiError('Invalid timeout: %s' % self.timeout)
 
+        if (self.metrics is not None and
+                not isinstance(self.metrics, pan.metrics.PanMetrics)):
+            raise PanWFapiError('metrics not PanMetrics')
+
+        if (self.recorder is not None and
+                not isinstance(self.recorder, pan.replay.PanRecorder)):
+            raise PanWFapiError('recorder not PanRecorder')
+        if (self.replay is not None and
+                not isinstance(self.replay, pan.replay.PanReplay)):
+            raise PanWFapiError('replay not PanReplay')
+        if self.recorder is not None and self.replay is not None:
+            raise PanWFapiError('recorder and replay are mutually exclusive')
+
         if ssl_context is not None:
             try:
                 ssl.SSLContext(ssl.PROTOCOL_SSLv23)
@@ -191,7 +221,33 @@ class PanWFapi:
         self.attachment = None
 
     def __set_response(self, response):
-        message_body = response.read()
+        result = self.__set_message(response)
+        self.__metrics_finish(response)
+        return result
+
+    def __metrics_finish(self, response):
+        x = self._request_metrics
+        if x is None:
+            return
+        self._request_metrics = None
+        x.mark('download' if x.download is None else 'parse')
+        x.finish()
+        x.http_code = self.http_code
+        if response:
+            x.response_bytes = getattr(response, 'wire', None)
+            x.decoded_bytes = getattr(response, 'decoded', None)
+        if self._msg is not None:
+            x.error = self._msg
+        self.metrics.record(x)
+
+    def __set_message(self, response):
+        try:
+            message_body = response.read()
+        except pan.compress.PanCompressError as e:
+            self._msg = str(e)
+            return False
+        if self._request_metrics is not None:
+            self._request_metrics.mark('download')
 
         content_type = self._message.get_content_type()
         if not content_type:
@@ -228,7 +284,7 @@ class PanWFapi:
         return True
 
     def __set_xml_response(self, message_body):
-        self._log(DEBUG2, '__set_xml_response: %s', repr(message_body))
+        self._log(DEBUG2, '__set_xml_response: %r', message_body)
         self.response_type = 'xml'
 
         _message_body = message_body.decode(_encoding)
@@ -258,7 +314,7 @@ class PanWFapi:
         return True
 
     def __set_html_response(self, message_body):
-        self._log(DEBUG2, '__set_html_response: %s', repr(message_body))
+        self._log(DEBUG2, '__set_html_response: %r', message_body)
         self.response_type = 'html'
 
         _message_body = message_body.decode()
@@ -280,8 +336,10 @@ class PanWFapi:
         if not s:
             return None
 
-        self._log(DEBUG3, 'xml_root: %s', type(s))
-        self._log(DEBUG3, 'xml_root.decode(): %s', type(s.decode(_encoding)))
+        if _logger.isEnabledFor(DEBUG3):
+            self._log(DEBUG3, 'xml_root: %s', type(s))
+            self._log(DEBUG3, 'xml_root.decode(): %s',
+                      type(s.decode(_encoding)))
         return s.decode(_encoding)
 
 # XXX Unicode notes
@@ -306,9 +364,12 @@ class PanWFapi:
         if _isunicode(body):
             body = body.encode()
 
-        self._log(DEBUG3, 'body: %s', repr(body))
+        self._log(DEBUG3, 'body: %r', body)
 
         request = Request(url, body, headers)
+        if self.compress:
+            request.add_header('Accept-Encoding',
+                               pan.compress.accept_encoding)
 
         self._log(DEBUG1, 'method: %s', request.get_method())
         self._log(DEBUG1, 'headers: %s', request.header_items())
@@ -323,13 +384,34 @@ class PanWFapi:
         if self.timeout is not None:
             kwargs['timeout'] = self.timeout
 
+        if self.metrics is not None:
+            self._request_metrics = pan.metrics.PanRequestMetrics(
+                'wfapi', self.hostname, request_uri)
+            self._request_metrics.request_bytes = \
+                len(body) if body is not None else 0
+
         try:
-            response = self._urlopen(**kwargs)
-        except (URLError, IOError) as e:
+            if self.replay is not None:
+                response = self.replay.response(
+                    'wfapi', self.hostname,
+                    self.__replay_query(request_uri, body, headers))
+            else:
+                response = self._urlopen(**kwargs)
+        except (URLError, IOError, pan.replay.PanReplayError) as e:
             self._log(DEBUG2, 'urlopen() exception: %s', sys.exc_info())
             self._msg = str(e)
+            self.__metrics_finish(None)
+            if self.recorder is not None and hasattr(e, 'code'):
+                # HTTPError is also the response
+                self.__record(request_uri, body, headers, e).read()
             return False
 
+        if self.recorder is not None:
+            response = self.__record(request_uri, body, headers, response)
+
+        if self._request_metrics is not None:
+            self._request_metrics.mark('wait')
+
         self.http_code = response.getcode()
         if hasattr(response, 'reason'):
             # 3.2
@@ -354,6 +436,16 @@ class PanWFapi:
         self._log(DEBUG2, 'HTTP response headers:')
         self._log(DEBUG2, '%s', self._message)
 
+        try:
+            response = pan.compress.PanDecodedResponse(
+                response, pan.compress.content_encoding(response),
+                pan.compress.default_stats, self.hostname)
+        except pan.compress.PanCompressError as e:
+            response.close()
+            self._msg = str(e)
+            self.__metrics_finish(None)
+            return False
+
         if not (200 <= self.http_code < 300):
             self._msg = 'HTTP Error %s: %s' % (self.http_code,
                                                self.http_reason)
@@ -362,6 +454,28 @@ class PanWFapi:
 
         return response
 
+    def __record(self, request_uri, body, headers, response):
+        return self.recorder.record(
+            'wfapi', self.hostname,
+            self.__replay_query(request_uri, body, headers), response)
+
+    def __replay_query(self, request_uri, body, headers):
+        # form fields identify a recorded response; a multipart
+        # form is identified by a digest without the random boundary
+        query = {'uri': request_uri}
+        content_type = headers.get('Content-Type', '')
+        if content_type.startswith('multipart/form-data'):
+            boundary = content_type.split('boundary=')[-1].encode()
+            x = body.replace(boundary, b'')
+            x = x.replace(self.api_key.encode(), b'')
+            query['body'] = hashlib.sha256(x).hexdigest()
+        elif body:
+            for k, v in parse_qs(body.decode(),
+                                 keep_blank_values=True).items():
+                query[k] = v[0]
+
+        return query
+
     def _read_file(self, path):
         try:
             f = open(path, 'rb')
@@ -375,7 +489,7 @@ class PanWFapi:
 
         self._log(DEBUG2, 'path: %s %d', type(path), len(path))
         self._log(DEBUG2, 'path: %s size: %d', path, len(buf))
-        if logging.getLogger(__name__).getEffectiveLevel() == DEBUG3:
+        if _logger.isEnabledFor(DEBUG3):
             import hashlib
             md5 = hashlib.md5()
             md5.update(buf)
@@ -613,8 +727,7 @@ class PanWFapi:
     # allow non-2XX error codes
     # see http://bugs.python.org/issue18543 for why we can't just
     # install a new HTTPErrorProcessor()
-    @staticmethod
-    def _urlopen(url, data=None,
+    def _urlopen(self, url, data=None,
                  timeout=socket._GLOBAL_DEFAULT_TIMEOUT,
                  cafile=None, capath=None, cadefault=False,
                  context=None):
@@ -622,16 +735,28 @@ class PanWFapi:
         def http_response(request, response):
             return response
 
-        http_error_processor = HTTPErrorProcessor()
-        http_error_processor.https_response = http_response
-
-        if context:
-            https_handler = HTTPSHandler(context=context)
-            opener = build_opener(https_handler, http_error_processor)
-        else:
-            opener = build_opener(http_error_processor)
-
-        return opener.open(url, data, timeout)
+        # build the opener once; the HTTPSHandler keeps the SSL
+        # context so it is not created again for each request
+        if self._opener is None or self._opener_context is not context:
+            http_error_processor = HTTPErrorProcessor()
+            http_error_processor.https_response = http_response
+
+            self._opener_context = context
+            if (context is None and
+                    hasattr(ssl, '_create_default_https_context')):
+                # HTTPSConnection() would create the default
+                # context for each connection
+                context = ssl._create_default_https_context()
+
+            if context:
+                https_handler = HTTPSHandler(context=context)
+                self._opener = build_opener(https_handler,
+                                            http_error_processor)
+            else:
+                self._opener = build_opener(http_error_processor)
+            self._log(DEBUG3, '_urlopen: build_opener()')
+
+        return self._opener.open(url, data, timeout)
 
 
 def cloud_ssl_context():
@@ -25,7 +25,10 @@ from __future__ import print_function
 import sys
 import re
 import time
+import socket
+import hashlib
 import logging
+import threading
 try:
     import ssl
 except ImportError:
@@ -37,6 +40,7 @@ try:
         build_opener, install_opener, HTTPSHandler
     from urllib.error import URLError
     from urllib.parse import urlencode
+    from http.client import HTTPException
     _legacy_urllib = False
 except ImportError:
     # 2.7
@@ -47,21 +51,98 @@ except ImportError:
     except:
         pass
     from urllib import urlencode
+    from httplib import HTTPException
     _legacy_urllib = True
 
 import xml.etree.ElementTree as etree
+from xml.parsers import expat
 
 from . import __version__, DEBUG1, DEBUG2, DEBUG3
 import pan.rc
+import pan.pool
+import pan.poll
+import pan.job
+import pan.batch
+import pan.userid
+import pan.cache
+import pan.keycache
+import pan.retry
+import pan.ratelimit
+import pan.compress
+import pan.metrics
+import pan.replay
 
 _encoding = 'utf-8'
-_job_query_interval = 0.5
+_logger = logging.getLogger(__name__)
+_export_chunk_size = 64 * 1024
+_log_page_size = 1000
+_cache_actions = ('show', 'get')
+_ssl_context = None  # default context, created once
+_ssl_context_lock = threading.Lock()
+
+
+def _default_ssl_context():
+    # The default context is shared by all PanXapi objects: creating
+    # a context is not cheap, and a shared pool reuses connections
+    # and resumes TLS sessions only for the same context.
+    global _ssl_context
+    with _ssl_context_lock:
+        if (_ssl_context is None and
+                hasattr(ssl, '_create_unverified_context')):
+            # don't perform certificate verification
+            _ssl_context = ssl._create_unverified_context()
+
+    return _ssl_context
 
 
 class PanXapiError(Exception):
     pass
 
 
+class PanXapiResponse:
+    # XML response document; the raw bytes are kept and the decoded
+    # text and element tree are built when first used.
+    def __init__(self, body):
+        self.body = body
+        self._document = None
+        self._root = None
+
+    def __str__(self):
+        return 'PanXapiResponse: %d bytes' % len(self.body)
+
+    def document(self):
+        if self._document is None:
+            self._document = self.body.decode(_encoding)
+        return self._document
+
+    def root(self):
+        if self._root is None:
+            self._root = etree.fromstring(self.body)
+        return self._root
+
+    def root_attrib(self):
+        # Attributes of the root element.  The document is checked
+        # to be well-formed without building the tree, so a malformed
+        # response is detected when it is received.
+        if self._root is not None:
+            return self._root.attrib
+
+        parser = expat.ParserCreate()
+        attrib = []
+
+        def start(name, attrs):
+            attrib.append(attrs)
+            parser.StartElementHandler = None
+
+        parser.StartElementHandler = start
+        try:
+            parser.Parse(self.body, True)
+        except expat.ExpatError as msg:
+            raise etree.ParseError(msg)
+
+        return attrib[0] if attrib else None
+
+
 class PanXapi:
     def __init__(self,
                  tag=None,
@@ -74,7 +155,20 @@ class PanXapi:
                  use_http=False,
                  use_get=False,
                  timeout=None,
-                 ssl_context=None):
+                 ssl_context=None,
+                 keepalive=False,
+                 pool=None,
+                 iterparse=None,
+                 poll=None,
+                 cache=None,
+                 key_cache=None,
+                 retry=None,
+                 breaker=None,
+                 governor=None,
+                 compress=True,
+                 metrics=None,
+                 recorder=None,
+                 replay=None):
         self._log = logging.getLogger(__name__).log
         self.tag = tag
         self.api_username = None
@@ -86,6 +180,23 @@ class PanXapi:
         self.use_get = use_get
         self.timeout = timeout
         self.ssl_context = ssl_context
+        self.pool = pool
+        self._export_file = None  # export(file=) destination
+        self.iterparse = iterparse
+        self._iterparse = None  # entries() parser state
+        self.poll = poll
+        self.cache = cache
+        self.key_cache = key_cache
+        self.retry = retry
+        self.breaker = breaker
+        self.governor = governor
+        self.compress = compress
+        self.metrics = metrics
+        self._request_metrics = None  # last request
+        self.recorder = recorder
+        self.replay = replay
+        self._key_cached = False  # api_key from key_cache
+        self._http_code = None
 
         self._log(DEBUG3, 'Python version: %s', sys.version)
         self._log(DEBUG3, 'xml.etree.ElementTree version: %s', etree.VERSION)
@@ -181,6 +292,50 @@ class PanXapi:
             self.uri += ':%s' % self.port
         self.uri += '/api/'
 
+        if self.poll is None:
+            self.poll = pan.poll.PanPollBackoff()
+        elif not isinstance(self.poll, pan.poll.PanPollStrategy):
+            raise PanXapiError('poll not PanPollStrategy')
+
+        if (self.cache is not None and
+                not isinstance(self.cache, pan.cache.PanXapiCache)):
+            raise PanXapiError('cache not PanXapiCache')
+
+        if (self.key_cache is not None and
+                not isinstance(self.key_cache, pan.keycache.PanKeyCache)):
+            raise PanXapiError('key_cache not PanKeyCache')
+
+        if (self.metrics is not None and
+                not isinstance(self.metrics, pan.metrics.PanMetrics)):
+            raise PanXapiError('metrics not PanMetrics')
+
+        if (self.recorder is not None and
+                not isinstance(self.recorder, pan.replay.PanRecorder)):
+            raise PanXapiError('recorder not PanRecorder')
+        if (self.replay is not None and
+                not isinstance(self.replay, pan.replay.PanReplay)):
+            raise PanXapiError('replay not PanReplay')
+        if self.recorder is not None and self.replay is not None:
+            raise PanXapiError('recorder and replay are mutually exclusive')
+
+        if (self.retry is not None and
+                not isinstance(self.retry, pan.retry.PanRetry)):
+            raise PanXapiError('retry not PanRetry')
+        if (self.breaker is not None and
+                not isinstance(self.breaker, pan.retry.PanCircuitBreaker)):
+            raise PanXapiError('breaker not PanCircuitBreaker')
+
+        if self.governor is None:
+            self.governor = pan.ratelimit.default_governor
+        elif not isinstance(self.governor, pan.ratelimit.PanGovernor):
+            raise PanXapiError('governor not PanGovernor')
+
+        if keepalive and self.pool is None:
+            try:
+                self.pool = pan.pool.PanConnectionPool()
+            except pan.pool.PanConnectionPoolError as msg:
+                raise PanXapiError(str(msg))
+
         if _legacy_urllib:
             self._log(DEBUG2, 'using legacy urllib')
 
@@ -188,16 +343,71 @@ class PanXapi:
         return '\n'.join((': '.join((k, str(self.__dict__[k]))))
                          for k in sorted(self.__dict__))
 
-    def __clear_response(self):
+    # Response attributes which are built from self.response when
+    # first used.  __getattr__() is only called for an attribute
+    # which is not set, so an assigned value (for example from
+    # iterparse) is used as is.
+    _lazy_attributes = ('xml_document', 'element_root',
+                        'element_result', 'status_detail')
+
+    def __getattr__(self, name):
+        if name not in PanXapi._lazy_attributes:
+            raise AttributeError(name)
+        value = self.__lazy_attribute(name)
+        self.__dict__[name] = value
+
+        return value
+
+    def __lazy_attribute(self, name):
+        response = self.__dict__.get('response')
+        if response is None:
+            return None
+
+        if name == 'xml_document':
+            return response.document()
+        elif name == 'element_root':
+            start = time.time()
+            try:
+                root = response.root()
+            except etree.ParseError as msg:
+                raise PanXapiError('ElementTree.fromstring ParseError: %s'
+                                   % msg)
+            x = self.__dict__.get('_request_metrics')
+            if (self.metrics is not None and x is not None and
+                    x.total is not None and x.tree is None):
+                # the document is parsed after the request is recorded
+                x.tree = time.time() - start
+                self.metrics.observe(x, 'tree', x.tree)
+            return root
+        elif name == 'element_result':
+            if self.element_root is None:
+                return None
+            elem = self.element_root.find('result')
+            if elem is None:
+                # type=report
+                elem = self.element_root.find('report/result')
+            return elem
+        elif name == 'status_detail':
+            if self.element_root is None:
+                return None
+            return self.__get_response_msg()
+
+    def _clear_response(self):
+        if self._iterparse is not None:
+            # entries() not consumed; connection can't be reused
+            self._iterparse[0].close()
+            self._iterparse = None
+
         # XXX naming
         self.status = None
         self.status_code = None
-        self.status_detail = None
-        self.xml_document = None
+        self.response = None
+        for x in PanXapi._lazy_attributes:
+            self.__dict__.pop(x, None)
         self.text_document = None
-        self.element_root = None
-        self.element_result = None
         self.export_result = None
+        self._http_code = None
+        self._request_metrics = None
 
     def __get_header(self, response, name):
         """use getheader() method depending or urllib in use"""
@@ -227,9 +437,30 @@ class PanXapi:
         return types
 
     def __set_response(self, response):
-        message_body = response.read()
-
         content_type = self.__get_header(response, 'content-type')
+
+        if (self._export_file is not None and
+            ('application/octet-stream' in content_type or
+             ('text/plain' in content_type and
+              self.__get_header(response, 'content-disposition')))):
+            # write attachment to file as it is read
+            return self.__set_stream_response(response, None)
+
+        if self.iterparse is not None and 'application/xml' in content_type:
+            return self.__set_iterparse_response(response)
+
+        try:
+            message_body = response.read()
+        except pan.compress.PanCompressError as msg:
+            response.close()
+            self.status_detail = str(msg)
+            return False
+        except (IOError, HTTPException) as msg:
+            response.close()
+            self.status_detail = 'read: %s' % msg
+            return False
+        self._metrics_mark('download')
+
         if not content_type:
             self.status_detail = 'no content-type response header'
             return False
@@ -281,38 +512,189 @@ class PanXapi:
 
         export_result = {}
         export_result['file'] = filename
-        export_result['content'] = message_body
+        if message_body is None:
+            if not self.__write_stream_response(response, export_result):
+                return False
+        else:
+            export_result['content'] = message_body
         self.export_result = export_result
         self.status = 'success'
         return True
 
+    def __write_stream_response(self, response, export_result):
+        # Copy the message body to the export file in chunks so
+        # memory use does not depend on the size of the attachment.
+        f = self._export_file
+        path = None
+        if not hasattr(f, 'write'):
+            path = f
+            try:
+                f = open(path, 'wb')
+            except IOError as msg:
+                response.close()
+                self.status_detail = 'open %s: %s' % (path, msg)
+                return False
+
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            while True:
+                try:
+                    chunk = response.read(_export_chunk_size)
+                except (IOError, HTTPException,
+                        pan.compress.PanCompressError) as msg:
+                    response.close()
+                    self.status_detail = 'read: %s' % msg
+                    return False
+                if not chunk:
+                    break
+                try:
+                    f.write(chunk)
+                except IOError as msg:
+                    response.close()
+                    self.status_detail = 'write %s: %s' % \
+                        (path if path is not None else f, msg)
+                    return False
+                digest.update(chunk)
+                size += len(chunk)
+        finally:
+            if path is not None:
+                f.close()
+
+        self._log(DEBUG1, 'export: %d bytes sha256 %s',
+                  size, digest.hexdigest())
+
+        export_result['content'] = None
+        export_result['path'] = path
+        export_result['size'] = size
+        export_result['sha256'] = digest.hexdigest()
+        return True
+
     def __set_xml_response(self, message_body):
-        self.xml_document = message_body.decode(_encoding)
+        # The tree is not built until a response attribute which
+        # requires it is used; the status is from the root element
+        # attributes.
+        self.response = PanXapiResponse(message_body)
+        for x in PanXapi._lazy_attributes:
+            self.__dict__.pop(x, None)
+
+        if _logger.isEnabledFor(DEBUG3):
+            self._log(DEBUG3, 'xml_document: %s', self.xml_document)
+            self._log(DEBUG3, 'message_body: %s', type(message_body))
 
         try:
-            element = etree.fromstring(message_body)
+            attrib = self.response.root_attrib()
         except etree.ParseError as msg:
+            self.element_root = None
             self.status_detail = 'ElementTree.fromstring ParseError: %s' % msg
             return False
         # we probably won't see MemoryError when it happens but try to catch
         except MemoryError as msg:
+            self.element_root = None
             self.status_detail = 'ElementTree.fromstring MemoryError: %s' % msg
             return False
         except Exception as msg:
+            self.element_root = None
             self.status_detail = '%s: %s' % (sys.exc_info()[0].__name__, msg)
             return False
 
+        if not self.__set_xml_status(attrib):
+            if self.status is not None:
+                # error response: build the tree for status_detail
+                try:
+                    self.status_detail
+                except PanXapiError as msg:
+                    self.element_root = None
+                    self.status_detail = str(msg)
+            return False
+
+        return True
+
+    def __set_iterparse_response(self, response):
+        # Parse the response up to the start of the first element
+        # with the iterparse tag; the elements are then parsed one at
+        # a time by entries().  The response document is not saved
+        # in xml_document.
+        events = etree.iterparse(response, events=('start', 'end'))
+        root = None
+        stack = []
+
+        try:
+            for event, elem in events:
+                if event == 'start':
+                    if root is None:
+                        root = elem
+                    stack.append(elem)
+                    if elem.tag == self.iterparse:
+                        self._iterparse = (response, events, stack,
+                                           len(stack))
+                        break
+                else:
+                    stack.pop()
+        except etree.ParseError as msg:
+            response.close()
+            self.status_detail = 'ElementTree.iterparse ParseError: %s' % msg
+            return False
+        except pan.compress.PanCompressError as msg:
+            response.close()
+            self.status_detail = str(msg)
+            return False
+
+        if root is None:
+            self.status_detail = 'ElementTree.iterparse: no root element'
+            return False
+
+        self._log(DEBUG2, 'iterparse %s: %s', self.iterparse,
+                  'started' if self._iterparse else 'not found')
+
+        return self.__set_xml_element(root)
+
+    def entries(self):
+        # Generator which returns each iterparse element of the last
+        # response; the element is removed from the tree and cleared
+        # after it is returned.
+        if self._iterparse is None:
+            return
+
+        response, events, stack, depth = self._iterparse
+        try:
+            for event, elem in events:
+                if event == 'start':
+                    stack.append(elem)
+                    continue
+                if elem.tag == self.iterparse and len(stack) == depth:
+                    yield elem
+                    stack.pop()
+                    stack[-1].remove(elem)
+                    elem.clear()
+                else:
+                    stack.pop()
+        except etree.ParseError as msg:
+            response.close()
+            raise PanXapiError('ElementTree.iterparse ParseError: %s' % msg)
+        except pan.compress.PanCompressError as msg:
+            response.close()
+            raise PanXapiError(str(msg))
+        finally:
+            if self._iterparse is not None and \
+                    self._iterparse[0] is response:
+                self._iterparse = None
+
+    def __set_xml_element(self, element):
         self.element_root = element
         self.element_result = self.element_root.find('result')  # can be None
         if self.element_result is None:
             # type=report
             self.element_result = self.element_root.find('report/result')
 
-        self._log(DEBUG3, 'xml_document: %s', self.xml_document)
-        self._log(DEBUG3, 'message_body: %s', type(message_body))
-        self._log(DEBUG3, 'message_body.decode(): %s', type(self.xml_document))
+        if not self.__set_xml_status(self.element_root.attrib):
+            return False
+
+        self.status_detail = self.__get_response_msg()
 
-        response_attrib = self.element_root.attrib
+        return True
+
+    def __set_xml_status(self, response_attrib):
         if not response_attrib:
             # XXX error?
             self.status_detail = 'no response element status attribute'
@@ -327,8 +709,6 @@ class PanXapi:
         if 'code' in response_attrib:
             self.status_code = response_attrib['code']
 
-        self.status_detail = self.__get_response_msg()
-
         if self.status == 'success':
             return True
         else:
@@ -351,11 +731,9 @@ class PanXapi:
         # XML API response message formats are not documented
 
         # type=user-id register and unregister
-        path = './msg/line/uid-response/payload/*/entry'
-        elem = self.element_root.findall(path)
+        elem = self._user_id_entries()
         if len(elem) > 0:
-            self._log(DEBUG2, 'path: %s %s', path, elem)
-            for line in elem:
+            for action, line in elem:
                 msg = ''
                 for key in line.keys():
                     msg += '%s: %s ' % (key, line.get(key))
@@ -419,20 +797,23 @@ class PanXapi:
 
         return None
 
-    # XXX store tostring() results?
     # XXX rework this
     def xml_root(self):
-        if self.element_root is None:
-            # May not be set due to ParseError, so return response
+        if self.response is not None:
+            # response document as received
             return self.xml_document
+        if self.element_root is None:
+            return None
 
         s = etree.tostring(self.element_root, encoding=_encoding)
 
         if not s:
             return None
 
-        self._log(DEBUG3, 'xml_root: %s', type(s))
-        self._log(DEBUG3, 'xml_root.decode(): %s', type(s.decode(_encoding)))
+        if _logger.isEnabledFor(DEBUG3):
+            self._log(DEBUG3, 'xml_root: %s', type(s))
+            self._log(DEBUG3, 'xml_root.decode(): %s',
+                      type(s.decode(_encoding)))
 
         return s.decode(_encoding)
 
@@ -451,12 +832,15 @@ class PanXapi:
         if not s:
             return None
 
-        self._log(DEBUG3, 'xml_result: %s', type(s))
-        self._log(DEBUG3, 'xml_result.decode(): %s', type(s.decode(_encoding)))
+        if _logger.isEnabledFor(DEBUG3):
+            self._log(DEBUG3, 'xml_result: %s', type(s))
+            self._log(DEBUG3, 'xml_result.decode(): %s',
+                      type(s.decode(_encoding)))
 
         return s.decode(_encoding)
 
-    def __api_request(self, query):
+    @staticmethod
+    def _encode_query(query):
         # type=keygen request will urlencode key if needed so don't
         # double encode
         if 'key' in query:
@@ -468,21 +852,42 @@ class PanXapi:
         else:
             data = urlencode(query)
 
-        self._log(DEBUG3, 'query: %s', query)
-        self._log(DEBUG3, 'data: %s', type(data))
-        self._log(DEBUG3, 'data.encode(): %s', type(data.encode()))
+        return data
+
+    def __api_request(self, query):
+        data = self._encode_query(query)
+
+        if _logger.isEnabledFor(DEBUG3):
+            # don't encode the query unless it is logged
+            self._log(DEBUG3, 'query: %s', query)
+            self._log(DEBUG3, 'data: %s', type(data))
+            self._log(DEBUG3, 'data.encode(): %s', type(data.encode()))
 
         url = self.uri
         if self.use_get:
             url += '?' + data
+            body = None
             request = Request(url)
         else:
             # data must by type 'bytes' for 3.x
-            request = Request(url, data.encode())
+            body = data.encode()
+            request = Request(url, body)
+        if self.compress:
+            request.add_header('Accept-Encoding',
+                               pan.compress.accept_encoding)
 
         self._log(DEBUG1, 'URL: %s', url)
         self._log(DEBUG1, 'method: %s', request.get_method())
         self._log(DEBUG1, 'data: %s', data)
+        if self.metrics is not None and self._request_metrics is not None:
+            self._request_metrics.request_bytes = len(data)
+
+        if self.replay is not None:
+            return self.__replay_request(query)
+
+        if self.pool is not None:
+            return self.__pool_request(query, request.get_method(), url,
+                                       body)
 
         kwargs = {
             'url': request,
@@ -491,11 +896,7 @@ class PanXapi:
         if (sys.version_info.major == 2 and sys.hexversion >= 0x02070900 or
                 sys.version_info.major == 3 and sys.hexversion >= 0x03040300):
             # see PEP 476; urlopen() has context
-            if self.ssl_context is None:
-                # don't perform certificate verification
-                kwargs['context'] = ssl._create_unverified_context()
-            else:
-                kwargs['context'] = self.ssl_context
+            kwargs['context'] = self._get_ssl_context()
         elif self.ssl_context is not None:
             https_handler = HTTPSHandler(context=self.ssl_context)
             opener = build_opener(https_handler)
@@ -507,27 +908,309 @@ class PanXapi:
         try:
             response = urlopen(**kwargs)
 
-        # XXX handle httplib.BadStatusLine when http to port 443
         except URLError as error:
-            msg = 'URLError:'
-            if hasattr(error, 'code'):
-                msg += ' code: %s' % error.code
-            if hasattr(error, 'reason'):
-                msg += ' reason: %s' % error.reason
-            if not (hasattr(error, 'code') or hasattr(error, 'reason')):
-                msg += ' unknown error (Kevin heart Python)'
-            self.status_detail = msg
+            self._http_code = getattr(error, 'code', None)
+            self.status_detail = self._urlerror_msg(error)
+            if self.recorder is not None and self._http_code is not None:
+                # HTTPError is also the response
+                self._record(query, error).read()
+            return False
+        # timeout waiting for the response, connection reset,
+        # httplib.BadStatusLine when http to port 443; the same as
+        # pan.pool
+        except (socket.timeout, socket.error, HTTPException) as error:
+            self.status_detail = self._urlerror_msg(URLError(error))
+            return False
+
+        response = self._record(query, response)
+
+        self._log(DEBUG2, 'HTTP response headers:')
+        self._log(DEBUG2, '%s', response.info())
+
+        return self._decoded_response(response)
+
+    def __pool_request(self, query, method, url, body):
+        headers = {}
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.compress:
+            headers['Accept-Encoding'] = pan.compress.accept_encoding
+
+        context = None
+        if url.startswith('https:'):
+            context = self._get_ssl_context()
+
+        try:
+            response = self.pool.request(method, url, body, headers,
+                                         timeout=self.timeout,
+                                         context=context)
+        except URLError as error:
+            self.status_detail = self._urlerror_msg(error)
             return False
+        except pan.pool.PanConnectionPoolError as msg:
+            self.status_detail = str(msg)
+            return False
+
+        return self.__response(self._record(query, response))
 
+    def __replay_request(self, query):
+        try:
+            response = self.replay.response('xapi', self.hostname, query)
+        except pan.replay.PanReplayError as msg:
+            self.status_detail = str(msg)
+            return False
+
+        return self.__response(response)
+
+    def __response(self, response):
+        # pool and replay response
         self._log(DEBUG2, 'HTTP response headers:')
         self._log(DEBUG2, '%s', response.info())
 
-        return response
+        if not (200 <= response.status < 300):
+            # same as urlopen() HTTPError
+            response.read()
+            self._http_code = response.status
+            self.status_detail = 'URLError: code: %s reason: %s' % \
+                (response.status, response.reason)
+            return False
+
+        return self._decoded_response(response)
+
+    def _record(self, query, response):
+        if self.recorder is None:
+            return response
+        return self.recorder.record('xapi', self.hostname, query, response)
+
+    def _decoded_response(self, response):
+        # The message body read from the returned response is
+        # decompressed as it is read; also used by
+        # pan.aioxapi.AsyncPanXapi.
+        encoding = pan.compress.content_encoding(response)
+        try:
+            return pan.compress.PanDecodedResponse(
+                response, encoding, pan.compress.default_stats,
+                self.hostname)
+        except pan.compress.PanCompressError as msg:
+            response.close()
+            self._http_code = response.getcode()
+            self.status_detail = str(msg)
+            return False
+
+    def _get_ssl_context(self):
+        if self.ssl_context is not None:
+            return self.ssl_context
+
+        return _default_ssl_context()
+
+    @staticmethod
+    def _urlerror_msg(error):
+        msg = 'URLError:'
+        if hasattr(error, 'code'):
+            msg += ' code: %s' % error.code
+        if hasattr(error, 'reason'):
+            msg += ' reason: %s' % error.reason
+        if not (hasattr(error, 'code') or hasattr(error, 'reason')):
+            msg += ' unknown error (Kevin heart Python)'
+
+        return msg
+
+    def __request(self, query):
+        try:
+            self.__request_once(query)
+        except PanXapiError:
+            if not self._key_auth_failed(query):
+                raise
+            self.__set_api_key()
+            query['key'] = self.api_key
+            self.__request_once(query)
+
+    def __request_once(self, query):
+        attempt = 0
+        while True:
+            if not self._breaker_allow():
+                raise PanXapiError(self.status_detail)
+            self._http_code = None
+            key = self._governor_key()
+            self.governor.acquire(key)
+            self._metrics_start(query)
+            start = time.time()
+            response = None
+            try:
+                response = self.__api_request(query)
+            finally:
+                self.governor.release(key, time.time() - start)
+                if response is None:
+                    self._breaker_abort()
+            self._metrics_response(response)
+            delay = self._retry_delay(query, response, attempt)
+            if delay is None:
+                break
+            self._metrics_finish(response)
+            time.sleep(delay)
+            attempt += 1
+
+        self._set_response_metrics(response)
+
+    # The _governor_key(), _breaker_*(), _retry_delay() and
+    # _metrics_*() methods are shared with pan.aioxapi.AsyncPanXapi.
+
+    def _governor_key(self):
+        return self.hostname, self.serial
+
+    def _metrics_start(self, query):
+        if self.metrics is None:
+            return
+        self._request_metrics = pan.metrics.PanRequestMetrics(
+            'xapi', self.hostname, query.get('type'), query.get('action'))
+
+    def _metrics_response(self, response):
+        # response headers received
+        x = self._request_metrics
+        if self.metrics is None or x is None:
+            return
+        x.mark('wait')
+        timings = getattr(response, 'timings', None) if response else None
+        if timings:
+            # pan.pool: wait excludes connect and TLS handshake
+            for k in ['connect', 'tls', 'wait', 'reused']:
+                setattr(x, k, timings.get(k))
+
+    def _metrics_mark(self, phase):
+        x = self._request_metrics
+        if self.metrics is not None and x is not None:
+            x.mark(phase)
+
+    def _metrics_finish(self, response, error=None):
+        x = self._request_metrics
+        if self.metrics is None or x is None or x.total is not None:
+            return
+        x.mark('download' if x.download is None else 'parse')
+        x.finish()
+        x.http_code = (self._http_code if not response else
+                       response.getcode())
+        x.status = self.status
+        if error is not None:
+            x.error = error
+        elif not response:
+            x.error = self.__dict__.get('status_detail')
+        if response:
+            x.response_bytes = getattr(response, 'wire', None)
+            x.decoded_bytes = getattr(response, 'decoded', None)
+        self.metrics.record(x)
+
+    def _set_response_metrics(self, response):
+        try:
+            if not response:
+                raise PanXapiError(self.status_detail)
+            self._set_response(response)
+        except PanXapiError as msg:
+            self._metrics_finish(response, str(msg))
+            raise
+        self._metrics_finish(response)
+
+    def _breaker_allow(self):
+        if self.breaker is None or self.breaker.allow(self.uri):
+            return True
+
+        self.status_detail = 'circuit open for %s: retry in %.1f seconds' % \
+            (self.uri, self.breaker.retry_after(self.uri))
+        return False
+
+    def _breaker_abort(self):
+        # exception during the request: a half-open trial request
+        # must not leave the circuit open
+        if self.breaker is not None:
+            self.breaker.abort(self.uri)
+
+    def _retry_delay(self, query, response, attempt):
+        # Record the request result in the circuit breaker, and
+        # return the number of seconds to wait before retrying the
+        # request, or None.
+        if response:
+            if self.breaker is not None:
+                self.breaker.success(self.uri)
+            return None
+
+        transient = pan.retry.PanRetry.transient(self._http_code)
+        if self.breaker is not None:
+            if transient:
+                self.breaker.failure(self.uri)
+            else:
+                # the host responded
+                self.breaker.success(self.uri)
+
+        if (self.retry is None or not transient or
+                attempt >= self.retry.retries or
+                not pan.retry.PanRetry.idempotent(query)):
+            return None
+
+        delay = self.retry.delay(attempt)
+        self._log(DEBUG1, 'retry %d of %d in %.2f seconds: %s',
+                  attempt + 1, self.retry.retries, delay,
+                  self.status_detail)
+
+        return delay
+
+    def _set_response(self, response):
+        if not self.__set_response(response):
+            raise PanXapiError(self.status_detail)
 
     def __set_api_key(self):
         if self.api_key is None:
+            if self._key_cache_get():
+                return
             self.keygen()
             self._log(DEBUG1, 'autoset api_key: "%s"', self.api_key)
+            self._key_cache_put()
+
+    # The _key_cache_*() methods are shared with
+    # pan.aioxapi.AsyncPanXapi.
+
+    def _key_cache_get(self):
+        if self.key_cache is None or self.api_username is None:
+            return False
+        api_key = self.key_cache.get(self.hostname, self.api_username,
+                                     self.serial)
+        if api_key is None:
+            return False
+
+        self.api_key = api_key
+        self._key_cached = True
+        self._log(DEBUG1, 'cached api_key: "%s"', self.api_key)
+
+        return True
+
+    def _key_cache_put(self):
+        if self.key_cache is None or self.api_username is None:
+            return
+        try:
+            self.key_cache.put(self.hostname, self.api_username,
+                               self.serial, self.api_key)
+        except pan.keycache.PanKeyCacheError as msg:
+            # the request does not fail
+            self._log(DEBUG1, 'key cache: %s', msg)
+
+    def _key_auth_failed(self, query):
+        # True when a request with a cached api_key failed
+        # authentication; the key is removed so the request can be
+        # retried after keygen
+        if not self._key_cached or query.get('key') is None:
+            return False
+        if self._http_code != 403 and self.status_code != '403':
+            return False
+
+        self._log(DEBUG1, 'cached api_key failed authentication: %s',
+                  self.status_detail)
+        self._key_cached = False
+        self.api_key = None
+        try:
+            self.key_cache.delete(self.hostname, self.api_username,
+                                  self.serial)
+        except pan.keycache.PanKeyCacheError as msg:
+            self._log(DEBUG1, 'key cache: %s', msg)
+
+        return True
 
     def cmd_xml(self, cmd):
         def _cmd_xml(args, obj):
@@ -560,9 +1243,18 @@ class PanXapi:
 
         return xml
 
+    # The _*_query() methods build the API request query and are
+    # shared with pan.aioxapi.AsyncPanXapi.
+
     def keygen(self, extra_qs=None):
-        self.__clear_response()
+        self._clear_response()
 
+        query = self._keygen_query(extra_qs)
+        self.__request(query)
+
+        return self._keygen_result()
+
+    def _keygen_query(self, extra_qs=None):
         if (self.api_username is None or
                 self.api_password is None):
             raise PanXapiError('api_username and api_password ' +
@@ -578,13 +1270,9 @@ class PanXapi:
         if extra_qs is not None:
             query = self.__merge_extra_qs(query, extra_qs)
 
-        response = self.__api_request(query)
-        if not response:
-            raise PanXapiError(self.status_detail)
-
-        if not self.__set_response(response):
-            raise PanXapiError(self.status_detail)
+        return query
 
+    def _keygen_result(self):
         if self.element_result is None:
             raise PanXapiError('keygen(): result element not found')
         element = self.element_result.find('key')
@@ -631,8 +1319,12 @@ class PanXapi:
 
     def ad_hoc(self, qs=None, xpath=None, modify_qs=False):
         self.__set_api_key()
-        self.__clear_response()
+        self._clear_response()
+
+        query = self._ad_hoc_query(qs, xpath, modify_qs)
+        self.__request(query)
 
+    def _ad_hoc_query(self, qs=None, xpath=None, modify_qs=False):
         query = {}
         if qs is not None:
             query = self.__qs_to_dict(qs)
@@ -653,88 +1345,121 @@ class PanXapi:
 
         self._log(DEBUG1, '%s', query)
 
-        response = self.__api_request(query)
-        if not response:
-            raise PanXapiError(self.status_detail)
-
-        if not self.__set_response(response):
-            raise PanXapiError(self.status_detail)
+        return query
 
     def show(self, xpath=None, extra_qs=None):
-        query = {}
-        if xpath is not None:
-            query['xpath'] = xpath
+        query = self._config_args(xpath=xpath)
         self.__type_config('show', query, extra_qs)
 
     def get(self, xpath=None, extra_qs=None):
-        query = {}
-        if xpath is not None:
-            query['xpath'] = xpath
+        query = self._config_args(xpath=xpath)
         self.__type_config('get', query, extra_qs)
 
     def delete(self, xpath=None, extra_qs=None):
-        query = {}
-        if xpath is not None:
-            query['xpath'] = xpath
+        query = self._config_args(xpath=xpath)
         self.__type_config('delete', query, extra_qs)
 
     def set(self, xpath=None, element=None, extra_qs=None):
-        query = {}
-        if xpath is not None:
-            query['xpath'] = xpath
-        if element is not None:
-            query['element'] = element
+        query = self._config_args(xpath=xpath, element=element)
         self.__type_config('set', query, extra_qs)
 
     def edit(self, xpath=None, element=None, extra_qs=None):
-        query = {}
-        if xpath is not None:
-            query['xpath'] = xpath
-        if element is not None:
-            query['element'] = element
+        query = self._config_args(xpath=xpath, element=element)
         self.__type_config('edit', query, extra_qs)
 
     def move(self, xpath=None, where=None, dst=None, extra_qs=None):
-        query = {}
-        if xpath is not None:
-            query['xpath'] = xpath
-        if where is not None:
-            query['where'] = where
-        if dst is not None:
-            query['dst'] = dst
+        query = self._config_args(xpath=xpath, where=where, dst=dst)
         self.__type_config('move', query, extra_qs)
 
     def rename(self, xpath=None, newname=None, extra_qs=None):
-        query = {}
-        if xpath is not None:
-            query['xpath'] = xpath
-        if newname is not None:
-            query['newname'] = newname
+        query = self._config_args(xpath=xpath, newname=newname)
         self.__type_config('rename', query, extra_qs)
 
     def clone(self, xpath=None, xpath_from=None, newname=None,
               extra_qs=None):
-        query = {}
-        if xpath is not None:
-            query['xpath'] = xpath
-        if xpath_from is not None:
-            query['from'] = xpath_from
-        if newname is not None:
-            query['newname'] = newname
+        query = self._config_args(xpath=xpath, xpath_from=xpath_from,
+                                  newname=newname)
         self.__type_config('clone', query, extra_qs)
 
     def override(self, xpath=None, element=None, extra_qs=None):
+        query = self._config_args(xpath=xpath, element=element)
+        self.__type_config('override', query, extra_qs)
+
+    def multi_config(self, element=None, extra_qs=None):
+        query = self._config_args(element=element)
+        self.__type_config('multi-config', query, extra_qs)
+
+    def batch(self, max_actions=None, max_size=None):
+        # collect config actions and perform them using multi-config
+        return pan.batch.PanConfigBatch(self, max_actions, max_size)
+
+    @staticmethod
+    def _config_args(xpath=None, element=None, where=None, dst=None,
+                     newname=None, xpath_from=None):
         query = {}
         if xpath is not None:
             query['xpath'] = xpath
         if element is not None:
             query['element'] = element
-        self.__type_config('override', query, extra_qs)
+        if where is not None:
+            query['where'] = where
+        if dst is not None:
+            query['dst'] = dst
+        if xpath_from is not None:
+            query['from'] = xpath_from
+        if newname is not None:
+            query['newname'] = newname
+
+        return query
 
     def __type_config(self, action, query, extra_qs=None):
+        self._clear_response()
+        if self._cache_get(action, query, extra_qs):
+            return
         self.__set_api_key()
-        self.__clear_response()
 
+        self._cache_invalidate(action, query)
+        query = self._config_query(action, query, extra_qs)
+        self.__request(query)
+        self._cache_put(action, query, extra_qs)
+
+    def _cache_key(self, action, query):
+        return pan.cache.PanXapiCache.key(self.hostname, self.serial,
+                                          action, query.get('xpath'))
+
+    def _cache_get(self, action, query, extra_qs):
+        # set the response from the cache; return True on a hit
+        if (self.cache is None or action not in _cache_actions or
+                extra_qs is not None):
+            return False
+        body = self.cache.get(self._cache_key(action, query))
+        if body is None:
+            return False
+
+        return self.__set_xml_response(body)
+
+    def _cache_put(self, action, query, extra_qs):
+        if (self.cache is None or action not in _cache_actions or
+                extra_qs is not None):
+            return
+        if self.status == 'success' and self.response is not None:
+            self.cache.put(self._cache_key(action, query),
+                           self.response.body)
+
+    def _cache_invalidate(self, action, query):
+        # configuration change; multi-config (no xpath) invalidates
+        # all entries for the device
+        if self.cache is None or action in _cache_actions:
+            return
+        self.cache.invalidate(self.hostname, self.serial,
+                              query.get('xpath'))
+
+    def _cache_flush(self, job=None):
+        # commit; also a pan.job.PanJob done callback
+        if self.cache is not None:
+            self.cache.flush(self.hostname, self.serial)
+
+    def _config_query(self, action, query, extra_qs=None):
         query['type'] = 'config'
         query['action'] = action
         query['key'] = self.api_key
@@ -743,17 +1468,16 @@ class PanXapi:
         if extra_qs is not None:
             query = self.__merge_extra_qs(query, extra_qs)
 
-        response = self.__api_request(query)
-        if not response:
-            raise PanXapiError(self.status_detail)
-
-        if not self.__set_response(response):
-            raise PanXapiError(self.status_detail)
+        return query
 
     def user_id(self, cmd=None, vsys=None, extra_qs=None):
         self.__set_api_key()
-        self.__clear_response()
+        self._clear_response()
+
+        query = self._user_id_query(cmd, vsys, extra_qs)
+        self.__request(query)
 
+    def _user_id_query(self, cmd=None, vsys=None, extra_qs=None):
         query = {}
         query['type'] = 'user-id'
         query['key'] = self.api_key
@@ -766,18 +1490,66 @@ class PanXapi:
         if extra_qs is not None:
             query = self.__merge_extra_qs(query, extra_qs)
 
-        response = self.__api_request(query)
-        if not response:
-            raise PanXapiError(self.status_detail)
+        return query
 
-        if not self.__set_response(response):
-            raise PanXapiError(self.status_detail)
+    def user_id_queue(self, max_entries=None, max_delay=None, vsys=None,
+                      callback=None):
+        # coalesce User-ID updates and send them using user_id()
+        return pan.userid.PanUserIdQueue(self, max_entries, max_delay,
+                                         vsys, callback)
+
+    def _user_id_entries(self):
+        # type=user-id per-entry response: [(action, Element), ...]
+        entries = []
+        if self.element_root is None:
+            return entries
+
+        path = './msg/line/uid-response/payload/*'
+        for action in self.element_root.findall(path):
+            for entry in action.findall('entry'):
+                entries.append((action.tag, entry))
+        if entries:
+            self._log(DEBUG2, 'path: %s %s', path, entries)
+
+        return entries
 
     def commit(self, cmd=None, action=None, sync=False,
                interval=None, timeout=None, extra_qs=None):
         self.__set_api_key()
-        self.__clear_response()
+        self._clear_response()
+
+        interval, timeout = self._job_args(interval, timeout)
+
+        query = self._commit_query(cmd, action, extra_qs)
+        self._cache_flush()
+        self.__request(query)
+
+        # pan.job.PanJob handle, None when no job (no changes)
+        handle = self._commit_handle()
+        if sync is not True or handle is None:
+            return handle
+
+        job = handle.id
+        cmd = self._job_cmd(job)
+        poller = self._job_poller('commit', interval)
+
+        while True:
+            # sleep at the top of the loop so we don't poll
+            # immediately after commit
+            self.__job_sleep(poller)
+
+            try:
+                self.op(cmd=cmd, cmd_xml=True)
+            except PanXapiError as msg:
+                raise PanXapiError('commit %s: %s' % (cmd, msg))
 
+            if self._commit_job_done(job, cmd, poller, timeout):
+                handle.update(self.element_root.find('./result/job'))
+                return handle
+
+    @staticmethod
+    def _job_args(interval=None, timeout=None):
+        # interval None: use the poll strategy
         if interval is not None:
             try:
                 interval = float(interval)
@@ -785,8 +1557,6 @@ class PanXapi:
                     raise ValueError
             except ValueError:
                 raise PanXapiError('Invalid interval: %s' % interval)
-        else:
-            interval = _job_query_interval
 
         if timeout is not None:
             try:
@@ -796,6 +1566,9 @@ class PanXapi:
             except ValueError:
                 raise PanXapiError('Invalid timeout: %s' % timeout)
 
+        return interval, timeout
+
+    def _commit_query(self, cmd=None, action=None, extra_qs=None):
         query = {}
         query['type'] = 'commit'
         query['key'] = self.api_key
@@ -808,51 +1581,81 @@ class PanXapi:
         if extra_qs is not None:
             query = self.__merge_extra_qs(query, extra_qs)
 
-        response = self.__api_request(query)
-        if not response:
-            raise PanXapiError(self.status_detail)
-
-        if not self.__set_response(response):
-            raise PanXapiError(self.status_detail)
-
-        if sync is not True:
-            return
+        return query
 
+    def _commit_job(self):
         job = self.element_root.find('./result/job')
         if job is None:
-            return
+            return None
 
         self._log(DEBUG2, 'commit job: %s', job.text)
 
-        cmd = 'show jobs id "%s"' % job.text
-        start_time = time.time()
+        return job.text
 
-        while True:
-            # sleep at the top of the loop so we don't poll
-            # immediately after commit
-            self._log(DEBUG2, 'sleep %.2f seconds', interval)
-            time.sleep(interval)
+    def _commit_handle(self):
+        job = self._commit_job()
+        if job is None:
+            return None
 
-            try:
-                self.op(cmd=cmd, cmd_xml=True)
-            except PanXapiError as msg:
-                raise PanXapiError('commit %s: %s' % (cmd, msg))
+        handle = pan.job.PanJob(job, 'commit', self)
+        if self.cache is not None:
+            # entries cached while the commit was running are stale
+            handle.add_done_callback(self._cache_flush)
 
-            path = './result/job/status'
-            status = self.element_root.find(path)
-            if status is None:
-                raise PanXapiError('no status element in ' +
-                                   "'%s' response" % cmd)
-            if status.text == 'FIN':
-                # XXX commit vs. commit-all job status
-                return
+        return handle
 
-            self._log(DEBUG2, 'job %s status %s', job.text, status.text)
+    @staticmethod
+    def _job_cmd(job):
+        return 'show jobs id "%s"' % job
+
+    def _commit_job_done(self, job, cmd, poller, timeout):
+        path = './result/job/status'
+        status = self.element_root.find(path)
+        if status is None:
+            raise PanXapiError('no status element in ' +
+                               "'%s' response" % cmd)
+        if status.text == 'FIN':
+            # XXX commit vs. commit-all job status
+            poller.done()
+            return True
+
+        self._log(DEBUG2, 'job %s status %s', job, status.text)
+
+        poller.update(self._job_progress())
+        self._job_timeout(job, poller.start_time, timeout)
 
-            if (timeout is not None and timeout != 0 and
-                    time.time() > start_time + timeout):
-                raise PanXapiError('timeout waiting for ' +
-                                   'job %s completion' % job.text)
+        return False
+
+    def _job_poller(self, job_type, interval=None):
+        # an explicit interval uses a fixed interval; statistics are
+        # still recorded
+        strategy = self.poll
+        if interval is not None:
+            strategy = pan.poll.PanPollFixed(interval,
+                                             stats=self.poll.stats)
+
+        return strategy.poller((self.hostname, self.serial), job_type)
+
+    def __job_sleep(self, poller):
+        interval = poller.next_interval()
+        self._log(DEBUG2, 'sleep %.2f seconds', interval)
+        time.sleep(interval)
+
+    def _job_progress(self):
+        progress = self.element_root.find('./result/job/progress')
+        if progress is None or progress.text is None:
+            return None
+        try:
+            return int(progress.text)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _job_timeout(job, start_time, timeout):
+        if (timeout is not None and timeout != 0 and
+                time.time() > start_time + timeout):
+            raise PanXapiError('timeout waiting for ' +
+                               'job %s completion' % job)
 
     def op(self, cmd=None, vsys=None, cmd_xml=False, extra_qs=None):
         if cmd is not None and cmd_xml:
@@ -861,8 +1664,12 @@ class PanXapi:
 
     def __type_op(self, cmd, vsys, extra_qs=None):
         self.__set_api_key()
-        self.__clear_response()
+        self._clear_response()
 
+        query = self._op_query(cmd, vsys, extra_qs)
+        self.__request(query)
+
+    def _op_query(self, cmd=None, vsys=None, extra_qs=None):
         query = {}
         query['type'] = 'op'
         if cmd is not None:
@@ -875,12 +1682,7 @@ class PanXapi:
         if extra_qs is not None:
             query = self.__merge_extra_qs(query, extra_qs)
 
-        response = self.__api_request(query)
-        if not response:
-            raise PanXapiError(self.status_detail)
-
-        if not self.__set_response(response):
-            raise PanXapiError(self.status_detail)
+        return query
 
     @staticmethod
     def pcapid_time(pcapid):
@@ -900,10 +1702,25 @@ class PanXapi:
 
     def export(self, category=None, from_name=None, to_name=None,
                pcapid=None, search_time=None, serialno=None,
-               extra_qs=None):
+               extra_qs=None, file=None):
         self.__set_api_key()
-        self.__clear_response()
+        self._clear_response()
 
+        query = self._export_query(category, from_name, to_name,
+                                   pcapid, search_time, serialno,
+                                   extra_qs)
+        self._export_file = file
+        try:
+            self.__request(query)
+        finally:
+            self._export_file = None
+
+        if self.export_result:
+            self.export_result['category'] = category
+
+    def _export_query(self, category=None, from_name=None, to_name=None,
+                      pcapid=None, search_time=None, serialno=None,
+                      extra_qs=None):
         query = {}
         query['type'] = 'export'
         query['key'] = self.api_key
@@ -933,39 +1750,131 @@ class PanXapi:
         if extra_qs is not None:
             query = self.__merge_extra_qs(query, extra_qs)
 
-        response = self.__api_request(query)
-        if not response:
-            raise PanXapiError(self.status_detail)
-
-        if not self.__set_response(response):
-            raise PanXapiError(self.status_detail)
-
-        if self.export_result:
-            self.export_result['category'] = category
+        return query
 
     def log(self, log_type=None, nlogs=None, skip=None, filter=None,
             interval=None, timeout=None, extra_qs=None):
         self.__set_api_key()
-        self.__clear_response()
+        self._clear_response()
+
+        interval, timeout = self._job_args(interval, timeout)
+
+        query = self._log_query(log_type, nlogs, skip, filter, extra_qs)
+        self.__request(query)
+
+        job = self._log_job()
+        self.__log_job_wait(job, interval, timeout)
+
+    def __log_job_wait(self, job, interval, timeout):
+        query = self._log_get_query(job)
+        poller = self._job_poller('log', interval)
+
+        while True:
+            self.__request(query)
+
+            if self._log_job_done(job, poller, timeout):
+                return
+
+            self.__job_sleep(poller)
+
+    def iter_logs(self, log_type=None, filter=None, page_size=None,
+                  max_logs=None, interval=None, timeout=None,
+                  extra_qs=None):
+        # Generator which returns log entry elements using a type=log
+        # job for each page of page_size logs.  The job for the next
+        # page is submitted before the entries of the current page
+        # are returned, so the device retrieves the next page while
+        # the current one is processed.
+        self.__set_api_key()
 
-        if interval is None:
-            interval = _job_query_interval
+        interval, timeout = self._job_args(interval, timeout)
+        page_size, max_logs = self._log_page_args(page_size, max_logs)
+
+        requested = 0
+        nlogs = self._log_page_nlogs(page_size, max_logs, requested)
+        job = self.__log_page_job(log_type, nlogs, requested,
+                                  filter, extra_qs)
+        requested += nlogs
+
+        while job is not None:
+            entries = self.__log_page_entries(job, interval, timeout)
+            self._log(DEBUG1, 'log job %s: %d entries', job, len(entries))
+
+            job = None
+            if len(entries) == nlogs:
+                # not the last page
+                nlogs = self._log_page_nlogs(page_size, max_logs,
+                                             requested)
+                if nlogs:
+                    job = self.__log_page_job(log_type, nlogs, requested,
+                                              filter, extra_qs)
+                    requested += nlogs
+
+            # release entries as they are returned
+            entries.reverse()
+            while entries:
+                yield entries.pop()
 
+    @staticmethod
+    def _log_page_args(page_size, max_logs):
+        if page_size is None:
+            page_size = _log_page_size
         try:
-            interval = float(interval)
-            if interval < 0:
+            page_size = int(page_size)
+            if page_size < 1:
                 raise ValueError
         except ValueError:
-            raise PanXapiError('Invalid interval: %s' % interval)
+            raise PanXapiError('Invalid page_size: %s' % page_size)
 
-        if timeout is not None:
+        if max_logs is not None:
             try:
-                timeout = int(timeout)
-                if timeout < 0:
+                max_logs = int(max_logs)
+                if max_logs < 1:
                     raise ValueError
             except ValueError:
-                raise PanXapiError('Invalid timeout: %s' % timeout)
+                raise PanXapiError('Invalid max_logs: %s' % max_logs)
+
+        return page_size, max_logs
+
+    @staticmethod
+    def _log_page_nlogs(page_size, max_logs, requested):
+        if max_logs is None:
+            return page_size
+        return max(min(page_size, max_logs - requested), 0)
+
+    def __log_page_job(self, log_type, nlogs, skip, filter, extra_qs):
+        self._clear_response()
+        query = self._log_query(log_type, nlogs, skip or None, filter,
+                                extra_qs)
+        self.__request_tree(query)
+
+        return self._log_job()
+
+    def __log_page_entries(self, job, interval, timeout):
+        self._clear_response()
+        iterparse = self.iterparse
+        self.iterparse = None
+        try:
+            self.__log_job_wait(job, interval, timeout)
+        finally:
+            self.iterparse = iterparse
+
+        return self._log_entries()
+
+    def __request_tree(self, query):
+        # parse entire response when iterparse is set
+        iterparse = self.iterparse
+        self.iterparse = None
+        try:
+            self.__request(query)
+        finally:
+            self.iterparse = iterparse
+
+    def _log_entries(self):
+        return self.element_root.findall('./result/log/logs/entry')
 
+    def _log_query(self, log_type=None, nlogs=None, skip=None,
+                   filter=None, extra_qs=None):
         query = {}
         query['type'] = 'log'
         query['key'] = self.api_key
@@ -980,50 +1889,41 @@ class PanXapi:
         if extra_qs is not None:
             query = self.__merge_extra_qs(query, extra_qs)
 
-        response = self.__api_request(query)
-        if not response:
-            raise PanXapiError(self.status_detail)
-
-        if not self.__set_response(response):
-            raise PanXapiError(self.status_detail)
+        return query
 
+    def _log_job(self):
         job = self.element_root.find('./result/job')
         if job is None:
             raise PanXapiError('no job element in type=log response')
 
+        self._log(DEBUG2, 'log job: %s', job.text)
+
+        return job.text
+
+    def _log_get_query(self, job):
         query = {}
         query['type'] = 'log'
         query['action'] = 'get'
         query['key'] = self.api_key
-        query['job-id'] = job.text
-        self._log(DEBUG2, 'log job: %s', job.text)
+        query['job-id'] = job
 
-        start_time = time.time()
+        return query
 
-        while True:
-            response = self.__api_request(query)
-            if not response:
-                raise PanXapiError(self.status_detail)
-
-            if not self.__set_response(response):
-                raise PanXapiError(self.status_detail)
-
-            status = self.element_root.find('./result/job/status')
-            if status is None:
-                raise PanXapiError('no status element in ' +
-                                   'type=log&action=get response')
-            if status.text == 'FIN':
-                return
+    def _log_job_done(self, job, poller, timeout):
+        status = self.element_root.find('./result/job/status')
+        if status is None:
+            raise PanXapiError('no status element in ' +
+                               'type=log&action=get response')
+        if status.text == 'FIN':
+            poller.done()
+            return True
 
-            self._log(DEBUG2, 'job %s status %s', job.text, status.text)
+        self._log(DEBUG2, 'job %s status %s', job, status.text)
 
-            if (timeout is not None and timeout != 0 and
-                    time.time() > start_time + timeout):
-                raise PanXapiError('timeout waiting for ' +
-                                   'job %s completion' % job.text)
+        poller.update(self._job_progress())
+        self._job_timeout(job, poller.start_time, timeout)
 
-            self._log(DEBUG2, 'sleep %.2f seconds', interval)
-            time.sleep(interval)
+        return False
 
 if __name__ == '__main__':
     # python -m pan.xapi [tag] [xpath]
@@ -51,6 +51,6 @@ setup(name='pan-python',
       ],
 
       package_dir={'': 'lib'},
-      packages=['pan'],
+      packages=['pan', 'pan.testing'],
       scripts=['bin/panxapi.py', 'bin/panconf.py', 'bin/panwfapi.py']
       )